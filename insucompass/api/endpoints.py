@@ -1,5 +1,6 @@
+import hmac
 import logging
-from fastapi import APIRouter, HTTPException, Body
+from fastapi import APIRouter, HTTPException, Body, Header, Depends
 from typing import Dict, Any
 
 # Import our services, agents, and models
@@ -8,7 +9,11 @@ from insucompass.core.models import GeoDataResponse, ChatRequest, ChatResponse
 from insucompass.core.agents.profile_agent import profile_builder
 from insucompass.core.agent_orchestrator import app as orchestrator # The compiled LangGraph app
 
-from insucompass.services.database import get_db_connection, create_or_update_user_profile, get_user_profile
+from insucompass.services.database import get_db_connection, create_or_update_user_profile, get_user_profile, get_running_reembed_jobs
+from insucompass.services.metrics import metrics
+from insucompass.services.vector_store import vector_store_service
+from insucompass.services import kb_versions
+from insucompass.config import settings
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -31,6 +36,57 @@ def get_geolocation_data(zip_code: str):
         city=geo_data.city, state=geo_data.state, state_abbreviation=geo_data.state_abbr
     )
 
+@router.get("/metrics")
+def get_metrics() -> Dict[str, Any]:
+    """Returns this worker's in-process metrics, including rerank latency and grader pass rates."""
+    snapshot = metrics.snapshot()
+    grader_pass_rate = {}
+    for label in ("reranked", "not_reranked"):
+        total = metrics.get_counter(f"grader.total.{label}")
+        passed = metrics.get_counter(f"grader.pass.{label}")
+        grader_pass_rate[label] = round(passed / total, 4) if total else None
+    snapshot["grader_pass_rate"] = grader_pass_rate
+    return snapshot
+
+def require_admin_key(x_admin_key: str = Header(default="")):
+    """Guards admin endpoints with ADMIN_API_KEY. They are disabled until a key is configured."""
+    if not settings.ADMIN_API_KEY:
+        raise HTTPException(status_code=503, detail="Admin endpoints are disabled: ADMIN_API_KEY is not configured.")
+    if not hmac.compare_digest(x_admin_key.encode('utf-8'), settings.ADMIN_API_KEY.encode('utf-8')):
+        raise HTTPException(status_code=403, detail="Invalid admin key.")
+
+@router.get("/admin/kb/versions", dependencies=[Depends(require_admin_key)])
+def list_kb_versions() -> Dict[str, Any]:
+    """Lists knowledge base versions, which one this worker is serving (and its embedding model) and running re-embed jobs."""
+    return {
+        "serving": vector_store_service.active_version,
+        "embedding_model": vector_store_service.embedding_model,
+        "pointer": kb_versions.read_active_version(),
+        "versions": kb_versions.list_versions(vector_store_service.client),
+        "reembed_jobs": get_running_reembed_jobs(),
+    }
+
+@router.post("/admin/kb/reload", dependencies=[Depends(require_admin_key)])
+def reload_kb_version() -> Dict[str, Any]:
+    """Makes this worker switch to the version named in the active version pointer."""
+    return {"serving": vector_store_service.reload()}
+
+@router.post("/admin/kb/activate", dependencies=[Depends(require_admin_key)])
+def activate_kb_version(version: str = Body(..., embed=True)) -> Dict[str, Any]:
+    """Promotes a version: rewrites the pointer atomically, then switches this worker. Other workers follow via file watch."""
+    if version not in kb_versions.list_versions(vector_store_service.client):
+        raise HTTPException(status_code=404, detail=f"Unknown knowledge base version '{version}'.")
+    try:
+        kb_versions.promote_version(version)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"serving": vector_store_service.reload()}
+
+@router.post("/admin/kb/gc", dependencies=[Depends(require_admin_key)])
+def garbage_collect_kb_versions() -> Dict[str, Any]:
+    """Deletes old knowledge base versions, keeping the active one and KB_VERSIONS_TO_KEEP recent ones."""
+    return {"deleted": kb_versions.garbage_collect(vector_store_service.client)}
+
 @router.post("/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
     """
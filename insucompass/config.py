@@ -34,6 +34,100 @@ class Settings(BaseSettings):
     GEMINI_MODEL_NAME: str = "gemini-2.5-flash" #"gemini-2.5-flash" # "gemini-2.0-flash"
     GEMINI_FAST_MODEL_NAME: str = "gemini-2.5-flash-lite-preview-06-17"
 
+    # Vector Store Settings
+    # "chroma" queries the persistent Chroma collection; "flat" queries a memory-mapped index built from it.
+    VECTOR_BACKEND: str = os.getenv("VECTOR_BACKEND", "chroma")
+    CHROMA_PATH: str = os.getenv("CHROMA_PATH", "data/vector_store")
+    KB_COLLECTION_NAME: str = os.getenv("KB_COLLECTION_NAME", "insucompass_kb")
+    # Pointer file naming the knowledge base version the API serves; rewritten atomically on promotion.
+    KB_ACTIVE_VERSION_FILE: str = os.getenv("KB_ACTIVE_VERSION_FILE", "data/kb_active_version.json")
+    KB_WATCH_INTERVAL_SECONDS: float = float(os.getenv("KB_WATCH_INTERVAL_SECONDS", 5))
+    KB_VERSIONS_TO_KEEP: int = int(os.getenv("KB_VERSIONS_TO_KEEP", 2))
+    # Required by the /admin endpoints (X-Admin-Key header); they answer 503 while it is empty.
+    ADMIN_API_KEY: str = os.getenv("ADMIN_API_KEY", "")
+    FLAT_INDEX_PATH: str = os.getenv("FLAT_INDEX_PATH", "data/flat_index")
+    FLAT_INDEX_QUANTIZATION: str = os.getenv("FLAT_INDEX_QUANTIZATION", "int8")
+    # Store only vectors, IDs and filterable fields in the vector store; chunk text and metadata are read from SQLite.
+    SLIM_VECTOR_STORE: bool = os.getenv("SLIM_VECTOR_STORE", "true").lower() == "true"
+    # Compression of knowledge_chunks.chunk_text: "none", "zstd" or "zlib".
+    CHUNK_TEXT_COMPRESSION: str = os.getenv("CHUNK_TEXT_COMPRESSION", "none")
+
+    # Embedding model new knowledge base versions are built with. Each version records its model on its
+    # collection and is queried with it; move an existing knowledge base to a new model with scripts/reembed.py.
+    EMBEDDING_MODEL_NAME: str = os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2")
+    # Re-embed job throttling: sources re-embedded per batch and the pause between batches.
+    REEMBED_BATCH_SOURCES: int = int(os.getenv("REEMBED_BATCH_SOURCES", 20))
+    REEMBED_PAUSE_SECONDS: float = float(os.getenv("REEMBED_PAUSE_SECONDS", 1.0))
+
+    # Shared embedding server (scripts/run_embedding_server.py). Leave the socket empty to load the model in-process.
+    EMBEDDING_SERVER_SOCKET: str = os.getenv("EMBEDDING_SERVER_SOCKET", "")
+    EMBEDDING_BATCH_WINDOW_MS: float = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", 5))
+    EMBEDDING_MAX_BATCH: int = int(os.getenv("EMBEDDING_MAX_BATCH", 256))
+    # Reuse vectors of previously embedded chunk texts from the embedding_cache table.
+    EMBEDDING_CACHE_ENABLED: bool = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+    # Processes encoding document embeddings during bulk ingestion (run_ingestion.py). 0 or 1 encodes in-process.
+    EMBEDDING_WORKERS: int = int(os.getenv("EMBEDDING_WORKERS", 0))
+    # Padded tokens per encode batch in the bulk pool; batches of short chunks grow up to EMBEDDING_MAX_BATCH.
+    EMBEDDING_BATCH_TOKENS: int = int(os.getenv("EMBEDDING_BATCH_TOKENS", 16384))
+
+    # Retrieval Settings
+    RETRIEVER_K: int = int(os.getenv("RETRIEVER_K", 5))
+    # Number of neighbouring chunks (n-w..n+w) pulled from SQLite around each retrieved chunk. 0 disables.
+    CONTEXT_EXPANSION_WINDOW: int = int(os.getenv("CONTEXT_EXPANSION_WINDOW", 1))
+
+    # Reranking Settings (optional second-stage cross-encoder)
+    RERANK_ENABLED: bool = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+    RERANK_MODEL_NAME: str = os.getenv("RERANK_MODEL_NAME", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+    RERANK_TOP_N: int = int(os.getenv("RERANK_TOP_N", 5))
+    RERANK_BUDGET_MS: int = int(os.getenv("RERANK_BUDGET_MS", 300))
+    RERANK_BATCH_SIZE: int = int(os.getenv("RERANK_BATCH_SIZE", 16))
+
+    # Ingestion Settings
+    # "token" packs structure-aware chunks measured in embedding-model tokens; "character" is the 1000/200 character splitter.
+    CHUNKER: str = os.getenv("CHUNKER", "token")
+    # Should be the embedding model's tokenizer. all-MiniLM-L6-v2 truncates input at 256 tokens including [CLS]/[SEP].
+    CHUNK_TOKENIZER: str = os.getenv("CHUNK_TOKENIZER", "sentence-transformers/all-MiniLM-L6-v2")
+    CHUNK_TOKENS: int = int(os.getenv("CHUNK_TOKENS", 250))
+    CHUNK_OVERLAP_TOKENS: int = int(os.getenv("CHUNK_OVERLAP_TOKENS", 32))
+    # Estimated Jaccard similarity at which a document or chunk is treated as a near-duplicate of one already ingested. 0 disables.
+    NEAR_DUPLICATE_THRESHOLD: float = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", 0.85))
+    # "lxml" extracts HTML text with lxml's C parser and falls back to BeautifulSoup on failure; "bs4" always uses BeautifulSoup.
+    HTML_EXTRACTOR: str = os.getenv("HTML_EXTRACTOR", "lxml")
+    # PDFs with more pages than this are extracted in page ranges spread across the ingestion worker pool.
+    PDF_PAGES_PER_TASK: int = int(os.getenv("PDF_PAGES_PER_TASK", 50))
+    # Keep extracted text of raw files in the parsed_texts table, keyed by content hash, so a file is parsed once.
+    PARSED_TEXT_CACHE_ENABLED: bool = os.getenv("PARSED_TEXT_CACHE_ENABLED", "true").lower() == "true"
+    # PDF text is cached in blocks of this many pages, read and written one block at a time.
+    PARSED_TEXT_PDF_BLOCK_PAGES: int = int(os.getenv("PARSED_TEXT_PDF_BLOCK_PAGES", 25))
+
+    # Crawler Settings
+    # "async" runs the requests_crawl jobs concurrently on the asyncio engine; "requests" crawls them one by one.
+    CRAWLER_ENGINE: str = os.getenv("CRAWLER_ENGINE", "async")
+    CRAWLER_RAW_DATA_DIR: str = os.getenv("CRAWLER_RAW_DATA_DIR", "data/raw")
+    # Pooled HTTP connections across all domains.
+    CRAWLER_MAX_CONNECTIONS: int = int(os.getenv("CRAWLER_MAX_CONNECTIONS", 32))
+    # Per-domain politeness defaults; a crawl job may override them with "max_concurrency" and "requests_per_second".
+    CRAWLER_DOMAIN_CONCURRENCY: int = int(os.getenv("CRAWLER_DOMAIN_CONCURRENCY", 4))
+    CRAWLER_DOMAIN_RATE: float = float(os.getenv("CRAWLER_DOMAIN_RATE", 2.0))  # requests per second, 0 = unlimited
+    CRAWLER_TIMEOUT_SECONDS: float = float(os.getenv("CRAWLER_TIMEOUT_SECONDS", 30))
+    # Downloads (crawled files, web search PDFs) larger than this are abandoned. 0 = unlimited.
+    MAX_DOWNLOAD_BYTES: int = int(os.getenv("MAX_DOWNLOAD_BYTES", 100 * 1024 * 1024))
+    # Persistent crawl frontier shared by crawler processes: URLs leased per dequeue by the requests and
+    # Selenium crawlers, how long a lease lasts before another process may take the URL over, and how
+    # many expired leases a URL gets before it is given up.
+    CRAWLER_FRONTIER_BATCH: int = int(os.getenv("CRAWLER_FRONTIER_BATCH", 8))
+    CRAWLER_FRONTIER_LEASE_SECONDS: float = float(os.getenv("CRAWLER_FRONTIER_LEASE_SECONDS", 600))
+    CRAWLER_FRONTIER_MAX_ATTEMPTS: int = int(os.getenv("CRAWLER_FRONTIER_MAX_ATTEMPTS", 3))
+    # Headless Chrome drivers shared by the selenium_crawl jobs. A page counts as rendered once the document
+    # is loaded and neither the DOM nor network requests changed for SELENIUM_DOM_QUIET_MS.
+    SELENIUM_POOL_SIZE: int = int(os.getenv("SELENIUM_POOL_SIZE", 3))
+    SELENIUM_DOM_QUIET_MS: int = int(os.getenv("SELENIUM_DOM_QUIET_MS", 500))
+    SELENIUM_READY_TIMEOUT_SECONDS: float = float(os.getenv("SELENIUM_READY_TIMEOUT_SECONDS", 20))
+    # Fetch selenium_crawl pages with plain HTTP first and only render those that need JavaScript in the browser:
+    # pages with scripts but fewer than SELENIUM_MIN_STATIC_TEXT characters of main text. A job can set "precheck": False.
+    SELENIUM_PRECHECK: bool = os.getenv("SELENIUM_PRECHECK", "true").lower() == "true"
+    SELENIUM_MIN_STATIC_TEXT: int = int(os.getenv("SELENIUM_MIN_STATIC_TEXT", 500))
+
     # CRAWLING JOBS CONFIGURATION
     CRAWLING_JOBS: List[dict] = [
         {
@@ -20,10 +20,12 @@ from insucompass.core.agents.advisor_agent import advisor
 from insucompass.services import llm_provider
 from insucompass.prompts.prompt_loader import load_prompt
 from insucompass.services.vector_store import vector_store_service
+from insucompass.services.reranker import reranker_service
+from insucompass.services.metrics import metrics
 
 llm = llm_provider.get_gemini_llm()
 retriever = vector_store_service.get_retriever()
-transformer = QueryTransformationAgent(llm, retriever)
+transformer = QueryTransformationAgent(llm, retriever, reranker=reranker_service)
 ingestor = IngestionService()
 
 # Configure logging
@@ -92,6 +94,12 @@ def retrieve_and_grade_node(state: AgentState) -> Dict[str, Any]:
     standalone_question = state["standalone_question"]
     documents = transformer.transform_and_retrieve(standalone_question)
     is_relevant = router.grade_documents(standalone_question, documents)
+
+    # Track grader pass rate separately for reranked and non-reranked retrievals
+    label = "reranked" if any("rerank_score" in d.metadata for d in documents) else "not_reranked"
+    metrics.increment(f"grader.total.{label}")
+    if is_relevant:
+        metrics.increment(f"grader.pass.{label}")
     return {"documents": documents, "is_relevant": is_relevant}
 
 def search_and_ingest_node(state: AgentState) -> Dict[str, Any]:
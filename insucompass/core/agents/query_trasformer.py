@@ -13,6 +13,9 @@ from insucompass.core.models import IntentType, TransformedQueries
 
 from insucompass.config import settings
 from insucompass.prompts.prompt_loader import load_prompt
+from insucompass.services.database import get_chunks_by_number
+from insucompass.services.kb_versions import db_version_for
+from insucompass.services.vector_store import vector_store_service
 
 # Configure logging
 logging.basicConfig(level=settings.LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -20,6 +23,20 @@ logger = logging.getLogger(__name__)
 
 QUERY_TRNSFORMER_PROMPT_TEMPLATE = load_prompt('query_transformer')
 
+# Separator placed between non-adjacent chunks of the same source when they are merged.
+CHUNK_SEPARATOR = "\n\n--- chunk ---\n\n"
+# Bounds on the chunker's overlap, used when stitching adjacent chunks together.
+# Shorter matches are treated as coincidence rather than overlap.
+MIN_CHUNK_OVERLAP_CHARS = 10
+MAX_CHUNK_OVERLAP_CHARS = 400
+
+def _strip_overlap(previous: str, following: str) -> str:
+    """Removes the prefix of `following` that repeats the tail of `previous`."""
+    for size in range(min(len(previous), len(following), MAX_CHUNK_OVERLAP_CHARS), MIN_CHUNK_OVERLAP_CHARS - 1, -1):
+        if previous.endswith(following[:size]):
+            return following[size:]
+    return following
+
 class QueryTransformationAgent:
     """
     An agent responsible for analyzing a user's query, applying an advanced
@@ -27,7 +44,7 @@ class QueryTransformationAgent:
     from a vector store.
     """
 
-    def __init__(self, llm, retriever):
+    def __init__(self, llm, retriever, reranker=None):
         """
         Initializes the QueryTransformationAgent.
 
@@ -35,12 +52,14 @@ class QueryTransformationAgent:
             llm: An instance of the language model to be used
                  for query analysis and transformation.
             retriever: A LangChain retriever runnable connected to the vector store.
+            reranker: An optional RerankerService applied to the fused documents.
         """
         if not llm or not retriever:
             raise ValueError("LLM and retriever must be provided.")
             
         self.llm = llm
         self.retriever = retriever
+        self.reranker = reranker
 
         # 1. Create the parser for the transformed queries
         self.parser = PydanticOutputParser(pydantic_object=TransformedQueries)
@@ -56,6 +75,55 @@ class QueryTransformationAgent:
         self.classifier = QueryIntentClassifierAgent(llm)
         logger.info("QueryTransformationAgent initialized successfully.")
 
+    def _expand_with_neighbors(self, doc_lists: List[List[Document]]) -> List[List[Document]]:
+        """
+        Expands each retrieved chunk into a window of its neighbouring chunks
+        (chunk_number +/- CONTEXT_EXPANSION_WINDOW), fetched from the
+        knowledge_chunks table by (source_id, chunk_number) instead of another
+        vector search. The neighbours are appended as an extra document list,
+        so _unique_union stitches them into contiguous windows.
+        """
+        window = settings.CONTEXT_EXPANSION_WINDOW
+        if window <= 0:
+            return doc_lists
+
+        present = set()
+        base_docs: Dict[tuple, Document] = {}
+        for doc in (doc for doc_list in doc_lists for doc in doc_list):
+            source_id = doc.metadata.get('source_id')
+            chunk_number = doc.metadata.get('chunk_number')
+            if source_id is None or chunk_number is None:
+                continue
+            present.add((source_id, chunk_number))
+            base_docs.setdefault((source_id, chunk_number), doc)
+
+        wanted: Dict[int, set] = defaultdict(set)
+        for source_id, chunk_number in present:
+            for neighbor in range(chunk_number - window, chunk_number + window + 1):
+                if neighbor >= 1 and (source_id, neighbor) not in present:
+                    wanted[source_id].add(neighbor)
+        if not wanted:
+            return doc_lists
+
+        try:
+            rows = get_chunks_by_number(wanted, kb_version=db_version_for(vector_store_service.active_version))
+        except Exception as e:
+            logger.error(f"Neighbor chunk expansion failed, using retrieved chunks only: {e}")
+            return doc_lists
+
+        # Neighbours inherit source-level metadata from a retrieved chunk of the same source.
+        base_by_source = {source_id: doc for (source_id, _), doc in base_docs.items()}
+        neighbor_docs = []
+        for (source_id, chunk_number), row in rows.items():
+            metadata = base_by_source[source_id].metadata.copy()
+            metadata.pop('rerank_score', None)
+            metadata['chunk_number'] = chunk_number
+            metadata['is_neighbor_expansion'] = True
+            neighbor_docs.append(Document(page_content=row['chunk_text'], metadata=metadata))
+
+        logger.debug(f"Expanded {len(present)} retrieved chunks with {len(neighbor_docs)} neighbouring chunks.")
+        return doc_lists + [neighbor_docs]
+
     def _unique_union(self, doc_lists: List[List[Document]]) -> List[Document]:
         """
         Aggregates and merges lists of documents, grouping them by 'source_id'.
@@ -75,7 +143,6 @@ class QueryTransformationAgent:
         logger.debug(f"Grouped {len(all_docs)} chunks into {len(docs_by_source)} unique sources.")
 
         # Step 2: Process each group to create a single, merged document.
-        CHUNK_SEPARATOR = "\n\n--- chunk ---\n\n"
         final_merged_docs: List[Document] = []
         for source_id, chunks in docs_by_source.items():
             
@@ -83,12 +150,31 @@ class QueryTransformationAgent:
             # We use a default of infinity for any chunk missing a number, pushing it to the end.
             sorted_chunks = sorted(chunks, key=lambda d: d.metadata.get('chunk_number', float('inf')))
 
+            # The same chunk can be returned by several queries; keep one copy of each.
+            seen_numbers = set()
+            unique_chunks = []
+            for chunk in sorted_chunks:
+                chunk_number = chunk.metadata.get('chunk_number')
+                if chunk_number is not None:
+                    if chunk_number in seen_numbers:
+                        continue
+                    seen_numbers.add(chunk_number)
+                unique_chunks.append(chunk)
+            sorted_chunks = unique_chunks
+
             # Step 2b: Use the metadata from the first chunk as the base for our new metadata.
             # This is now deterministic because of the sort.
             base_metadata = sorted_chunks[0].metadata.copy()
 
-            # Step 2c: Concatenate the page content from the sorted chunks.
-            merged_content = CHUNK_SEPARATOR.join([chunk.page_content for chunk in sorted_chunks])
+            # Step 2c: Concatenate the page content from the sorted chunks. Adjacent chunks
+            # are stitched into one window with their overlapping text removed.
+            merged_content = sorted_chunks[0].page_content
+            for previous, chunk in zip(sorted_chunks, sorted_chunks[1:]):
+                previous_number = previous.metadata.get('chunk_number')
+                if previous_number is not None and chunk.metadata.get('chunk_number') == previous_number + 1:
+                    merged_content += " " + _strip_overlap(previous.page_content, chunk.page_content).lstrip()
+                else:
+                    merged_content += CHUNK_SEPARATOR + chunk.page_content
 
             # Step 2d: Create a clean, new metadata object for the merged document.
             final_metadata: Dict[str, Any] = {
@@ -135,21 +221,21 @@ class QueryTransformationAgent:
         all_queries = [original_query] + generated_queries
         retrieval_results = self.retriever.batch(all_queries)
         # return self.reciprocal_rank_fusion(retrieval_results)[0]
-        return self._unique_union(retrieval_results)
+        return self._unique_union(self._expand_with_neighbors(retrieval_results))
 
 
     def _perform_decomposition(self, sub_queries: List[str]) -> List[Document]:
         """Executes the Decomposition strategy."""
         logger.debug(f"Performing Decomposition with sub-queries: {sub_queries}")
         retrieval_results = self.retriever.batch(sub_queries)
-        return self._unique_union(retrieval_results)
+        return self._unique_union(self._expand_with_neighbors(retrieval_results))
 
     def _perform_step_back(self, original_query: str, step_back_query: str) -> List[Document]:
         """Executes the Step-Back strategy."""
         logger.debug(f"Performing Step-Back with queries: ['{original_query}', '{step_back_query}']")
         queries_to_run = [original_query, step_back_query]
         retrieval_results = self.retriever.batch(queries_to_run)
-        return self._unique_union(retrieval_results)
+        return self._unique_union(self._expand_with_neighbors(retrieval_results))
 
     def transform_and_retrieve(self, query: str) -> List[Document]:
         """
@@ -187,6 +273,12 @@ class QueryTransformationAgent:
             else: # Default to SIMPLE retrieval
                 logger.debug("Performing simple retrieval.")
                 documents = self.retriever.invoke(query)
+                if settings.CONTEXT_EXPANSION_WINDOW > 0:
+                    documents = self._unique_union(self._expand_with_neighbors([documents]))
+
+            # 3. Optionally rerank the fused candidates with the cross-encoder
+            if self.reranker:
+                documents, _ = self.reranker.rerank(query, documents, passage_separator=CHUNK_SEPARATOR)
 
             logger.info(f"Retrieved {len(documents)} documents for query: '{query}'")
             return documents
@@ -8,6 +8,7 @@ from tavily import TavilyClient
 
 from insucompass.services import llm_provider
 from insucompass.config import settings
+from insucompass.services.downloads import CHUNK_SIZE, content_length_of, stream_to_temp_file
 from insucompass.prompts.prompt_loader import load_prompt
 
 # Configure logging
@@ -91,9 +92,14 @@ class SearchAgent:
             # If it's a PDF, we must re-download the raw bytes.
             if extension == '.pdf':
                 logger.info(f"Re-downloading PDF content from: {url}")
-                response = self.session.get(url, timeout=30, verify=False)
-                response.raise_for_status()
-                save_path.write_bytes(response.content)
+                # Streamed to a temporary file and renamed into place, so a large or failed
+                # download never sits in memory or leaves a partial file behind.
+                with self.session.get(url, timeout=30, verify=False, stream=True) as response:
+                    response.raise_for_status()
+                    download = stream_to_temp_file(
+                        response.iter_content(CHUNK_SIZE), DYNAMIC_DATA_DIR, content_length=content_length_of(response.headers)
+                    )
+                download.commit(save_path)
             else:
                 # For HTML/text, the content from Tavily is sufficient.
                 content = result.get('content', '')
@@ -0,0 +1,142 @@
+import json
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+from insucompass.config import settings
+from insucompass.services.database import get_db_connection
+from insucompass.services.text_codec import compress_text, decompress_text
+
+# Configure logging
+logging.basicConfig(level=settings.LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Chunk storage is normalized:
+# - knowledge_chunks holds the one authoritative copy of each chunk's text (optionally compressed)
+#   and its chunk-level metadata;
+# - data_sources holds the source-level fields every chunk of a source shares;
+# - the vector store holds only the vector, its ID and the fields queries filter on.
+# Retrieved documents are hydrated back to full text and metadata from SQLite.
+
+# Metadata kept on vectors, for filtering.
+VECTOR_METADATA_FIELDS = ("source_id", "chunk_number", "page_number")
+# Chunk metadata that is really per source, mapped to its data_sources column.
+SOURCE_FIELDS = {
+    "source_url": "url",
+    "source_name": "name",
+    "source_local_path": "local_path",
+    "total_chunks": "total_chunks",
+}
+
+INSERT_CHUNK_QUERY = (
+    "INSERT INTO knowledge_chunks (source_id, chunk_text, text_codec, metadata_json, vector_id, chunk_number, kb_version, chunk_hash, is_duplicate) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+# SQLite's default limit on host parameters is 999; stay well below it.
+LOOKUP_BATCH_SIZE = 500
+
+def vector_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """The subset of a chunk's metadata stored on its vector."""
+    return {key: metadata[key] for key in VECTOR_METADATA_FIELDS if metadata.get(key) is not None}
+
+def row_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """A chunk's metadata without the source-level fields, as stored in metadata_json."""
+    return {key: value for key, value in metadata.items() if key not in SOURCE_FIELDS}
+
+def encode_chunk_text(text: str) -> Tuple[Any, Optional[str]]:
+    """Returns (stored value, text_codec) for a chunk text under CHUNK_TEXT_COMPRESSION. A None codec means plain text."""
+    codec = settings.CHUNK_TEXT_COMPRESSION
+    if codec in ("", "none"):
+        return text, None
+    return compress_text(text, codec), codec
+
+def decode_chunk_text(value: Any, codec: Optional[str]) -> Optional[str]:
+    """Inverse of encode_chunk_text."""
+    if codec is None:
+        return value
+    return decompress_text(value, codec)
+
+def chunk_row(source_id: int, document: Document, vector_id: str, db_version: Optional[str], is_duplicate: bool = False) -> tuple:
+    """The knowledge_chunks row of a chunk, in INSERT_CHUNK_QUERY's column order."""
+    text, codec = encode_chunk_text(document.page_content)
+    return (
+        source_id,
+        text,
+        codec,
+        json.dumps(row_metadata(document.metadata)),
+        vector_id,
+        document.metadata.get('chunk_number'),
+        db_version,
+        document.metadata.get('chunk_hash'),
+        int(is_duplicate),
+    )
+
+def _full_metadata(row) -> Dict[str, Any]:
+    metadata = json.loads(row['metadata_json'] or '{}')
+    for field, column in SOURCE_FIELDS.items():
+        if row[column] is not None:
+            metadata[field] = row[column]
+    return metadata
+
+def load_chunks(vector_ids: Sequence[str], db_version: Optional[str]) -> Dict[str, Tuple[str, Dict[str, Any]]]:
+    """
+    Reads the text and full metadata (chunk fields plus source fields) of chunks by vector ID.
+    A vector shared by near-duplicate rows resolves to the row that owns it.
+
+    Returns:
+        A mapping of vector ID to (text, metadata).
+    """
+    found: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+    wanted = list(dict.fromkeys(vector_ids))
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        for start in range(0, len(wanted), LOOKUP_BATCH_SIZE):
+            batch = wanted[start:start + LOOKUP_BATCH_SIZE]
+            cursor.execute(
+                f"SELECT kc.vector_id, kc.chunk_text, kc.text_codec, kc.metadata_json, "
+                f"ds.url, ds.name, ds.local_path, ds.total_chunks "
+                f"FROM knowledge_chunks kc JOIN data_sources ds ON ds.id = kc.source_id "
+                f"WHERE kc.vector_id IN ({','.join('?' * len(batch))}) AND kc.kb_version IS ? "
+                f"ORDER BY kc.is_duplicate DESC",
+                (*batch, db_version)
+            )
+            # Owned rows sort last, so they overwrite any linked duplicate of the same vector.
+            for row in cursor.fetchall():
+                text = decode_chunk_text(row['chunk_text'], row['text_codec'])
+                if text is not None:
+                    found[row['vector_id']] = (text, _full_metadata(row))
+    return found
+
+def hydrate_documents(documents: List[Document], db_version: Optional[str]) -> List[Document]:
+    """
+    Fills in the text and metadata of retrieved documents that come from a
+    normalized vector store (no text on the vector), keeping their order.
+    Documents that already carry text are returned as they are. Documents whose
+    chunk row is missing are dropped.
+    """
+    missing = [doc.id for doc in documents if not doc.page_content and doc.id]
+    if not missing:
+        return documents
+    rows = load_chunks(missing, db_version)
+    hydrated = []
+    for doc in documents:
+        if doc.page_content:
+            hydrated.append(doc)
+        elif doc.id in rows:
+            text, metadata = rows[doc.id]
+            hydrated.append(Document(id=doc.id, page_content=text, metadata={**metadata, **doc.metadata}))
+        else:
+            logger.warning(f"No chunk row for retrieved vector {doc.id}; dropping it from the results.")
+    return hydrated
+
+def set_source_chunk_count(source_id: int, total_chunks: int, cursor=None):
+    """Stores a source's chunk count on its data_sources row, where hydrated chunks read total_chunks from."""
+    query = "UPDATE data_sources SET total_chunks = ? WHERE id = ?"
+    if cursor is not None:
+        cursor.execute(query, (total_chunks, source_id))
+        return
+    with get_db_connection() as conn:
+        conn.cursor().execute(query, (total_chunks, source_id))
+        conn.commit()
@@ -1,34 +1,83 @@
 import sqlite3
 import logging
 import json
+import os
+import threading
+import time
 from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
 from urllib.parse import urlparse
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Set, Tuple
 
 from ..config import settings
+from .text_codec import decompress_text
 
 # Configure logging
 logging.basicConfig(level=settings.LOG_LEVEL)
 logger = logging.getLogger(__name__)
 
+# Applied to every new connection. WAL lets readers run alongside the single writer;
+# synchronous=NORMAL is durable across application crashes in WAL mode.
+_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",     # 64 MiB page cache
+    "PRAGMA mmap_size=268435456",   # 256 MiB memory-mapped I/O
+    "PRAGMA busy_timeout=10000",
+)
+
+_local = threading.local()
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(settings.DATABASE_URL, timeout=10)
+    conn.row_factory = sqlite3.Row
+    for pragma in _PRAGMAS:
+        conn.execute(pragma)
+    logger.debug("Database connection established.")
+    return conn
+
+def _thread_connection() -> sqlite3.Connection:
+    """
+    Returns this thread's connection, opening it on first use. A connection is never
+    reused across a fork or after DATABASE_URL changes.
+    """
+    key = (os.getpid(), settings.DATABASE_URL)
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "key", None) != key:
+        conn = _connect()
+        _local.conn, _local.key = conn, key
+    return conn
+
 @contextmanager
 def get_db_connection():
-    """Context manager for handling database connections."""
-    conn = None
+    """
+    Context manager for handling database connections.
+
+    Each thread keeps one open connection that is reused across calls. As with a
+    fresh connection per call, anything not committed inside the block is rolled back.
+    """
+    try:
+        conn = _thread_connection()
+    except sqlite3.Error as e:
+        logger.error(f"Database connection error: {e}")
+        raise
     try:
-        conn = sqlite3.connect(settings.DATABASE_URL)
-        conn.row_factory = sqlite3.Row
-        logger.debug("Database connection established.")
         yield conn
     except sqlite3.Error as e:
         logger.error(f"Database connection error: {e}")
         raise
     finally:
-        if conn:
-            conn.close()
-            logger.debug("Database connection closed.")
+        if conn.in_transaction:
+            conn.rollback()
+
+def close_db_connection():
+    """Closes the calling thread's connection, e.g. before a long idle period."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
 
 def setup_database():
     """Creates/updates all necessary tables in the database."""
@@ -43,6 +92,13 @@ def setup_database():
             category TEXT,
             local_path TEXT,
             content_hash TEXT,
+            ingested_hash TEXT,
+            duplicate_of INTEGER,
+            total_chunks INTEGER,
+            etag TEXT,
+            last_modified TEXT,
+            content_length INTEGER,
+            last_checked_at TIMESTAMP,
             status TEXT DEFAULT 'pending',
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP
@@ -53,13 +109,130 @@ def setup_database():
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             source_id INTEGER NOT NULL,
             chunk_text TEXT NOT NULL,
+            text_codec TEXT,
             metadata_json TEXT,
             vector_id TEXT,
+            chunk_number INTEGER,
+            kb_version TEXT,
+            chunk_hash TEXT,
+            is_duplicate INTEGER NOT NULL DEFAULT 0,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (source_id) REFERENCES data_sources (id)
         );
         """,
         """
+        CREATE TABLE IF NOT EXISTS near_duplicate_signatures (
+            kind TEXT NOT NULL,
+            kb_version TEXT NOT NULL,
+            item_key TEXT NOT NULL,
+            source_id INTEGER NOT NULL,
+            signature BLOB NOT NULL,
+            PRIMARY KEY (kind, kb_version, item_key)
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS near_duplicate_bands (
+            kind TEXT NOT NULL,
+            kb_version TEXT NOT NULL,
+            band INTEGER NOT NULL,
+            band_hash INTEGER NOT NULL,
+            item_key TEXT NOT NULL
+        );
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_near_duplicate_bands_lookup
+        ON near_duplicate_bands (kind, kb_version, band, band_hash);
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_near_duplicate_bands_item
+        ON near_duplicate_bands (kind, kb_version, item_key);
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS embedding_cache (
+            cache_key TEXT PRIMARY KEY,
+            model_name TEXT NOT NULL,
+            dim INTEGER NOT NULL,
+            vector BLOB NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS parsed_texts (
+            content_hash TEXT NOT NULL,
+            variant TEXT NOT NULL,
+            codec TEXT NOT NULL,
+            text BLOB NOT NULL,
+            offsets_json TEXT,
+            text_bytes INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (content_hash, variant)
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS ingestion_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kb_version TEXT NOT NULL,
+            mode TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running',
+            sources_total INTEGER NOT NULL DEFAULT 0,
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS ingestion_journal (
+            run_id INTEGER NOT NULL,
+            source_id INTEGER NOT NULL,
+            stage TEXT NOT NULL DEFAULT 'pending',
+            pending_vector_ids TEXT,
+            status TEXT,
+            ingested_hash TEXT,
+            duplicate_of INTEGER,
+            total_chunks INTEGER,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (run_id, source_id),
+            FOREIGN KEY (run_id) REFERENCES ingestion_runs (id)
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS reembed_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            source_version TEXT NOT NULL,
+            target_version TEXT NOT NULL,
+            embedding_model TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running',
+            sources_total INTEGER NOT NULL DEFAULT 0,
+            sources_synced INTEGER NOT NULL DEFAULT 0,
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP,
+            finished_at TIMESTAMP
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS reembed_progress (
+            job_id INTEGER NOT NULL,
+            source_id INTEGER NOT NULL,
+            fingerprint TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (job_id, source_id),
+            FOREIGN KEY (job_id) REFERENCES reembed_jobs (id)
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS crawl_frontier (
+            job TEXT NOT NULL,
+            url TEXT NOT NULL,
+            depth INTEGER NOT NULL,
+            priority INTEGER NOT NULL DEFAULT 0,
+            state TEXT NOT NULL DEFAULT 'queued',
+            lease_owner TEXT,
+            lease_expires_at REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (job, url)
+        );
+        """,
+        """
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             username TEXT NOT NULL UNIQUE,
@@ -79,11 +252,90 @@ def setup_database():
         """
     ]
     with get_db_connection() as conn:
+        cursor = conn.cursor()
         for statement in ddl_statements:
-            conn.cursor().execute(statement)
+            cursor.execute(statement)
+
+        _apply_migrations(cursor)
         conn.commit()
     logger.info("Database schema setup complete.")
 
+def _migrate_ingestion_columns(cursor: sqlite3.Cursor):
+    # Columns added after the initial schema; older databases are migrated in place.
+    if _add_column_if_missing(cursor, "knowledge_chunks", "chunk_number", "INTEGER"):
+        cursor.execute(
+            "UPDATE knowledge_chunks SET chunk_number = json_extract(metadata_json, '$.chunk_number') "
+            "WHERE chunk_number IS NULL AND metadata_json IS NOT NULL"
+        )
+    _add_column_if_missing(cursor, "knowledge_chunks", "kb_version", "TEXT")
+    _add_column_if_missing(cursor, "knowledge_chunks", "chunk_hash", "TEXT")
+    _add_column_if_missing(cursor, "data_sources", "ingested_hash", "TEXT")
+    _add_column_if_missing(cursor, "data_sources", "duplicate_of", "INTEGER")
+    _add_column_if_missing(cursor, "knowledge_chunks", "is_duplicate", "INTEGER NOT NULL DEFAULT 0")
+    # Also serves lookups by source_id alone.
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_knowledge_chunks_source_chunk "
+        "ON knowledge_chunks (source_id, chunk_number)"
+    )
+
+def _migrate_lookup_indexes(cursor: sqlite3.Cursor):
+    # The crawler and ingestion select sources by status, and the reconciler,
+    # compaction and stale-vector cleanup look chunks up by vector_id.
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_data_sources_status ON data_sources (status)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_knowledge_chunks_vector_id ON knowledge_chunks (vector_id)")
+    cursor.execute("ANALYZE")
+
+def _migrate_normalized_chunks(cursor: sqlite3.Cursor):
+    # Chunk text may be stored compressed (text_codec names the codec, NULL is plain text),
+    # and the chunk count moves from every chunk's metadata to its source.
+    _add_column_if_missing(cursor, "knowledge_chunks", "text_codec", "TEXT")
+    _add_column_if_missing(cursor, "data_sources", "total_chunks", "INTEGER")
+
+def _migrate_crawl_validators(cursor: sqlite3.Cursor):
+    # HTTP validators of the last download, for conditional recrawls.
+    _add_column_if_missing(cursor, "data_sources", "etag", "TEXT")
+    _add_column_if_missing(cursor, "data_sources", "last_modified", "TEXT")
+    _add_column_if_missing(cursor, "data_sources", "content_length", "INTEGER")
+    _add_column_if_missing(cursor, "data_sources", "last_checked_at", "TIMESTAMP")
+
+def _migrate_crawl_frontier_index(cursor: sqlite3.Cursor):
+    # Crawlers lease a job's next URLs by state and priority.
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_crawl_frontier_next ON crawl_frontier (job, state, priority)")
+
+def _migrate_ingestion_outcomes(cursor: sqlite3.Cursor):
+    # A staging rebuild keeps each source's outcome in its journal entry; data_sources
+    # only describes the version being served and takes the outcomes on promotion.
+    _add_column_if_missing(cursor, "ingestion_journal", "status", "TEXT")
+    _add_column_if_missing(cursor, "ingestion_journal", "ingested_hash", "TEXT")
+    _add_column_if_missing(cursor, "ingestion_journal", "duplicate_of", "INTEGER")
+    _add_column_if_missing(cursor, "ingestion_journal", "total_chunks", "INTEGER")
+
+# Applied in order; PRAGMA user_version records how many have run. Only ever append.
+MIGRATIONS = [
+    _migrate_ingestion_columns,
+    _migrate_lookup_indexes,
+    _migrate_normalized_chunks,
+    _migrate_crawl_validators,
+    _migrate_crawl_frontier_index,
+    _migrate_ingestion_outcomes,
+]
+
+def _apply_migrations(cursor: sqlite3.Cursor):
+    current = cursor.execute("PRAGMA user_version").fetchone()[0]
+    for version, migration in enumerate(MIGRATIONS[current:], start=current + 1):
+        logger.info(f"Applying schema migration {version}: {migration.__name__}")
+        migration(cursor)
+        cursor.execute(f"PRAGMA user_version = {version}")
+
+def _add_column_if_missing(cursor: sqlite3.Cursor, table: str, column: str, definition: str) -> bool:
+    """Adds a column to an existing table. Returns True if the column was added."""
+    existing = {row['name'] for row in cursor.execute(f"PRAGMA table_info({table})").fetchall()}
+    if column in existing:
+        return False
+    logger.info(f"Migrating schema: adding column '{column}' to '{table}'.")
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return True
+
 # --- Crawler-related Helpers ---
 
 def initialize_crawl_jobs():
@@ -104,7 +356,7 @@ def initialize_crawl_jobs():
     logger.info("Crawl jobs initialized successfully.")
 
 
-def find_or_create_web_source(url: str, name: str) -> int:
+def find_or_create_web_source(url: str, name: str, local_path: Optional[str] = None) -> int:
     """
     Finds an existing data source by URL or creates a new one if it doesn't exist.
     Used for dynamically ingested web search results.
@@ -124,11 +376,11 @@ def find_or_create_web_source(url: str, name: str) -> int:
         # 2. If not, create it
         logger.info(f"Registering new dynamic web source: {url}")
         insert_query = """
-        INSERT INTO data_sources (name, url, data_type, category, status, created_at, updated_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
+        INSERT INTO data_sources (name, url, data_type, category, local_path, status, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         """
         cursor.execute(insert_query, (
-            name, url, 'web_search_result', 'Dynamic', 'ingested', datetime.now(), datetime.now()
+            name, url, 'web_search_result', 'Dynamic', local_path, 'ingested', datetime.now(), datetime.now()
         ))
         conn.commit()
         return cursor.lastrowid
@@ -143,9 +395,7 @@ def add_discovered_source(url: str, category: str, data_type: str) -> int:
         if row:
             return row['id']
         
-        path_name = Path(urlparse(url).path).name
-        if not path_name:
-            path_name = urlparse(url).path.strip('/').replace('/', '_') or urlparse(url).netloc
+        path_name = _source_name(url)
         
         insert_query = "INSERT INTO data_sources (name, url, data_type, category, status, created_at) VALUES (?, ?, ?, ?, ?, ?)"
         cursor.execute(insert_query, (path_name, url, data_type, category, 'pending', datetime.now()))
@@ -153,6 +403,557 @@ def add_discovered_source(url: str, category: str, data_type: str) -> int:
         logger.debug(f"Discovered and added new source: {url}")
         return cursor.lastrowid
 
+def _source_name(url: str) -> str:
+    path_name = Path(urlparse(url).path).name
+    if not path_name:
+        path_name = urlparse(url).path.strip('/').replace('/', '_') or urlparse(url).netloc
+    return path_name
+
+def add_discovered_sources(entries: List[Tuple[str, str, str]]) -> Dict[str, int]:
+    """
+    Bulk version of add_discovered_source: registers many URLs in one transaction.
+
+    Args:
+        entries: (url, category, data_type) tuples.
+
+    Returns:
+        A mapping of every given URL to its data source ID.
+    """
+    if not entries:
+        return {}
+    now = datetime.now()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany(
+            "INSERT OR IGNORE INTO data_sources (name, url, data_type, category, status, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            [(_source_name(url), url, data_type, category, 'pending', now) for url, category, data_type in entries]
+        )
+        conn.commit()
+        urls = list({url for url, _, _ in entries})
+        ids: Dict[str, int] = {}
+        for start in range(0, len(urls), 500):
+            batch = urls[start:start + 500]
+            cursor.execute(f"SELECT id, url FROM data_sources WHERE url IN ({','.join('?' * len(batch))})", batch)
+            ids.update({row['url']: row['id'] for row in cursor.fetchall()})
+    return ids
+
+def get_crawl_state(source_id: int) -> Optional[Dict[str, Any]]:
+    """Returns what the last crawl of a source recorded: local_path, content_hash, etag, last_modified, content_length, status."""
+    with get_db_connection() as conn:
+        row = conn.cursor().execute(
+            "SELECT local_path, content_hash, etag, last_modified, content_length, status FROM data_sources WHERE id = ?",
+            (source_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+def mark_source_downloaded(source_id: int, local_path: str, content_hash: str, validators: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Records a crawled download of a source with its HTTP validators (etag,
+    last_modified, content_length). The status only changes if the content did:
+    'processed' for a first download, 'updated' for changed content, so ingestion
+    picks up exactly the sources that changed.
+
+    Returns:
+        'new', 'changed' or 'unchanged'.
+    """
+    validators = validators or {}
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        row = cursor.execute("SELECT content_hash FROM data_sources WHERE id = ?", (source_id,)).fetchone()
+        previous_hash = row['content_hash'] if row else None
+        validator_values = (validators.get('etag'), validators.get('last_modified'), validators.get('content_length'), now)
+        if previous_hash == content_hash:
+            cursor.execute(
+                "UPDATE data_sources SET local_path = ?, etag = ?, last_modified = ?, content_length = ?, last_checked_at = ? WHERE id = ?",
+                (local_path, *validator_values, source_id)
+            )
+            outcome = 'unchanged'
+        else:
+            cursor.execute(
+                "UPDATE data_sources SET local_path = ?, content_hash = ?, status = ?, updated_at = ?, "
+                "etag = ?, last_modified = ?, content_length = ?, last_checked_at = ? WHERE id = ?",
+                (local_path, content_hash, 'updated' if previous_hash else 'processed', now, *validator_values, source_id)
+            )
+            outcome = 'changed' if previous_hash else 'new'
+        conn.commit()
+    return outcome
+
+def mark_source_not_modified(source_id: int):
+    """Records a 304 Not Modified answer to a conditional recrawl. The status is left alone."""
+    with get_db_connection() as conn:
+        conn.cursor().execute(
+            "UPDATE data_sources SET last_checked_at = ? WHERE id = ?", (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), source_id)
+        )
+        conn.commit()
+
+def update_source_statuses(updates: List[Tuple[int, str]]):
+    """Sets the status of many data sources in one transaction. `updates` holds (source_id, status) pairs."""
+    with get_db_connection() as conn:
+        conn.cursor().executemany("UPDATE data_sources SET status = ? WHERE id = ?", [(status, source_id) for source_id, status in updates])
+        conn.commit()
+
+def release_duplicates_of(source_id: int, cursor: Optional[sqlite3.Cursor] = None):
+    """
+    Returns the sources recorded as near-duplicates of `source_id` to 'updated', so the
+    next ingestion checks them again: the source they repeated changed or is no longer
+    served. Pass `cursor` to make the change part of a larger transaction.
+    """
+    query = (
+        "UPDATE data_sources SET status = 'updated', duplicate_of = NULL, ingested_hash = NULL "
+        "WHERE duplicate_of = ? AND status = 'duplicate'"
+    )
+    if cursor is not None:
+        cursor.execute(query, (source_id,))
+        return
+    with get_db_connection() as conn:
+        conn.cursor().execute(query, (source_id,))
+        conn.commit()
+
+# --- Knowledge Chunk Helpers ---
+
+def get_chunks_by_number(wanted: Dict[int, Set[int]], kb_version: Optional[str] = None) -> Dict[Tuple[int, int], Dict[str, Any]]:
+    """
+    Fetches specific chunks of the given sources via the (source_id, chunk_number) index.
+
+    Args:
+        wanted: A mapping of source_id to the set of chunk numbers to fetch.
+        kb_version: The knowledge base version the chunks belong to (None for legacy rows).
+
+    Returns:
+        A mapping of (source_id, chunk_number) to the chunk row as a dict.
+    """
+    found: Dict[Tuple[int, int], Dict[str, Any]] = {}
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        for source_id, chunk_numbers in wanted.items():
+            if not chunk_numbers:
+                continue
+            numbers = sorted(chunk_numbers)
+            placeholders = ",".join("?" * len(numbers))
+            cursor.execute(
+                f"SELECT source_id, chunk_number, chunk_text, text_codec, metadata_json, vector_id FROM knowledge_chunks "
+                f"WHERE source_id = ? AND chunk_number IN ({placeholders}) AND kb_version IS ?",
+                (source_id, *numbers, kb_version)
+            )
+            for row in cursor.fetchall():
+                found[(row['source_id'], row['chunk_number'])] = _decoded_chunk(row)
+    return found
+
+def _decoded_chunk(row: sqlite3.Row) -> Dict[str, Any]:
+    # Returns a chunk row as a dict with chunk_text decompressed.
+    chunk = dict(row)
+    codec = chunk.pop('text_codec')
+    if codec is not None:
+        chunk['chunk_text'] = decompress_text(chunk['chunk_text'], codec)
+    return chunk
+
+def get_source_chunks(source_id: int, kb_version: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Returns the stored chunks of one source in a knowledge base version.
+
+    Args:
+        source_id: The data source ID.
+        kb_version: The knowledge base version the chunks belong to (None for legacy rows).
+
+    Returns:
+        A list of dicts with the row id, vector_id, chunk_hash, chunk_text and is_duplicate
+        flag of each chunk.
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT id, vector_id, chunk_hash, chunk_text, text_codec, is_duplicate FROM knowledge_chunks WHERE source_id = ? AND kb_version IS ?",
+            (source_id, kb_version)
+        )
+        return [_decoded_chunk(row) for row in cursor.fetchall()]
+
+def get_linked_vector_ids(vector_ids: List[str], exclude_source_id: int) -> Set[str]:
+    """Returns the subset of vector_ids that duplicate chunks of other sources still point to."""
+    linked: Set[str] = set()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        for start in range(0, len(vector_ids), 500):
+            batch = vector_ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            cursor.execute(
+                f"SELECT DISTINCT vector_id FROM knowledge_chunks WHERE is_duplicate = 1 AND source_id != ? AND vector_id IN ({placeholders})",
+                (exclude_source_id, *batch)
+            )
+            linked.update(row['vector_id'] for row in cursor.fetchall())
+    return linked
+
+def delete_near_duplicate_entries(kb_version: str) -> None:
+    """Deletes the near-duplicate index entries of a knowledge base version."""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM near_duplicate_signatures WHERE kb_version = ?", (kb_version,))
+        cursor.execute("DELETE FROM near_duplicate_bands WHERE kb_version = ?", (kb_version,))
+        conn.commit()
+
+def copy_near_duplicate_entries(from_version: str, to_version: str) -> None:
+    """Replaces the near-duplicate index of one knowledge base version with a copy of another's."""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM near_duplicate_signatures WHERE kb_version = ?", (to_version,))
+        cursor.execute("DELETE FROM near_duplicate_bands WHERE kb_version = ?", (to_version,))
+        cursor.execute(
+            "INSERT INTO near_duplicate_signatures (kind, kb_version, item_key, source_id, signature) "
+            "SELECT kind, ?, item_key, source_id, signature FROM near_duplicate_signatures WHERE kb_version = ?",
+            (to_version, from_version)
+        )
+        cursor.execute(
+            "INSERT INTO near_duplicate_bands (kind, kb_version, band, band_hash, item_key) "
+            "SELECT kind, ?, band, band_hash, item_key FROM near_duplicate_bands WHERE kb_version = ?",
+            (to_version, from_version)
+        )
+        conn.commit()
+
+def delete_chunks_for_version(kb_version: Optional[str]) -> int:
+    """Deletes all knowledge_chunks rows of a knowledge base version. Returns the number of rows deleted."""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM knowledge_chunks WHERE kb_version IS ?", (kb_version,))
+        conn.commit()
+        logger.info(f"Deleted {cursor.rowcount} chunk rows for knowledge base version {kb_version!r}.")
+        return cursor.rowcount
+
+# --- Crawl Frontier Helpers ---
+# The URLs of each crawl job's current crawl: 'queued' -> 'leased' (to one crawler process
+# until lease_expires_at, a Unix time) -> 'done'. A lease that expires, e.g. because its
+# process died, is handed out again; after CRAWLER_FRONTIER_MAX_ATTEMPTS the URL is 'failed'.
+# A job's rows stay until its next crawl starts and double as the crawl's visited set.
+
+def start_crawl_frontier(job: str, start_url: str) -> bool:
+    """
+    Resumes a crawl job's unfinished crawl or, if it has none, starts a new crawl
+    from `start_url`, discarding the previous crawl's frontier.
+
+    Returns:
+        True if an unfinished crawl was resumed.
+    """
+    with get_db_connection() as conn:
+        # IMMEDIATE takes the write lock up front, so concurrent crawler processes agree on the outcome.
+        conn.execute("BEGIN IMMEDIATE")
+        unfinished = conn.execute(
+            "SELECT COUNT(*) FROM crawl_frontier WHERE job = ? AND state IN ('queued', 'leased')", (job,)
+        ).fetchone()[0]
+        if not unfinished:
+            conn.execute("DELETE FROM crawl_frontier WHERE job = ?", (job,))
+            conn.execute("INSERT INTO crawl_frontier (job, url, depth, priority) VALUES (?, ?, 0, 0)", (job, start_url))
+        conn.commit()
+    return bool(unfinished)
+
+def reset_crawl_frontier(job: str) -> None:
+    """Discards a crawl job's frontier, so its next crawl starts over."""
+    with get_db_connection() as conn:
+        conn.cursor().execute("DELETE FROM crawl_frontier WHERE job = ?", (job,))
+        conn.commit()
+
+def filter_new_frontier_urls(job: str, urls: List[str]) -> List[str]:
+    """Returns the URLs that are not yet in a crawl job's frontier."""
+    known: Set[str] = set()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        for start in range(0, len(urls), 500):
+            batch = urls[start:start + 500]
+            cursor.execute(f"SELECT url FROM crawl_frontier WHERE job = ? AND url IN ({','.join('?' * len(batch))})", (job, *batch))
+            known.update(row['url'] for row in cursor.fetchall())
+    return [url for url in urls if url not in known]
+
+def enqueue_frontier(job: str, entries: List[Tuple[str, int, int]]) -> int:
+    """
+    Adds URLs to a crawl job's frontier in one transaction. URLs already in it are left alone.
+
+    Args:
+        entries: (url, depth, priority) tuples. Lower priorities are leased first.
+
+    Returns:
+        The number of URLs added.
+    """
+    if not entries:
+        return 0
+    with get_db_connection() as conn:
+        before = conn.total_changes
+        conn.cursor().executemany(
+            "INSERT OR IGNORE INTO crawl_frontier (job, url, depth, priority) VALUES (?, ?, ?, ?)",
+            [(job, url, depth, priority) for url, depth, priority in entries]
+        )
+        conn.commit()
+        return conn.total_changes - before
+
+def lease_frontier(job: str, owner: str, limit: int, lease_seconds: float, max_attempts: int) -> List[Dict[str, Any]]:
+    """
+    Leases up to `limit` of a crawl job's queued URLs (and URLs whose lease expired)
+    to `owner`, lowest priority first, then in the order they were queued.
+
+    Returns:
+        Dicts with url, depth and source_id (the URL's data source, if registered).
+    """
+    now = time.time()
+    with get_db_connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE crawl_frontier SET state = 'failed', lease_owner = NULL, updated_at = ? "
+            "WHERE job = ? AND state = 'leased' AND lease_expires_at < ? AND attempts >= ?",
+            (datetime.now(), job, now, max_attempts)
+        )
+        cursor.execute(
+            "SELECT f.url, f.depth, s.id AS source_id FROM crawl_frontier f LEFT JOIN data_sources s ON s.url = f.url "
+            "WHERE f.job = ? AND (f.state = 'queued' OR (f.state = 'leased' AND f.lease_expires_at < ?)) "
+            "ORDER BY f.priority, f.rowid LIMIT ?",
+            (job, now, limit)
+        )
+        entries = [dict(row) for row in cursor.fetchall()]
+        cursor.executemany(
+            "UPDATE crawl_frontier SET state = 'leased', lease_owner = ?, lease_expires_at = ?, attempts = attempts + 1, updated_at = ? "
+            "WHERE job = ? AND url = ?",
+            [(owner, now + lease_seconds, datetime.now(), job, entry['url']) for entry in entries]
+        )
+        conn.commit()
+    return entries
+
+def complete_frontier(job: str, owner: str, urls: List[str]) -> None:
+    """Marks URLs leased to `owner` as 'done'. URLs whose lease passed to another owner are left to it."""
+    with get_db_connection() as conn:
+        conn.cursor().executemany(
+            "UPDATE crawl_frontier SET state = 'done', lease_owner = NULL, lease_expires_at = NULL, updated_at = ? "
+            "WHERE job = ? AND url = ? AND lease_owner = ? AND state = 'leased'",
+            [(datetime.now(), job, url, owner) for url in urls]
+        )
+        conn.commit()
+
+def retry_frontier(job: str, owner: str, urls: List[str], max_attempts: int) -> None:
+    """
+    Returns URLs leased to `owner` whose crawl failed to the queue, counting the
+    attempt. URLs that used up `max_attempts` are marked 'failed' instead.
+    """
+    with get_db_connection() as conn:
+        conn.cursor().executemany(
+            "UPDATE crawl_frontier SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, "
+            "lease_owner = NULL, lease_expires_at = NULL, updated_at = ? WHERE job = ? AND url = ? AND lease_owner = ? AND state = 'leased'",
+            [(max_attempts, datetime.now(), job, url, owner) for url in urls]
+        )
+        conn.commit()
+
+def release_frontier_leases(job: str, owners: List[str]) -> int:
+    """Returns the URLs leased to `owners` to the queue without counting the attempt. Returns how many."""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany(
+            "UPDATE crawl_frontier SET state = 'queued', lease_owner = NULL, lease_expires_at = NULL, "
+            "attempts = MAX(attempts - 1, 0), updated_at = ? WHERE job = ? AND lease_owner = ? AND state = 'leased'",
+            [(datetime.now(), job, owner) for owner in owners]
+        )
+        conn.commit()
+        return cursor.rowcount
+
+def get_frontier_lease_owners(job: str) -> List[str]:
+    """Returns the owners currently holding leases on a crawl job's URLs."""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT DISTINCT lease_owner FROM crawl_frontier WHERE job = ? AND state = 'leased'", (job,))
+        return [row['lease_owner'] for row in cursor.fetchall()]
+
+def get_frontier_counts(job: str) -> Dict[str, int]:
+    """Returns the number of a crawl job's frontier URLs in each state."""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT state, COUNT(*) AS n FROM crawl_frontier WHERE job = ? GROUP BY state", (job,))
+        return {row['state']: row['n'] for row in cursor.fetchall()}
+
+# --- Ingestion Run Helpers ---
+# Journal stages per source: 'pending' -> 'writing' (vector IDs about to be written to the
+# vector store are recorded first) -> 'done' (committed together with the knowledge_chunks rows),
+# or 'failed'/'duplicate'.
+
+def start_ingestion_run(kb_version: str, mode: str, source_ids: List[int]) -> int:
+    """Records a new ingestion run and journals every source it will process as 'pending'."""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO ingestion_runs (kb_version, mode, sources_total) VALUES (?, ?, ?)",
+            (kb_version, mode, len(source_ids))
+        )
+        run_id = cursor.lastrowid
+        cursor.executemany(
+            "INSERT INTO ingestion_journal (run_id, source_id) VALUES (?, ?)",
+            [(run_id, source_id) for source_id in source_ids]
+        )
+        conn.commit()
+    logger.info(f"Started ingestion run {run_id} ({mode}, {len(source_ids)} sources, version '{kb_version}').")
+    return run_id
+
+def get_resumable_run() -> Optional[Dict[str, Any]]:
+    """Returns the most recent ingestion run that did not complete, if any."""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM ingestion_runs WHERE status != 'completed' ORDER BY id DESC LIMIT 1")
+        row = cursor.fetchone()
+        return dict(row) if row else None
+
+def get_running_ingestion_runs() -> List[Dict[str, Any]]:
+    """Returns the ingestion runs still marked 'running', oldest first."""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM ingestion_runs WHERE status = 'running' ORDER BY id")
+        return [dict(row) for row in cursor.fetchall()]
+
+def get_unfinished_journal_entries(run_id: int) -> List[Dict[str, Any]]:
+    """Returns the journal entries of a run whose sources were not fully written."""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT * FROM ingestion_journal WHERE run_id = ? AND stage IN ('pending', 'writing')",
+            (run_id,)
+        )
+        return [dict(row) for row in cursor.fetchall()]
+
+def set_journal_stage(
+    run_id: int,
+    source_id: int,
+    stage: str,
+    pending_vector_ids: Optional[List[str]] = None,
+    cursor: Optional[sqlite3.Cursor] = None,
+    outcome: Optional[Dict[str, Any]] = None
+):
+    """
+    Moves a source to a journal stage. Pass `cursor` to make the change part of
+    a larger transaction, otherwise it is committed on its own.
+
+    `outcome` records the data_sources fields a staging build sets once its
+    version is promoted: status, ingested_hash, duplicate_of and total_chunks.
+    """
+    outcome = outcome or {}
+    # Pending vector IDs are kept until replaced, so a failed write still shows what it may have left behind.
+    query = (
+        "UPDATE ingestion_journal SET stage = ?, pending_vector_ids = COALESCE(?, pending_vector_ids), "
+        "status = COALESCE(?, status), ingested_hash = COALESCE(?, ingested_hash), duplicate_of = COALESCE(?, duplicate_of), "
+        "total_chunks = COALESCE(?, total_chunks), updated_at = ? WHERE run_id = ? AND source_id = ?"
+    )
+    params = (
+        stage, json.dumps(pending_vector_ids) if pending_vector_ids is not None else None,
+        outcome.get('status'), outcome.get('ingested_hash'), outcome.get('duplicate_of'), outcome.get('total_chunks'),
+        datetime.now(), run_id, source_id
+    )
+    if cursor is not None:
+        cursor.execute(query, params)
+        return
+    with get_db_connection() as conn:
+        conn.cursor().execute(query, params)
+        conn.commit()
+
+def get_latest_rebuild_run(kb_version: str) -> Optional[Dict[str, Any]]:
+    """Returns the last --rebuild ingestion run that built a knowledge base version, if any."""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT * FROM ingestion_runs WHERE kb_version = ? AND mode = 'rebuild' ORDER BY id DESC LIMIT 1", (kb_version,)
+        )
+        row = cursor.fetchone()
+        return dict(row) if row else None
+
+def get_unpromotable_journal_entries(run_id: int) -> List[Dict[str, Any]]:
+    """Returns the journal entries of a run whose source was neither ingested nor skipped as a duplicate."""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT source_id, stage, status FROM ingestion_journal WHERE run_id = ? AND stage NOT IN ('done', 'duplicate')",
+            (run_id,)
+        )
+        return [dict(row) for row in cursor.fetchall()]
+
+def apply_journal_outcomes(run_id: int) -> int:
+    """
+    Copies the per-source outcomes a staging build journaled to data_sources, when
+    its version is promoted. Returns the number of sources updated.
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        entries = cursor.execute(
+            "SELECT source_id, stage, ingested_hash, duplicate_of, total_chunks FROM ingestion_journal "
+            "WHERE run_id = ? AND stage IN ('done', 'duplicate')",
+            (run_id,)
+        ).fetchall()
+        cursor.executemany(
+            "UPDATE data_sources SET status = 'ingested', ingested_hash = ?, total_chunks = ?, duplicate_of = NULL WHERE id = ?",
+            [(row['ingested_hash'], row['total_chunks'], row['source_id']) for row in entries if row['stage'] == 'done']
+        )
+        cursor.executemany(
+            "UPDATE data_sources SET status = 'duplicate', duplicate_of = ?, ingested_hash = NULL, total_chunks = 0 WHERE id = ?",
+            [(row['duplicate_of'], row['source_id']) for row in entries if row['stage'] == 'duplicate']
+        )
+        conn.commit()
+    return len(entries)
+
+def finish_ingestion_run(run_id: int, status: str):
+    """Marks an ingestion run 'completed' or 'failed'."""
+    with get_db_connection() as conn:
+        conn.cursor().execute(
+            "UPDATE ingestion_runs SET status = ?, finished_at = ? WHERE id = ?",
+            (status, datetime.now(), run_id)
+        )
+        conn.commit()
+
+def get_vector_ids_with_rows(vector_ids: List[str], kb_version: Optional[str]) -> Set[str]:
+    """Returns the subset of vector_ids that have a knowledge_chunks row in a knowledge base version."""
+    found: Set[str] = set()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        for start in range(0, len(vector_ids), 500):
+            batch = vector_ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            cursor.execute(
+                f"SELECT DISTINCT vector_id FROM knowledge_chunks WHERE kb_version IS ? AND vector_id IN ({placeholders})",
+                (kb_version, *batch)
+            )
+            found.update(row['vector_id'] for row in cursor.fetchall())
+    return found
+
+# --- Re-embed Job Helpers ---
+# A re-embed job copies a knowledge base version into a new version embedded with another
+# model: 'running' -> 'completed' (the new version was promoted) or 'cancelled'.
+
+def create_reembed_job(source_version: str, target_version: str, embedding_model: str) -> int:
+    """Records a new re-embed job and returns its ID."""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO reembed_jobs (source_version, target_version, embedding_model, updated_at) VALUES (?, ?, ?, ?)",
+            (source_version, target_version, embedding_model, datetime.now())
+        )
+        conn.commit()
+    logger.info(f"Started re-embed job {cursor.lastrowid}: '{source_version}' -> '{target_version}' ({embedding_model}).")
+    return cursor.lastrowid
+
+def get_running_reembed_jobs() -> List[Dict[str, Any]]:
+    """Returns the re-embed jobs that have not completed or been cancelled, oldest first."""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM reembed_jobs WHERE status = 'running' ORDER BY id")
+        return [dict(row) for row in cursor.fetchall()]
+
+def update_reembed_job(job_id: int, status: Optional[str] = None, sources_total: Optional[int] = None, sources_synced: Optional[int] = None):
+    """Records a re-embed job's progress and, with a final status, when it finished."""
+    finished_at = datetime.now() if status in ('completed', 'cancelled') else None
+    with get_db_connection() as conn:
+        conn.cursor().execute(
+            "UPDATE reembed_jobs SET status = COALESCE(?, status), sources_total = COALESCE(?, sources_total), "
+            "sources_synced = COALESCE(?, sources_synced), updated_at = ?, finished_at = COALESCE(?, finished_at) WHERE id = ?",
+            (status, sources_total, sources_synced, datetime.now(), finished_at, job_id)
+        )
+        conn.commit()
+
+def delete_reembed_jobs_for_version(version: str) -> None:
+    """Deletes finished re-embed jobs that read from or wrote to a knowledge base version, with their progress."""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        condition = "status != 'running' AND (source_version = ? OR target_version = ?)"
+        cursor.execute(f"DELETE FROM reembed_progress WHERE job_id IN (SELECT id FROM reembed_jobs WHERE {condition})", (version, version))
+        cursor.execute(f"DELETE FROM reembed_jobs WHERE {condition}", (version, version))
+        conn.commit()
+
 # --- User Management Helpers ---
 
 def create_user(username: str, hashed_password: str, role: str = 'user') -> Optional[int]:
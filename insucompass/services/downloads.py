@@ -0,0 +1,119 @@
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import AsyncIterable, Iterable, Optional
+
+from insucompass.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Bytes read from a response body at a time.
+CHUNK_SIZE = 64 * 1024
+
+class DownloadTooLarge(Exception):
+    """Raised when a download is larger than the allowed maximum."""
+
+class StreamedDownload:
+    """
+    A response body streamed into a temporary file in its destination folder, with
+    its SHA-256 and size computed on the way, so no more than one chunk is held in
+    memory. Move it into place with commit() (an atomic rename) or drop it with discard().
+    """
+
+    def __init__(self, dest_dir: Path, max_bytes: int = 0):
+        dest_dir.mkdir(parents=True, exist_ok=True)
+        # Same folder as the final file, so the rename never crosses file systems.
+        fd, name = tempfile.mkstemp(dir=dest_dir, prefix=".download-", suffix=".part")
+        self.path = Path(name)
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._file = os.fdopen(fd, "wb")
+        self._hash = hashlib.sha256()
+
+    @property
+    def sha256(self) -> str:
+        return self._hash.hexdigest()
+
+    def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.max_bytes and self.size > self.max_bytes:
+            raise DownloadTooLarge(f"Download is larger than {self.max_bytes} bytes")
+        self._hash.update(chunk)
+        self._file.write(chunk)
+
+    def close(self):
+        if not self._file.closed:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+    def commit(self, dest: Path) -> Path:
+        """Atomically moves the completed download to `dest`, replacing any previous file."""
+        self.close()
+        os.replace(self.path, dest)
+        return dest
+
+    def discard(self):
+        self._file.close()
+        self.path.unlink(missing_ok=True)
+
+def _start(dest_dir: Path, max_bytes: Optional[int], content_length: Optional[int]) -> StreamedDownload:
+    max_bytes = settings.MAX_DOWNLOAD_BYTES if max_bytes is None else max_bytes
+    if max_bytes and content_length and content_length > max_bytes:
+        raise DownloadTooLarge(f"Content-Length {content_length} is larger than {max_bytes} bytes")
+    return StreamedDownload(Path(dest_dir), max_bytes)
+
+def stream_to_temp_file(
+    chunks: Iterable[bytes], dest_dir: Path, max_bytes: Optional[int] = None, content_length: Optional[int] = None
+) -> StreamedDownload:
+    """
+    Streams a response body (e.g. requests' iter_content) to a temporary file.
+
+    Args:
+        chunks: The body, chunk by chunk.
+        dest_dir: Folder the file will be committed to.
+        max_bytes: Size limit. Defaults to MAX_DOWNLOAD_BYTES; 0 means unlimited.
+        content_length: The announced size, to refuse oversized downloads before reading them.
+
+    Returns:
+        The completed StreamedDownload, to be committed or discarded.
+
+    Raises:
+        DownloadTooLarge: The body exceeds the limit. Nothing is left on disk.
+    """
+    download = _start(dest_dir, max_bytes, content_length)
+    try:
+        for chunk in chunks:
+            download.write(chunk)
+        download.close()
+    except BaseException:
+        download.discard()
+        raise
+    return download
+
+async def astream_to_temp_file(
+    chunks: AsyncIterable[bytes], dest_dir: Path, max_bytes: Optional[int] = None, content_length: Optional[int] = None
+) -> StreamedDownload:
+    """
+    Async version of stream_to_temp_file, e.g. for httpx's aiter_bytes. File
+    operations run in worker threads so a slow disk or the final fsync never
+    blocks the event loop.
+    """
+    download = await asyncio.to_thread(_start, dest_dir, max_bytes, content_length)
+    try:
+        async for chunk in chunks:
+            await asyncio.to_thread(download.write, chunk)
+        await asyncio.to_thread(download.close)
+    except BaseException:
+        # Not awaited in a thread: on cancellation, awaiting would be interrupted before the file is removed.
+        download.discard()
+        raise
+    return download
+
+def content_length_of(headers) -> Optional[int]:
+    """The Content-Length header as an int, if present and valid."""
+    value = headers.get('content-length')
+    return int(value) if value and value.isdigit() else None
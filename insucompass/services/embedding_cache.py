@@ -0,0 +1,94 @@
+import hashlib
+import logging
+from typing import Dict, List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from insucompass.config import settings
+from insucompass.services.database import get_db_connection
+
+# Configure logging
+logging.basicConfig(level=settings.LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# SQLite's default limit on host parameters is 999; stay well below it.
+LOOKUP_BATCH_SIZE = 500
+
+def normalize_text(text: str) -> str:
+    """Collapses whitespace, which the embedding tokenizer ignores anyway."""
+    return ' '.join(text.split())
+
+def cache_key(model_name: str, text: str) -> str:
+    """Returns the embedding cache key of a text for a model."""
+    return hashlib.sha256(f"{model_name}\x00{normalize_text(text)}".encode('utf-8')).hexdigest()
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an Embeddings model with a persistent cache in the SQLite
+    `embedding_cache` table, keyed by a hash of (model name, normalized text)
+    and storing each vector as a float16 blob.
+
+    embed_documents looks up all texts of a call in bulk and only encodes the
+    misses, so re-embedding unchanged chunks after a rebuild or a chunker change
+    costs a cache lookup. Vectors are always returned at float16 precision, so a
+    text gets the same vector whether or not it was cached. Queries are not cached.
+    """
+
+    def __init__(self, inner: Embeddings, model_name: str):
+        self.inner = inner
+        self.model_name = model_name
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found: Dict[str, np.ndarray] = {}
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            for start in range(0, len(keys), LOOKUP_BATCH_SIZE):
+                batch = keys[start:start + LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                cursor.execute(f"SELECT cache_key, vector FROM embedding_cache WHERE cache_key IN ({placeholders})", batch)
+                for row in cursor.fetchall():
+                    found[row['cache_key']] = np.frombuffer(row['vector'], dtype=np.float16)
+        return found
+
+    def _store(self, entries: Dict[str, np.ndarray]):
+        with get_db_connection() as conn:
+            conn.cursor().executemany(
+                "INSERT OR REPLACE INTO embedding_cache (cache_key, model_name, dim, vector) VALUES (?, ?, ?, ?)",
+                [(key, self.model_name, vector.shape[0], vector.tobytes()) for key, vector in entries.items()]
+            )
+            conn.commit()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        keys = [cache_key(self.model_name, text) for text in texts]
+        try:
+            cached = self._lookup(list(set(keys)))
+        except Exception as e:
+            logger.warning(f"Embedding cache lookup failed, encoding everything: {e}")
+            cached = {}
+
+        # Encode each missing text once, even if it occurs several times in this call.
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = np.asarray(self.inner.embed_documents(list(missing.values())), dtype=np.float32).astype(np.float16)
+            computed = dict(zip(missing.keys(), vectors))
+            try:
+                self._store(computed)
+            except Exception as e:
+                logger.warning(f"Could not write {len(computed)} vectors to the embedding cache: {e}")
+            cached.update(computed)
+
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        logger.debug(f"Embedding cache: {len(texts) - len(missing)} hits, {len(missing)} encoded.")
+        return [cached[key].astype(np.float32).tolist() for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.inner.embed_query(text)
@@ -0,0 +1,105 @@
+import logging
+import os
+from typing import List, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from insucompass.config import settings
+
+# Configure logging
+logging.basicConfig(level=settings.LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Encode tasks handed to a worker hold this many batches, so queue overhead is paid per few batches, not per batch.
+BATCHES_PER_TASK = 4
+
+def estimate_tokens(text: str, max_tokens: int) -> int:
+    """Rough token count of a text (about four characters per token), capped at the model's truncation length."""
+    return min(len(text) // 4 + 2, max_tokens)
+
+def length_buckets(texts: List[str], token_budget: int, max_batch: int, max_tokens: int) -> List[Tuple[int, List[int]]]:
+    """
+    Groups texts, shortest first, by the batch size their length allows.
+
+    A batch is padded to its longest text, so a batch of n texts costs about
+    n * longest tokens. Each text gets the largest power-of-two batch size that
+    keeps that within `token_budget` (at most `max_batch`), and consecutive texts
+    with the same size form one bucket. Sorting first keeps texts of similar
+    length together, which is what cuts the padding.
+
+    Returns:
+        (batch_size, text indices) pairs, in ascending text length.
+    """
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    buckets: List[Tuple[int, List[int]]] = []
+    for i in order:
+        fit = max(1, min(max_batch, token_budget // estimate_tokens(texts[i], max_tokens)))
+        size = 1 << (fit.bit_length() - 1)
+        if buckets and buckets[-1][0] == size:
+            buckets[-1][1].append(i)
+        else:
+            buckets.append((size, [i]))
+    return buckets
+
+class MultiProcessEmbeddings(Embeddings):
+    """
+    Encodes documents with a sentence-transformers multi-process pool of
+    `workers` CPU processes, for bulk ingestion on many-core hosts.
+
+    Texts are sorted by length and encoded in buckets whose batch size adapts
+    to the text length (see length_buckets). Each worker gets an equal share of
+    the cores as its PyTorch thread count, so the processes do not oversubscribe
+    the CPU. Call close() to stop the worker processes.
+    """
+
+    def __init__(self, model_name: str, workers: int, token_budget: int, max_batch: int):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name, device='cpu')
+        self.workers = workers
+        self.token_budget = token_budget
+        self.max_batch = max_batch
+        self.max_tokens = self.model.max_seq_length or 512
+
+        # Worker processes are spawned and read the thread count from the environment when torch starts.
+        threads = max(1, (os.cpu_count() or workers) // workers)
+        previous = os.environ.get("OMP_NUM_THREADS")
+        os.environ["OMP_NUM_THREADS"] = str(threads)
+        try:
+            self.pool = self.model.start_multi_process_pool(target_devices=['cpu'] * workers)
+        finally:
+            if previous is None:
+                os.environ.pop("OMP_NUM_THREADS", None)
+            else:
+                os.environ["OMP_NUM_THREADS"] = previous
+        logger.info(f"Started {workers} embedding worker processes ({threads} threads each) for {model_name}.")
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Encodes texts across the pool. Returns float32 vectors in input order."""
+        vectors = None
+        for batch_size, indices in length_buckets(texts, self.token_budget, self.max_batch, self.max_tokens):
+            encoded = self.model.encode_multi_process(
+                [texts[i] for i in indices],
+                self.pool,
+                batch_size=batch_size,
+                chunk_size=batch_size * BATCHES_PER_TASK,
+            )
+            if vectors is None:
+                vectors = np.empty((len(texts), encoded.shape[1]), dtype=np.float32)
+            vectors[indices] = encoded
+        return vectors if vectors is not None else np.empty((0, 0), dtype=np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.model.encode(text).tolist()
+
+    def close(self):
+        """Stops the worker processes."""
+        if self.pool is not None:
+            self.model.stop_multi_process_pool(self.pool)
+            self.pool = None
@@ -0,0 +1,240 @@
+import asyncio
+import json
+import logging
+import socket
+import struct
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory, resource_tracker
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from insucompass.config import settings
+
+# Configure logging
+logging.basicConfig(level=settings.LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Every frame on the socket is a 4-byte big-endian length followed by a UTF-8 JSON body.
+_HEADER = struct.Struct(">I")
+
+def _attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """Attaches to a block owned by the server without letting this process's resource tracker unlink it."""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+# --- Server ---
+
+class EmbeddingServer:
+    """
+    A node-local embedding service. It loads the sentence-transformers model once
+    and serves every API worker and script process over a Unix socket.
+
+    Concurrent requests are collected for up to `window_ms` (or until
+    `max_batch` texts are queued) and encoded as one batch. Each request's
+    vectors are written into a shared memory block; only the block name
+    travels over the socket, and the block is unlinked when the client acks.
+    """
+
+    def __init__(self, socket_path: str, model_name: str, window_ms: float, max_batch: int):
+        from sentence_transformers import SentenceTransformer
+
+        self.socket_path = socket_path
+        self.model_name = model_name
+        self.window_s = window_ms / 1000
+        self.max_batch = max_batch
+        logger.info(f"Loading embedding model for the embedding server: {model_name}")
+        self.model = SentenceTransformer(model_name, device='cpu')
+        self.dim = self.model.get_sentence_embedding_dimension()
+        # Encoding runs on one thread so batches never compete for the PyTorch thread pool.
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending: asyncio.Queue = None
+        self.batches = 0
+        self.texts_encoded = 0
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            requests = [await self._pending.get()]
+            queued = len(requests[0][0])
+            deadline = loop.time() + self.window_s
+            while queued < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self._pending.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                requests.append(request)
+                queued += len(request[0])
+
+            texts = [text for request_texts, _ in requests for text in request_texts]
+            try:
+                vectors = await loop.run_in_executor(
+                    self._executor,
+                    lambda: self.model.encode(texts, batch_size=min(len(texts), 128), normalize_embeddings=False, convert_to_numpy=True)
+                )
+            except Exception as e:
+                for _, future in requests:
+                    # A client that disconnected has already cancelled its future.
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.texts_encoded += len(texts)
+            offset = 0
+            for request_texts, future in requests:
+                if not future.done():
+                    future.set_result(vectors[offset:offset + len(request_texts)])
+                offset += len(request_texts)
+
+    async def _read_frame(self, reader: asyncio.StreamReader) -> dict:
+        header = await reader.readexactly(_HEADER.size)
+        return json.loads(await reader.readexactly(_HEADER.unpack(header)[0]))
+
+    async def _write_frame(self, writer: asyncio.StreamWriter, payload: dict):
+        body = json.dumps(payload).encode('utf-8')
+        writer.write(_HEADER.pack(len(body)) + body)
+        await writer.drain()
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    message = await self._read_frame(reader)
+                except asyncio.IncompleteReadError:
+                    return
+
+                if message.get("op") == "info":
+                    await self._write_frame(writer, {"model": self.model_name, "dim": self.dim})
+                    continue
+
+                texts = message.get("texts", [])
+                future = loop.create_future()
+                await self._pending.put((texts, future))
+                try:
+                    vectors = np.ascontiguousarray(await future, dtype=np.float32)
+                except Exception as e:
+                    await self._write_frame(writer, {"error": str(e)})
+                    continue
+
+                shm = shared_memory.SharedMemory(create=True, size=max(vectors.nbytes, 1))
+                try:
+                    np.ndarray(vectors.shape, dtype=np.float32, buffer=shm.buf)[:] = vectors
+                    await self._write_frame(writer, {"shm": shm.name, "rows": vectors.shape[0], "dim": self.dim})
+                    # The client copies the vectors out, then acks so the block can be released.
+                    await self._read_frame(reader)
+                finally:
+                    shm.close()
+                    shm.unlink()
+        finally:
+            writer.close()
+
+    async def serve(self):
+        self._pending = asyncio.Queue()
+        Path(self.socket_path).unlink(missing_ok=True)
+        server = await asyncio.start_unix_server(self._handle_client, path=self.socket_path)
+        asyncio.get_running_loop().create_task(self._batch_loop())
+        logger.info(f"Embedding server listening on {self.socket_path} (window {self.window_s * 1000:.1f}ms, max batch {self.max_batch})")
+        async with server:
+            await server.serve_forever()
+
+# --- Client ---
+
+class RemoteEmbeddings(Embeddings):
+    """
+    A LangChain Embeddings client for the EmbeddingServer. Each thread keeps its
+    own socket connection, so concurrent requests from one worker are batched
+    by the server just like requests from different workers.
+    """
+
+    def __init__(self, socket_path: str, timeout: float = 60.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self) -> socket.socket:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            conn.settimeout(self.timeout)
+            conn.connect(self.socket_path)
+            self._local.conn = conn
+        return conn
+
+    def _recv_exactly(self, conn: socket.socket, size: int) -> bytes:
+        data = bytearray()
+        while len(data) < size:
+            chunk = conn.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("Embedding server closed the connection.")
+            data.extend(chunk)
+        return bytes(data)
+
+    def _request(self, payload: dict) -> Tuple[socket.socket, dict]:
+        conn = self._connection()
+        try:
+            body = json.dumps(payload).encode('utf-8')
+            conn.sendall(_HEADER.pack(len(body)) + body)
+            size = _HEADER.unpack(self._recv_exactly(conn, _HEADER.size))[0]
+            return conn, json.loads(self._recv_exactly(conn, size))
+        except (OSError, ConnectionError):
+            # Drop the broken connection so the next call reconnects.
+            self._local.conn = None
+            conn.close()
+            raise
+
+    def info(self) -> dict:
+        """Returns the model name and dimension the server is serving."""
+        return self._request({"op": "info"})[1]
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Encodes texts on the server and returns a (len(texts), dim) float32 array."""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        conn, reply = self._request({"texts": list(texts)})
+        if "error" in reply:
+            raise RuntimeError(f"Embedding server error: {reply['error']}")
+        shm = _attach_shared_memory(reply["shm"])
+        try:
+            vectors = np.ndarray((reply["rows"], reply["dim"]), dtype=np.float32, buffer=shm.buf).copy()
+        finally:
+            shm.close()
+            ack = json.dumps({"ack": reply["shm"]}).encode('utf-8')
+            conn.sendall(_HEADER.pack(len(ack)) + ack)
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.encode([text])[0].tolist()
+
+def connect_remote_embeddings(socket_path: str, expected_model: str) -> Optional[RemoteEmbeddings]:
+    """
+    Returns a RemoteEmbeddings client if a server is listening on `socket_path`
+    and serves `expected_model`, otherwise None so callers can load the model locally.
+    """
+    if not socket_path or not Path(socket_path).exists():
+        return None
+    client = RemoteEmbeddings(socket_path)
+    try:
+        info = client.info()
+    except (OSError, ConnectionError, ValueError) as e:
+        logger.warning(f"Embedding server at {socket_path} is not reachable: {e}")
+        return None
+    if info.get("model") != expected_model:
+        logger.warning(f"Embedding server serves '{info.get('model')}', expected '{expected_model}'. Not using it.")
+        return None
+    logger.info(f"Using shared embedding server at {socket_path} ({info['model']}, dim {info['dim']}).")
+    return client
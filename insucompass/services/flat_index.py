@@ -0,0 +1,337 @@
+import json
+import logging
+import mmap
+import time
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from insucompass.config import settings
+
+# Configure logging
+logging.basicConfig(level=settings.LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Metadata fields stored as dense arrays so they can be filtered without touching document records.
+FILTERABLE_FIELDS = {"source_id": np.int64, "chunk_number": np.int32}
+# Rows scored per matmul block; bounds the temporary float32 buffer to a few tens of MB.
+BLOCK_ROWS = 65536
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def maximal_marginal_relevance(query: np.ndarray, candidates: np.ndarray, k: int, lambda_mult: float) -> List[int]:
+    """Selects k indices from normalized candidate vectors using maximal marginal relevance."""
+    if len(candidates) == 0:
+        return []
+    relevance = candidates @ query
+    selected = [int(np.argmax(relevance))]
+    while len(selected) < min(k, len(candidates)):
+        redundancy = (candidates @ candidates[selected].T).max(axis=1)
+        mmr_scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        mmr_scores[selected] = -np.inf
+        selected.append(int(np.argmax(mmr_scores)))
+    return selected
+
+class FlatVectorIndex:
+    """
+    An exact-rescored, memory-mapped flat vector index.
+
+    On disk, an index directory holds:
+      - manifest.json: dimension, row count, quantization and embedding model.
+      - coarse.npy: the int8-quantized (or float16) matrix scanned for every query.
+      - scales.npy: per-row dequantization scales for the int8 matrix.
+      - vectors.npy: the normalized float32 matrix, read only for shortlisted rows.
+      - <field>.npy: dense metadata arrays used for filtering (see FILTERABLE_FIELDS).
+      - records.jsonl / offsets.npy: one JSON record (id, text, metadata) per row.
+      - ids.npy / id_rows.npy: the IDs in sorted order and the row of each, for upserts.
+
+    Everything is opened with mmap, so several API worker processes loading the
+    same directory share one copy of the pages through the OS page cache.
+    Documents added after the build are kept in a small in-memory delta that is
+    searched alongside the mapped matrix until the next rebuild. Adding an ID
+    that is already indexed replaces its row, as an upsert would.
+    """
+
+    def __init__(self, index_dir: Path):
+        self.index_dir = Path(index_dir)
+        self.manifest: Dict[str, Any] = json.loads((self.index_dir / "manifest.json").read_text())
+        self.dim = self.manifest["dim"]
+        self.quantization = self.manifest["quantization"]
+
+        self.coarse = np.load(self.index_dir / "coarse.npy", mmap_mode='r')
+        self.scales = np.load(self.index_dir / "scales.npy", mmap_mode='r') if self.quantization == "int8" else None
+        self.vectors = np.load(self.index_dir / "vectors.npy", mmap_mode='r')
+        self.fields = {name: np.load(self.index_dir / f"{name}.npy", mmap_mode='r') for name in FILTERABLE_FIELDS}
+        self.offsets = np.load(self.index_dir / "offsets.npy", mmap_mode='r')
+
+        self._records_file = open(self.index_dir / "records.jsonl", 'rb')
+        self._records = mmap.mmap(self._records_file.fileno(), 0, access=mmap.ACCESS_READ) if self.offsets[-1] > 0 else b""
+
+        # Indexes built before the ID files existed fall back to scanning the records once.
+        has_ids = (self.index_dir / "ids.npy").exists()
+        self._sorted_ids = np.load(self.index_dir / "ids.npy", mmap_mode='r') if has_ids else None
+        self._sorted_id_rows = np.load(self.index_dir / "id_rows.npy", mmap_mode='r') if has_ids else None
+
+        self._delta_vectors = np.zeros((0, self.dim), dtype=np.float32)
+        self._delta_records: List[Dict[str, Any]] = []
+        self._delta_rows: Dict[str, int] = {}
+        # Base rows replaced by the delta, built on the first add.
+        self._replaced_base: Optional[np.ndarray] = None
+        self._base_rows: Optional[Dict[str, int]] = None
+        logger.info(f"Loaded flat vector index with {len(self)} rows ({self.quantization}) from {self.index_dir}")
+
+    def __len__(self) -> int:
+        return int(self.vectors.shape[0]) + len(self._delta_records)
+
+    # --- Build ---
+
+    @classmethod
+    def build(
+        cls,
+        index_dir: Path,
+        ids: Sequence[str],
+        embeddings: np.ndarray,
+        texts: Sequence[str],
+        metadatas: Sequence[Dict[str, Any]],
+        quantization: str = "int8",
+        embedding_model: Optional[str] = None,
+    ) -> "FlatVectorIndex":
+        """Writes a new index directory from embeddings and their documents, then loads it."""
+        if quantization not in ("int8", "float16"):
+            raise ValueError(f"Unsupported quantization '{quantization}'. Use 'int8' or 'float16'.")
+        index_dir = Path(index_dir)
+        index_dir.mkdir(parents=True, exist_ok=True)
+
+        vectors = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        count, dim = vectors.shape if vectors.size else (0, 0)
+
+        if quantization == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127.0 if count else np.zeros(0, dtype=np.float32)
+            scales[scales == 0] = 1.0
+            coarse = np.round(vectors / scales[:, None]).astype(np.int8)
+            np.save(index_dir / "scales.npy", scales.astype(np.float32))
+        else:
+            coarse = vectors.astype(np.float16)
+        np.save(index_dir / "coarse.npy", coarse)
+        np.save(index_dir / "vectors.npy", vectors)
+
+        for name, dtype in FILTERABLE_FIELDS.items():
+            values = [m.get(name) for m in metadatas]
+            np.save(index_dir / f"{name}.npy", np.array([-1 if v is None else v for v in values], dtype=dtype))
+
+        offsets = [0]
+        with open(index_dir / "records.jsonl", 'wb') as f:
+            for vector_id, text, metadata in zip(ids, texts, metadatas):
+                line = json.dumps({"id": vector_id, "text": text, "metadata": metadata}).encode('utf-8') + b"\n"
+                f.write(line)
+                offsets.append(offsets[-1] + len(line))
+        np.save(index_dir / "offsets.npy", np.array(offsets, dtype=np.int64))
+
+        encoded_ids = np.array([vector_id.encode('utf-8') for vector_id in ids], dtype=bytes) if len(ids) else np.zeros(0, dtype='S1')
+        id_order = np.argsort(encoded_ids, kind='stable')
+        np.save(index_dir / "ids.npy", encoded_ids[id_order])
+        np.save(index_dir / "id_rows.npy", id_order.astype(np.int64))
+
+        manifest = {
+            "dim": dim,
+            "count": count,
+            "quantization": quantization,
+            "embedding_model": embedding_model,
+            "built_at": time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        (index_dir / "manifest.json").write_text(json.dumps(manifest, indent=2))
+        logger.info(f"Built flat vector index with {count} rows at {index_dir}")
+        return cls(index_dir)
+
+    # --- Writes ---
+
+    def _base_row_of(self, vector_id: str) -> Optional[int]:
+        if self._replaced_base is None:
+            self._replaced_base = np.zeros(self.vectors.shape[0], dtype=bool)
+        if self._sorted_ids is not None:
+            key = vector_id.encode('utf-8')
+            position = int(np.searchsorted(self._sorted_ids, key))
+            if position < len(self._sorted_ids) and self._sorted_ids[position] == key:
+                return int(self._sorted_id_rows[position])
+            return None
+        if self._base_rows is None:
+            # One pass over the records; only processes that add documents pay for it.
+            self._base_rows = {self._record(row)["id"]: row for row in range(self.vectors.shape[0])}
+        return self._base_rows.get(vector_id)
+
+    def add(self, ids: Sequence[str], embeddings: Sequence[Sequence[float]], texts: Sequence[str], metadatas: Sequence[Dict[str, Any]]):
+        """
+        Adds documents to the in-memory delta of this process. An ID that is already
+        indexed, in the mapped matrix or the delta, is replaced rather than duplicated.
+        """
+        if not len(ids):
+            return
+        matrix = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+        if self.dim == 0 and len(self) == 0:
+            # Built from an empty collection: the first batch sets the dimension.
+            self.dim = matrix.shape[1]
+            self._delta_vectors = np.zeros((0, self.dim), dtype=np.float32)
+        vectors = normalize_rows(matrix.reshape(-1, self.dim))
+
+        new_vectors = []
+        for i, vector_id in enumerate(ids):
+            record = {"id": vector_id, "text": texts[i], "metadata": metadatas[i]}
+            base_row = self._base_row_of(vector_id)
+            if base_row is not None:
+                self._replaced_base[base_row] = True
+            row = self._delta_rows.get(vector_id)
+            if row is None:
+                self._delta_rows[vector_id] = len(self._delta_records)
+                self._delta_records.append(record)
+                new_vectors.append(vectors[i])
+            elif row < len(self._delta_vectors):
+                self._delta_vectors[row] = vectors[i]
+                self._delta_records[row] = record
+            else:
+                # Repeated within this batch; the last occurrence wins.
+                new_vectors[row - len(self._delta_vectors)] = vectors[i]
+                self._delta_records[row] = record
+        if new_vectors:
+            self._delta_vectors = np.vstack([self._delta_vectors, np.asarray(new_vectors, dtype=np.float32)])
+
+    # --- Reads ---
+
+    def _record(self, row: int) -> Dict[str, Any]:
+        base_rows = self.vectors.shape[0]
+        if row >= base_rows:
+            return self._delta_records[row - base_rows]
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return json.loads(self._records[start:end])
+
+    def _vector(self, rows: np.ndarray) -> np.ndarray:
+        """Returns the exact float32 vectors for the given rows, from the mapped matrix or the delta."""
+        base_rows = self.vectors.shape[0]
+        out = np.empty((len(rows), self.dim), dtype=np.float32)
+        is_base = rows < base_rows
+        if is_base.any():
+            out[is_base] = self.vectors[rows[is_base]]
+        out[~is_base] = self._delta_vectors[rows[~is_base] - base_rows]
+        return out
+
+    def _filter_mask(self, start: int, end: int, filter: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        if not filter:
+            return None
+        mask = np.ones(end - start, dtype=bool)
+        for field, condition in filter.items():
+            if field not in self.fields:
+                raise ValueError(f"Field '{field}' is not filterable in the flat index. Filterable: {list(FILTERABLE_FIELDS)}")
+            column = self.fields[field][start:end]
+            if isinstance(condition, dict) and "$in" in condition:
+                mask &= np.isin(column, condition["$in"])
+            elif isinstance(condition, dict) and "$eq" in condition:
+                mask &= column == condition["$eq"]
+            else:
+                mask &= column == condition
+        return mask
+
+    def _delta_mask(self, filter: Optional[Dict[str, Any]]) -> np.ndarray:
+        mask = np.ones(len(self._delta_records), dtype=bool)
+        for field, condition in (filter or {}).items():
+            values = np.array([r["metadata"].get(field, -1) for r in self._delta_records])
+            if isinstance(condition, dict) and "$in" in condition:
+                mask &= np.isin(values, condition["$in"])
+            elif isinstance(condition, dict) and "$eq" in condition:
+                mask &= values == condition["$eq"]
+            else:
+                mask &= values == condition
+        return mask
+
+    def _shortlist(self, queries: np.ndarray, size: int, filter: Optional[Dict[str, Any]]) -> List[np.ndarray]:
+        """Scans the coarse matrix block by block and returns the best `size` rows per query."""
+        num_queries = queries.shape[0]
+        best_rows = [np.zeros(0, dtype=np.int64) for _ in range(num_queries)]
+        best_scores = [np.zeros(0, dtype=np.float32) for _ in range(num_queries)]
+
+        def merge(rows: np.ndarray, scores: np.ndarray):
+            # scores has shape (len(rows), num_queries)
+            for q in range(num_queries):
+                cand_rows = np.concatenate([best_rows[q], rows])
+                cand_scores = np.concatenate([best_scores[q], scores[:, q]])
+                if len(cand_rows) > size:
+                    top = np.argpartition(-cand_scores, size - 1)[:size]
+                    cand_rows, cand_scores = cand_rows[top], cand_scores[top]
+                best_rows[q], best_scores[q] = cand_rows, cand_scores
+
+        base_rows = self.coarse.shape[0]
+        for start in range(0, base_rows, BLOCK_ROWS):
+            end = min(start + BLOCK_ROWS, base_rows)
+            scores = np.asarray(self.coarse[start:end], dtype=np.float32) @ queries.T
+            if self.scales is not None:
+                scores *= np.asarray(self.scales[start:end])[:, None]
+            rows = np.arange(start, end, dtype=np.int64)
+            mask = self._filter_mask(start, end, filter)
+            if self._replaced_base is not None and self._replaced_base[start:end].any():
+                live = ~self._replaced_base[start:end]
+                mask = live if mask is None else mask & live
+            if mask is not None:
+                rows, scores = rows[mask], scores[mask]
+            merge(rows, scores)
+
+        if self._delta_records:
+            mask = self._delta_mask(filter)
+            rows = np.arange(base_rows, base_rows + len(self._delta_records), dtype=np.int64)[mask]
+            merge(rows, self._delta_vectors[mask] @ queries.T)
+        return best_rows
+
+    def search(
+        self,
+        query_embeddings: Sequence[Sequence[float]],
+        k: int = 5,
+        search_type: str = "similarity",
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        filter: Optional[Dict[str, Any]] = None,
+        oversample: int = 4,
+    ) -> List[List[Tuple[Document, float]]]:
+        """
+        Runs a batch of queries. Each query is scored against the coarse matrix
+        in one matmul per block, the shortlist is re-scored exactly with the
+        float32 vectors, and MMR is applied when search_type is 'mmr'.
+
+        Returns:
+            For each query, a list of (Document, cosine similarity) pairs.
+        """
+        if len(self) == 0:
+            return [[] for _ in query_embeddings]
+        queries = normalize_rows(np.asarray(query_embeddings, dtype=np.float32).reshape(-1, self.dim))
+        candidates = fetch_k if search_type == "mmr" else k
+        shortlists = self._shortlist(queries, max(candidates, k) * oversample, filter)
+
+        results = []
+        for query, rows in zip(queries, shortlists):
+            if len(rows) == 0:
+                results.append([])
+                continue
+            exact_vectors = self._vector(rows)
+            exact_scores = exact_vectors @ query
+            order = np.argsort(-exact_scores)[:candidates]
+            rows, exact_vectors, exact_scores = rows[order], exact_vectors[order], exact_scores[order]
+
+            if search_type == "mmr":
+                picked = maximal_marginal_relevance(query, exact_vectors, k, lambda_mult)
+            else:
+                picked = list(range(min(k, len(rows))))
+
+            hits = []
+            for i in picked:
+                record = self._record(int(rows[i]))
+                # Records of a normalized store carry no text; VectorStoreService hydrates them by id.
+                document = Document(id=record["id"], page_content=record["text"] or "", metadata=record["metadata"] or {})
+                hits.append((document, float(exact_scores[i])))
+            results.append(hits)
+        return results
+
+    def close(self):
+        if isinstance(self._records, mmap.mmap):
+            self._records.close()
+        self._records_file.close()
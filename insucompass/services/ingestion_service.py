@@ -1,14 +1,15 @@
 import logging
-from typing import List
+from typing import Dict, List, Optional
 from pathlib import Path
 from langchain_core.documents import Document
-import hashlib
 
 from insucompass.config import settings
-from insucompass.services.database import find_or_create_web_source
-from insucompass.services.vector_store import vector_store_service
+from insucompass.services import kb_versions
+from insucompass.services.chunk_store import INSERT_CHUNK_QUERY, chunk_row, set_source_chunk_count
+from insucompass.services.database import find_or_create_web_source, get_db_connection
+from insucompass.services.vector_store import content_addressed_ids, vector_store_service
 
-from scripts.data_processing.chunker import chunk_text
+from scripts.data_processing.chunker import chunk_texts
 from scripts.data_processing.document_loader import load_document
 
 # Configure logging
@@ -32,6 +33,8 @@ class IngestionService:
         logger.info(f"Starting dynamic ingestion of {len(documents_from_search)} documents...")
         
         all_chunks_to_embed = []
+        chunks_by_source = {}
+        loaded = []
 
         for doc_meta in documents_from_search:
             source_url = doc_meta.metadata.get("source_url")
@@ -44,7 +47,7 @@ class IngestionService:
 
             # 1. Register the source in SQLite to get a source_id
             try:
-                source_id = find_or_create_web_source(url=source_url, name=source_name)
+                source_id = find_or_create_web_source(url=source_url, name=source_name, local_path=local_path_str)
             except Exception as e:
                 logger.error(f"Failed to register source {source_url} in database: {e}")
                 continue
@@ -55,30 +58,52 @@ class IngestionService:
             if not full_doc:
                 logger.warning(f"Could not load content from local path {local_path_str}. Skipping.")
                 continue
+            loaded.append((source_id, source_url, source_name, local_path_str, full_doc, doc_meta.metadata))
 
-            # 3. Chunk the full document
-            chunks = chunk_text(full_doc, doc_meta.metadata)
-            
+        # 3. Chunk all documents together, so the tokenizer sees one batch
+        chunked = chunk_texts([full_doc for *_, full_doc, _ in loaded], [metadata for *_, metadata in loaded])
+
+        for (source_id, source_url, source_name, local_path_str, _, _), chunks in zip(loaded, chunked):
             # 4. Enrich metadata for each chunk
-            for i, chunk in enumerate(chunks):
-                hash_id = hashlib.md5(f"{source_url}_{i}".encode()).hexdigest()
-                chunk_id = f"dynamic_{hash_id}"
-                
+            for chunk in chunks:
                 chunk.metadata['source_id'] = source_id
-                chunk.metadata['chunk_id'] = chunk_id
                 chunk.metadata['source_url'] = source_url
                 chunk.metadata['source_name'] = source_name
                 chunk.metadata['source_local_path'] = local_path_str
-                
+
+            # Content-addressed IDs make a repeated search hit on the same URL an upsert, not a copy.
+            for chunk, chunk_id in zip(chunks, content_addressed_ids(chunks)):
+                chunk.metadata['chunk_id'] = chunk_id
                 all_chunks_to_embed.append(chunk)
+            chunks_by_source[source_id] = chunks
 
         # 5. Embed and store in ChromaDB
         if all_chunks_to_embed:
             logger.info(f"Embedding and storing {len(all_chunks_to_embed)} new chunks in ChromaDB.")
             try:
-                vector_store_service.add_documents(all_chunks_to_embed)
+                version = vector_store_service.active_version
+                vector_store_service.add_documents(
+                    all_chunks_to_embed, version=version, ids=[chunk.metadata['chunk_id'] for chunk in all_chunks_to_embed]
+                )
+                self._store_chunk_rows(chunks_by_source, kb_versions.db_version_for(version))
                 logger.info("Dynamic ingestion completed successfully.")
             except Exception as e:
                 logger.error(f"Failed to add chunks to vector store during dynamic ingestion: {e}")
         else:
-            logger.info("No chunks generated during dynamic ingestion.")
\ No newline at end of file
+            logger.info("No chunks generated during dynamic ingestion.")
+
+    def _store_chunk_rows(self, chunks_by_source: Dict[int, List[Document]], db_version: Optional[str]):
+        """
+        Writes the knowledge_chunks rows retrieval reads chunk text from, replacing
+        the rows of a source that was ingested before.
+        """
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            for source_id, chunks in chunks_by_source.items():
+                cursor.execute("DELETE FROM knowledge_chunks WHERE source_id = ? AND kb_version IS ?", (source_id, db_version))
+                cursor.executemany(
+                    INSERT_CHUNK_QUERY,
+                    [chunk_row(source_id, chunk, chunk.metadata['chunk_id'], db_version) for chunk in chunks]
+                )
+                set_source_chunk_count(source_id, len(chunks), cursor=cursor)
+            conn.commit()
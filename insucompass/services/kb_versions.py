@@ -0,0 +1,159 @@
+import json
+import logging
+import os
+import re
+import shutil
+import time
+from pathlib import Path
+from typing import Optional, List, Dict, Any
+
+from insucompass.config import settings
+from insucompass.services.database import apply_journal_outcomes, get_latest_rebuild_run, get_unpromotable_journal_entries
+
+# Configure logging
+logging.basicConfig(level=settings.LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# The knowledge base that existed before versioning is served as this version.
+LEGACY_VERSION = "legacy"
+VERSION_SEPARATOR = "__"
+# Collections created before versions recorded their embedding model were all built with this one.
+LEGACY_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+def model_slug(model_name: str) -> str:
+    """Shortens an embedding model name to a collection-name-safe slug, e.g. 'all-minilm-l6-v2'."""
+    return re.sub(r"[^a-z0-9]+", "-", model_name.rsplit("/", 1)[-1].lower()).strip("-")
+
+def new_version_name(embedding_model: Optional[str] = None) -> str:
+    """
+    Returns a new, sortable version name based on the current time, namespaced by
+    the embedding model its vectors are computed with (e.g. 'v20250101120000-all-minilm-l6-v2').
+    """
+    name = time.strftime("v%Y%m%d%H%M%S")
+    return f"{name}-{model_slug(embedding_model)}" if embedding_model else name
+
+def collection_metadata(embedding_model: str, dimension: Optional[int] = None) -> Dict[str, Any]:
+    """The Chroma collection metadata recording which embedding model a version's vectors come from."""
+    metadata: Dict[str, Any] = {"embedding_model": embedding_model}
+    if dimension:
+        metadata["embedding_dimension"] = dimension
+    return metadata
+
+def embedding_model_of(collection) -> str:
+    """The embedding model a version's collection was built with."""
+    return (collection.metadata or {}).get("embedding_model") or LEGACY_EMBEDDING_MODEL
+
+def collection_name_for(version: Optional[str]) -> str:
+    """Maps a knowledge base version to its Chroma collection name."""
+    if not version or version == LEGACY_VERSION:
+        return settings.KB_COLLECTION_NAME
+    return f"{settings.KB_COLLECTION_NAME}{VERSION_SEPARATOR}{version}"
+
+def flat_index_dir_for(version: Optional[str]) -> Path:
+    """Maps a knowledge base version to its flat index directory."""
+    base = Path(settings.FLAT_INDEX_PATH)
+    if not version or version == LEGACY_VERSION:
+        return base
+    return base.with_name(f"{base.name}{VERSION_SEPARATOR}{version}")
+
+def db_version_for(version: Optional[str]) -> Optional[str]:
+    """Maps a knowledge base version to the value stored in knowledge_chunks.kb_version."""
+    return None if not version or version == LEGACY_VERSION else version
+
+def read_active_version() -> Dict[str, Any]:
+    """Reads the active version pointer. Without a pointer file the legacy collection is active."""
+    path = Path(settings.KB_ACTIVE_VERSION_FILE)
+    try:
+        return json.loads(path.read_text())
+    except FileNotFoundError:
+        return {"version": LEGACY_VERSION}
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not read active version file {path}: {e}. Using legacy collection.")
+        return {"version": LEGACY_VERSION}
+
+def write_active_version(version: str, **extra: Any):
+    """Atomically points the knowledge base at `version` (write to a temp file, then rename)."""
+    path = Path(settings.KB_ACTIVE_VERSION_FILE)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    pointer = {"version": version, "promoted_at": time.strftime('%Y-%m-%d %H:%M:%S'), **extra}
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(pointer, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    logger.info(f"Knowledge base version '{version}' is now active.")
+
+def promote_version(version: str, **extra: Any):
+    """
+    Makes a version active. A version built by a --rebuild run is only promoted
+    once the run completed with every source ingested or skipped as a duplicate;
+    the per-source outcomes the run journaled are then applied to data_sources,
+    which always describe the version being served.
+
+    Raises:
+        ValueError: The version's rebuild run is unfinished or has sources that failed.
+    """
+    run = get_latest_rebuild_run(version)
+    if run is not None:
+        if run['status'] != 'completed':
+            raise ValueError(f"The rebuild of version '{version}' (run {run['id']}) has not completed. Resume it with --resume.")
+        unfinished = get_unpromotable_journal_entries(run['id'])
+        if unfinished:
+            raise ValueError(
+                f"Version '{version}' is missing {len(unfinished)} sources that failed to ingest "
+                f"(e.g. source_id {unfinished[0]['source_id']}: {unfinished[0]['status'] or unfinished[0]['stage']})."
+            )
+        applied = apply_journal_outcomes(run['id'])
+        logger.info(f"Applied the outcomes of {applied} sources of rebuild run {run['id']} to data_sources.")
+    write_active_version(version, **extra)
+
+def list_versions(client) -> List[str]:
+    """Lists all knowledge base versions present in Chroma, oldest first."""
+    prefix = f"{settings.KB_COLLECTION_NAME}{VERSION_SEPARATOR}"
+    versions = []
+    for collection in client.list_collections():
+        name = collection if isinstance(collection, str) else collection.name
+        if name == settings.KB_COLLECTION_NAME:
+            versions.append(LEGACY_VERSION)
+        elif name.startswith(prefix):
+            versions.append(name[len(prefix):])
+    # The legacy collection always predates the timestamped versions.
+    return sorted(versions, key=lambda v: "" if v == LEGACY_VERSION else v)
+
+def garbage_collect(client, keep: int = None) -> List[str]:
+    """
+    Deletes old knowledge base versions, keeping the active version and the
+    `keep` most recent ones. Removes the Chroma collection, the flat index
+    directory, the version's knowledge_chunks rows, its near-duplicate index and
+    finished re-embed jobs involving it. Versions a running re-embed job reads
+    from or writes to are kept.
+
+    Returns:
+        The versions that were deleted.
+    """
+    from insucompass.services.database import (
+        delete_chunks_for_version, delete_near_duplicate_entries, delete_reembed_jobs_for_version, get_running_reembed_jobs
+    )
+
+    keep = settings.KB_VERSIONS_TO_KEEP if keep is None else keep
+    active = read_active_version()["version"]
+    versions = list_versions(client)
+    retained = set(versions[-keep:]) if keep > 0 else set()
+    retained.add(active)
+    # Both sides of a running re-embed job are in use.
+    for job in get_running_reembed_jobs():
+        retained.update((job['source_version'], job['target_version']))
+
+    deleted = []
+    for version in versions:
+        if version in retained:
+            continue
+        logger.info(f"Garbage-collecting knowledge base version '{version}'...")
+        client.delete_collection(collection_name_for(version))
+        shutil.rmtree(flat_index_dir_for(version), ignore_errors=True)
+        delete_chunks_for_version(db_version_for(version))
+        delete_near_duplicate_entries(version)
+        delete_reembed_jobs_for_version(version)
+        deleted.append(version)
+    return deleted
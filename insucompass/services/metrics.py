@@ -0,0 +1,68 @@
+import threading
+from collections import defaultdict, deque
+from typing import Dict, Any
+
+class _TimingStats:
+    """Running statistics for a single timing series, in milliseconds."""
+
+    def __init__(self, window: int = 1024):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value_ms: float):
+        self.count += 1
+        self.total_ms += value_ms
+        self.max_ms = max(self.max_ms, value_ms)
+        self.recent.append(value_ms)
+
+    def _percentile(self, pct: float) -> float:
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": round(self._percentile(50), 3),
+            "p95_ms": round(self._percentile(95), 3),
+            "max_ms": round(self.max_ms, 3),
+        }
+
+class MetricsRegistry:
+    """
+    A minimal, thread-safe, in-process metrics registry holding counters and
+    timing series. Each API worker process keeps its own registry.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = defaultdict(int)
+        self._timings: Dict[str, _TimingStats] = defaultdict(_TimingStats)
+
+    def increment(self, name: str, value: int = 1):
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name: str, value_ms: float):
+        with self._lock:
+            self._timings[name].observe(value_ms)
+
+    def get_counter(self, name: str) -> int:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Returns a JSON-serialisable copy of all counters and timing series."""
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "timings": {name: stats.to_dict() for name, stats in self._timings.items()},
+            }
+
+# Singleton instance
+metrics = MetricsRegistry()
@@ -0,0 +1,102 @@
+import logging
+import time
+from typing import List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from insucompass.config import settings
+from insucompass.services.metrics import metrics
+
+# Configure logging
+logging.basicConfig(level=settings.LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+class RerankerService:
+    """
+    An optional second-stage ranker. It scores (query, passage) pairs with a
+    small CPU cross-encoder in batches and keeps the top-n documents, but only
+    while it stays inside a per-request millisecond budget. If the budget would
+    be exceeded, the original retrieval order is returned unchanged.
+    """
+
+    def __init__(self):
+        """Initializes the RerankerService, loading the model only when enabled."""
+        self.enabled = settings.RERANK_ENABLED
+        self.top_n = settings.RERANK_TOP_N
+        self.budget_ms = settings.RERANK_BUDGET_MS
+        self.batch_size = settings.RERANK_BATCH_SIZE
+        self.model = None
+
+        if self.enabled:
+            try:
+                from sentence_transformers import CrossEncoder
+                logger.info(f"Loading rerank model: {settings.RERANK_MODEL_NAME}")
+                self.model = CrossEncoder(settings.RERANK_MODEL_NAME, device='cpu', max_length=512)
+            except Exception as e:
+                logger.error(f"Failed to load rerank model, reranking disabled: {e}")
+                self.enabled = False
+
+    def rerank(
+        self,
+        query: str,
+        documents: List[Document],
+        passage_separator: Optional[str] = None
+    ) -> Tuple[List[Document], bool]:
+        """
+        Reranks documents against the query within the configured budget.
+
+        Args:
+            query: The query the documents were retrieved for.
+            documents: The fused candidate documents.
+            passage_separator: If given, each document is split into passages on
+                this separator and scored by its best passage. This suits merged
+                documents whose text exceeds the cross-encoder's input length.
+
+        Returns:
+            A tuple of (documents, applied). When applied is False the documents
+            are returned in their original order.
+        """
+        if not self.enabled or not self.model or not documents:
+            return documents, False
+
+        pairs: List[Tuple[int, str]] = []
+        for doc_index, doc in enumerate(documents):
+            passages = doc.page_content.split(passage_separator) if passage_separator else [doc.page_content]
+            pairs.extend((doc_index, passage) for passage in passages if passage.strip())
+
+        start = time.perf_counter()
+        scores: List[float] = []
+        slowest_batch_ms = 0.0
+        for offset in range(0, len(pairs), self.batch_size):
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            # Stop before a batch that would likely push us over the budget.
+            if elapsed_ms + slowest_batch_ms > self.budget_ms:
+                logger.warning(f"Rerank budget of {self.budget_ms}ms exceeded after {elapsed_ms:.1f}ms. Keeping retrieval order.")
+                metrics.increment("rerank.budget_exceeded")
+                metrics.observe("rerank.latency", elapsed_ms)
+                return documents, False
+
+            batch_start = time.perf_counter()
+            batch = pairs[offset:offset + self.batch_size]
+            scores.extend(float(s) for s in self.model.predict([(query, passage) for _, passage in batch]))
+            slowest_batch_ms = max(slowest_batch_ms, (time.perf_counter() - batch_start) * 1000)
+
+        best_scores = [float('-inf')] * len(documents)
+        for (doc_index, _), score in zip(pairs, scores):
+            best_scores[doc_index] = max(best_scores[doc_index], score)
+
+        ranked = sorted(zip(documents, best_scores), key=lambda item: item[1], reverse=True)[:self.top_n]
+        reranked_docs = []
+        for doc, score in ranked:
+            metadata = doc.metadata.copy()
+            metadata["rerank_score"] = score
+            reranked_docs.append(Document(page_content=doc.page_content, metadata=metadata))
+
+        latency_ms = (time.perf_counter() - start) * 1000
+        metrics.increment("rerank.applied")
+        metrics.observe("rerank.latency", latency_ms)
+        logger.info(f"Reranked {len(documents)} documents ({len(pairs)} passages) to top {len(reranked_docs)} in {latency_ms:.1f}ms.")
+        return reranked_docs, True
+
+# Singleton instance
+reranker_service = RerankerService()
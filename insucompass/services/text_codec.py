@@ -0,0 +1,30 @@
+import zlib
+from typing import Optional
+
+try:
+    import zstandard
+except ImportError:  # zlib is always available; stored values record which codec they use.
+    zstandard = None
+
+def best_codec() -> str:
+    """The strongest codec available here: zstd if zstandard is installed, zlib otherwise."""
+    return "zstd" if zstandard is not None else "zlib"
+
+def compress_text(text: str, codec: str) -> bytes:
+    """Compresses UTF-8 text with 'zstd' or 'zlib'."""
+    data = text.encode('utf-8')
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    if codec == "zlib":
+        return zlib.compress(data, 6)
+    raise ValueError(f"Unknown text codec '{codec}'")
+
+def decompress_text(blob: bytes, codec: str) -> Optional[str]:
+    """Inverse of compress_text. Returns None if the codec is not available here."""
+    if codec == "zstd":
+        if zstandard is None:
+            return None
+        return zstandard.ZstdDecompressor().decompress(blob).decode('utf-8')
+    if codec == "zlib":
+        return zlib.decompress(blob).decode('utf-8')
+    return None
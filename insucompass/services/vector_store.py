@@ -1,61 +1,291 @@
 import logging
+import os
+import hashlib
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
 import chromadb
-# from langchain_community.vectorstores import Chroma
-from langchain_chroma import Chroma
+import numpy as np
 from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
 # from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_huggingface import HuggingFaceEmbeddings
 
-from typing import List
+from typing import List, Dict, Any, Optional
 from langchain_core.documents import Document
 
 from ..config import settings
+from . import kb_versions
+from .chunk_store import hydrate_documents, vector_metadata
+from .embedding_cache import CachedEmbeddings
+from .embedding_pool import MultiProcessEmbeddings
+from .embedding_server import connect_remote_embeddings
+from .flat_index import maximal_marginal_relevance, normalize_rows
 
 logger = logging.getLogger(__name__)
 
 # Use a local, open-source embedding model for cost-effectiveness and privacy.
-EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+# New versions are built with this model; each version is queried with the model recorded on its collection.
+EMBEDDING_MODEL_NAME = settings.EMBEDDING_MODEL_NAME
 # Define the path for the persistent ChromaDB store
-CHROMA_PATH = "data/vector_store"
+CHROMA_PATH = settings.CHROMA_PATH
+
+def content_addressed_ids(documents: List[Document]) -> List[str]:
+    """
+    Derives a deterministic vector ID for each chunk from its source URL, its text and
+    how often the same text already occurred earlier in the list. Re-adding the same
+    chunks therefore upserts the existing vectors instead of inserting copies.
+    """
+    seen = Counter()
+    ids = []
+    for doc in documents:
+        key = (doc.metadata.get("source_url") or "", doc.page_content)
+        occurrence = seen[key]
+        seen[key] += 1
+        digest = hashlib.sha256(f"{key[0]}\x00{occurrence}\x00{key[1]}".encode('utf-8')).hexdigest()
+        ids.append(digest[:32])
+    return ids
+
+class VectorStoreRetriever(BaseRetriever):
+    """
+    A LangChain retriever that delegates to VectorStoreService.search, so it works
+    with whichever vector backend the service is configured with.
+    """
+    service: Any
+    search_type: str = "mmr"
+    search_kwargs: Dict[str, Any] = {}
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.service.search(query, search_type=self.search_type, **self.search_kwargs)
+
+    def batch(self, inputs: List[str], config=None, *, return_exceptions: bool = False, **kwargs) -> List[List[Document]]:
+        """Runs all queries in one backend call, letting the flat index score them in a single matmul."""
+        try:
+            return self.service.search_batch(inputs, search_type=self.search_type, **self.search_kwargs)
+        except Exception as e:
+            if return_exceptions:
+                return [e] * len(inputs)
+            raise
+
+class _ActiveStore:
+    """The set of handles serving one knowledge base version. Swapped as a single reference."""
+
+    def __init__(self, version: str, collection, embedding_model: str, query_encoder: Embeddings, flat_index=None):
+        self.version = version
+        self.collection = collection
+        self.embedding_model = embedding_model
+        self.query_encoder = query_encoder
+        self.flat_index = flat_index
 
 class VectorStoreService:
     def __init__(self):
         """Initializes the VectorStoreService."""
         self.client = chromadb.PersistentClient(path=CHROMA_PATH)
-        self.embedding_function = self._get_embedding_function()
-        self.collection_name = "insucompass_kb"
-        
-        # Get or create the collection
-        self.collection = self.client.get_or_create_collection(
-            name=self.collection_name,
-            embedding_function=None # LangChain's wrapper handles this
+        # Loaded embedding models by name. The raw model encodes queries; document embeddings go through the cache.
+        self._encoders: Dict[str, Embeddings] = {}
+        self._document_encoders: Dict[str, Embeddings] = {}
+        self._encoders_lock = threading.Lock()
+        self.backend = settings.VECTOR_BACKEND
+
+        self._swap_lock = threading.Lock()
+        self._pointer_mtime = None
+        self._last_pointer_check = 0.0
+        self._active = self._open_version(kb_versions.read_active_version()["version"])
+        self._pointer_mtime = self._read_pointer_mtime()
+
+    # --- Active version handles ---
+    # Readers take one reference to self._active per call, so a swap never mixes versions mid-query.
+
+    @property
+    def active_version(self) -> str:
+        return self._active.version
+
+    @property
+    def collection_name(self) -> str:
+        return kb_versions.collection_name_for(self._active.version)
+
+    @property
+    def collection(self):
+        return self._active.collection
+
+    @property
+    def flat_index(self):
+        return self._active.flat_index
+
+    @property
+    def embedding_model(self) -> str:
+        """The embedding model of the active version."""
+        return self._active.embedding_model
+
+    @property
+    def query_encoder(self) -> Embeddings:
+        return self._active.query_encoder
+
+    @property
+    def embedding_function(self) -> Embeddings:
+        """Encodes documents for the active version (through the embedding cache, if enabled)."""
+        return self.document_encoder(self._active.embedding_model)
+
+    def _open_version(self, version: str) -> _ActiveStore:
+        """Opens the Chroma collection (and flat index, if configured) of a knowledge base version."""
+        collection_name = kb_versions.collection_name_for(version)
+        collection = self.client.get_or_create_collection(
+            name=collection_name,
+            # Only recorded if the collection is created here; existing collections keep their model.
+            metadata=kb_versions.collection_metadata(EMBEDDING_MODEL_NAME),
+            embedding_function=None # Vectors are always computed by the service
+        )
+        embedding_model = kb_versions.embedding_model_of(collection)
+        query_encoder = self.encoder(embedding_model)
+        flat_index = self._load_flat_index(version) if self.backend == "flat" else None
+        logger.info(f"ChromaDB service initialized. Collection '{collection_name}' (version '{version}', {embedding_model}) at {CHROMA_PATH}")
+        return _ActiveStore(version, collection, embedding_model, query_encoder, flat_index)
+
+    def create_version(self, version: str, embedding_model: str = EMBEDDING_MODEL_NAME):
+        """
+        Creates the collection of a new knowledge base version, recording the embedding
+        model its vectors are computed with. Re-creating an existing version is a no-op,
+        but only with the same model.
+        """
+        if version in kb_versions.list_versions(self.client):
+            existing = self.embedding_model_for(version)
+            if existing != embedding_model:
+                raise ValueError(f"Version '{version}' is embedded with {existing}, not {embedding_model}.")
+            return
+        self.client.create_collection(
+            name=kb_versions.collection_name_for(version),
+            metadata=kb_versions.collection_metadata(embedding_model),
+            embedding_function=None
         )
-        
-        self.langchain_chroma = Chroma(
-            client=self.client,
-            collection_name=self.collection_name,
-            embedding_function=self.embedding_function,
+        logger.info(f"Created knowledge base version '{version}' for embedding model {embedding_model}.")
+
+    def embedding_model_for(self, version: Optional[str] = None) -> str:
+        """The embedding model of a version. Defaults to the active version."""
+        if version is None or version == self._active.version:
+            return self._active.embedding_model
+        return kb_versions.embedding_model_of(self.get_collection(version))
+
+    def get_collection(self, version: Optional[str] = None):
+        """Returns the collection of a version, creating it if needed. Defaults to the active version."""
+        if version is None or version == self._active.version:
+            return self._active.collection
+        return self.client.get_or_create_collection(
+            name=kb_versions.collection_name_for(version),
+            metadata=kb_versions.collection_metadata(EMBEDDING_MODEL_NAME),
+            embedding_function=None
         )
-        logger.info(f"ChromaDB service initialized. Collection '{self.collection_name}' at {CHROMA_PATH}")
 
-    def _get_embedding_function(self) -> Embeddings:
-        """Initializes and returns the embedding model."""
-        logger.info(f"Loading embedding model: {EMBEDDING_MODEL_NAME}")
+    def activate_version(self, version: str):
+        """Switches queries to another knowledge base version with a single reference swap."""
+        with self._swap_lock:
+            if version == self._active.version:
+                return
+            new_store = self._open_version(version)
+            previous = self._active
+            self._active = new_store
+            logger.info(f"Vector store switched from version '{previous.version}' to '{version}'.")
+
+    def reload(self) -> str:
+        """Re-reads the active version pointer and switches to it if it changed."""
+        self.activate_version(kb_versions.read_active_version()["version"])
+        self._pointer_mtime = self._read_pointer_mtime()
+        return self._active.version
+
+    def _read_pointer_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(settings.KB_ACTIVE_VERSION_FILE).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def _watch_active_version(self):
+        """Cheap file watch: at most once per interval, reloads if the pointer file changed."""
+        now = time.monotonic()
+        if now - self._last_pointer_check < settings.KB_WATCH_INTERVAL_SECONDS:
+            return
+        self._last_pointer_check = now
+        if self._read_pointer_mtime() != self._pointer_mtime:
+            try:
+                self.reload()
+            except Exception as e:
+                logger.error(f"Failed to switch to the new knowledge base version: {e}")
+
+    def _get_embedding_function(self, model_name: str) -> Embeddings:
+        """Initializes and returns an embedding model, preferring the shared embedding server when it serves that model."""
+        remote = connect_remote_embeddings(settings.EMBEDDING_SERVER_SOCKET, model_name)
+        if remote is not None:
+            return remote
+
+        logger.info(f"Loading embedding model: {model_name}")
         # Specify 'mps' for Apple Silicon, 'cuda' for NVIDIA, or 'cpu'
-        model_kwargs = {'device': 'cpu'} 
+        model_kwargs = {'device': 'cpu'}
         encode_kwargs = {'normalize_embeddings': False}
         return HuggingFaceEmbeddings(
-            model_name=EMBEDDING_MODEL_NAME,
+            model_name=model_name,
             model_kwargs=model_kwargs,
             encode_kwargs=encode_kwargs
         )
 
-    def add_documents(self, documents: List[Document]) -> List[str]:
+    def encoder(self, model_name: str) -> Embeddings:
+        """Returns the raw embedding model of a name, loading it on first use."""
+        with self._encoders_lock:
+            if model_name not in self._encoders:
+                self._encoders[model_name] = self._get_embedding_function(model_name)
+            return self._encoders[model_name]
+
+    def document_encoder(self, model_name: str) -> Embeddings:
+        """Returns the Embeddings documents are encoded with for a model: cached if the embedding cache is enabled."""
+        if not settings.EMBEDDING_CACHE_ENABLED:
+            return self.encoder(model_name)
+        if model_name not in self._document_encoders:
+            self._document_encoders[model_name] = CachedEmbeddings(self.encoder(model_name), model_name)
+        return self._document_encoders[model_name]
+
+    @contextmanager
+    def bulk_embedding(self, workers: int, embedding_model: Optional[str] = None):
         """
-        Adds a list of documents to the Chroma vector store.
+        Provides document embedding through a pool of `workers` encode processes for
+        the duration of the block, for bulk ingestion. With fewer than two workers
+        the regular document encoder of the model is used.
+
+        Args:
+            workers: Number of encode processes.
+            embedding_model: The model to encode with. Defaults to the active version's model.
+
+        Yields:
+            The Embeddings to encode documents with (cached if the embedding cache is enabled).
+        """
+        embedding_model = embedding_model or self._active.embedding_model
+        if workers < 2:
+            yield self.document_encoder(embedding_model)
+            return
+        encoder = MultiProcessEmbeddings(
+            embedding_model, workers, settings.EMBEDDING_BATCH_TOKENS, settings.EMBEDDING_MAX_BATCH
+        )
+        try:
+            yield CachedEmbeddings(encoder, embedding_model) if settings.EMBEDDING_CACHE_ENABLED else encoder
+        finally:
+            encoder.close()
+
+    def _load_flat_index(self, version: str):
+        """Loads the memory-mapped flat index of a version, or None (Chroma fallback) if it has not been built."""
+        from insucompass.services.flat_index import FlatVectorIndex
+
+        index_dir = kb_versions.flat_index_dir_for(version)
+        if not (index_dir / "manifest.json").exists():
+            logger.error(f"Flat index not found at {index_dir}. Run scripts/build_flat_index.py. Falling back to Chroma.")
+            return None
+        return FlatVectorIndex(index_dir)
+
+    def add_documents(self, documents: List[Document], version: Optional[str] = None, ids: Optional[List[str]] = None) -> List[str]:
+        """
+        Upserts a list of documents into the Chroma vector store.
 
         Args:
             documents: A list of LangChain Document objects.
+            version: The knowledge base version to write to. Defaults to the active version.
+            ids: Vector IDs to use. Defaults to content-addressed IDs, so adding the same chunks twice is a no-op.
 
         Returns:
             A list of vector IDs for the added documents.
@@ -63,19 +293,133 @@ class VectorStoreService:
         if not documents:
             logger.warning("No documents provided to add to the vector store.")
             return []
-            
+
         logger.info(f"Adding {len(documents)} documents to the vector store...")
         try:
-            vector_ids = self.langchain_chroma.add_documents(documents)
+            texts = [doc.page_content for doc in documents]
+            embeddings = self.document_encoder(self.embedding_model_for(version)).embed_documents(texts)
+            vector_ids = self.add_embedded_documents(documents, embeddings, version=version, ids=ids)
             logger.info(f"Successfully added {len(documents)} documents.")
             return vector_ids
         except Exception as e:
             logger.error(f"Failed to add documents to vector store: {e}")
             raise
 
-    def get_retriever(self, search_kwargs={'k': 5}):
+    def add_embedded_documents(
+        self,
+        documents: List[Document],
+        embeddings: List[List[float]],
+        version: Optional[str] = None,
+        ids: Optional[List[str]] = None
+    ) -> List[str]:
+        """
+        Upserts documents with precomputed embeddings into Chroma and, if loaded, the flat index delta.
+
+        With SLIM_VECTOR_STORE, only the vectors, their IDs and the filterable metadata
+        fields are stored; text and the remaining metadata live in SQLite (see chunk_store),
+        so callers must also write the knowledge_chunks rows.
+        """
+        vector_ids = list(ids) if ids is not None else content_addressed_ids(documents)
+        if settings.SLIM_VECTOR_STORE:
+            texts = None
+            metadatas = [vector_metadata(doc.metadata) for doc in documents]
+        else:
+            texts = [doc.page_content for doc in documents]
+            metadatas = [doc.metadata for doc in documents]
+        store = self._active
+        if version is None or version == store.version:
+            store.collection.upsert(ids=vector_ids, embeddings=embeddings, documents=texts, metadatas=metadatas)
+            if store.flat_index is not None:
+                store.flat_index.add(vector_ids, embeddings, texts or [None] * len(vector_ids), metadatas)
+        else:
+            self.get_collection(version).upsert(ids=vector_ids, embeddings=embeddings, documents=texts, metadatas=metadatas)
+        return vector_ids
+
+    def update_metadatas(self, vector_ids: List[str], metadatas: List[Dict[str, Any]], version: Optional[str] = None):
+        """Replaces the metadata of existing vectors without re-embedding them."""
+        if vector_ids:
+            if settings.SLIM_VECTOR_STORE:
+                metadatas = [vector_metadata(metadata) for metadata in metadatas]
+            self.get_collection(version).update(ids=vector_ids, metadatas=metadatas)
+
+    def delete_documents(self, vector_ids: List[str], version: Optional[str] = None):
+        """
+        Deletes vectors from the Chroma collection of a version. A built flat index
+        keeps them until it is rebuilt from Chroma.
+        """
+        if vector_ids:
+            self.get_collection(version).delete(ids=vector_ids)
+            logger.info(f"Deleted {len(vector_ids)} stale vectors.")
+
+    def search_batch(
+        self,
+        queries: List[str],
+        search_type: str = "mmr",
+        k: int = 5,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        filter: Optional[Dict[str, Any]] = None,
+    ) -> List[List[Document]]:
+        """
+        Runs several queries against the configured backend in one batch and
+        hydrates the hits with their text and metadata from SQLite.
+        """
+        self._watch_active_version()
+        store = self._active
+        query_embeddings = store.query_encoder.embed_documents(queries)
+        if store.flat_index is not None:
+            results = store.flat_index.search(
+                query_embeddings, k=k, search_type=search_type,
+                fetch_k=fetch_k, lambda_mult=lambda_mult, filter=filter
+            )
+            doc_lists = [[doc for doc, _ in hits] for hits in results]
+        else:
+            doc_lists = self._search_chroma(store, query_embeddings, search_type, k, fetch_k, lambda_mult, filter)
+        db_version = kb_versions.db_version_for(store.version)
+        return [hydrate_documents(docs, db_version) for docs in doc_lists]
+
+    def _search_chroma(
+        self,
+        store: _ActiveStore,
+        query_embeddings: List[List[float]],
+        search_type: str,
+        k: int,
+        fetch_k: int,
+        lambda_mult: float,
+        filter: Optional[Dict[str, Any]],
+    ) -> List[List[Document]]:
+        """Queries the Chroma collection for all queries in one call, applying MMR when search_type is 'mmr'."""
+        mmr = search_type == "mmr"
+        include = ["documents", "metadatas", "distances"] + (["embeddings"] if mmr else [])
+        results = store.collection.query(
+            query_embeddings=query_embeddings,
+            n_results=fetch_k if mmr else k,
+            where=filter or None,
+            include=include,
+        )
+        doc_lists = []
+        for i, query_embedding in enumerate(query_embeddings):
+            ids = results["ids"][i]
+            if mmr and ids:
+                candidates = normalize_rows(np.asarray(results["embeddings"][i], dtype=np.float32))
+                query = normalize_rows(np.asarray([query_embedding], dtype=np.float32))[0]
+                picked = maximal_marginal_relevance(query, candidates, k, lambda_mult)
+            else:
+                picked = range(len(ids))
+            doc_lists.append([
+                Document(id=ids[j], page_content=results["documents"][i][j] or "", metadata=results["metadatas"][i][j] or {})
+                for j in picked
+            ])
+        return doc_lists
+
+    def search(self, query: str, **kwargs) -> List[Document]:
+        """Runs a single query against the configured backend."""
+        return self.search_batch([query], **kwargs)[0]
+
+    def get_retriever(self, search_kwargs=None):
         """Returns a LangChain retriever for the vector store."""
-        return self.langchain_chroma.as_retriever(search_type="mmr", search_kwargs=search_kwargs)
+        search_kwargs = search_kwargs or {'k': settings.RETRIEVER_K}
+        return VectorStoreRetriever(service=self, search_type="mmr", search_kwargs=search_kwargs)
 
 # Singleton instance
-vector_store_service = VectorStoreService()
\ No newline at end of file
+vector_store_service = VectorStoreService()
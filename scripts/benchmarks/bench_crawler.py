@@ -0,0 +1,307 @@
+"""
+Crawler benchmark against local fixture sites, so no real domain is touched.
+
+Starts one threaded HTTP server per simulated domain. Each serves a
+deterministic site of linked HTML pages (with navigation boilerplate and
+links to off-domain URLs) and PDFs, with an artificial per-response latency
+standing in for network round trips. The same crawl jobs are then run with:
+
+- serial: the async engine with one request at a time per domain and no rate
+          limit, i.e. the requests crawler without its fixed 1 s sleep.
+- async:  the async engine with --concurrency and --rate per domain.
+- legacy: crawl_with_requests, job by job (includes its 1 s sleep per page;
+          requires the Selenium dependencies to import).
+- recrawl: the async engine twice over the same database, with
+          --change-fraction of the pages edited in between. Reports the
+          second crawl: conditional GETs answered 304, bytes served and how
+          many sources were marked for re-ingestion.
+- resume: the async engine interrupted after --interrupt-after seconds, then
+          run again. Reports the URLs requested by each run; a resumed crawl
+          does not start over from the start URL.
+- shared: --processes crawler processes started at once on the same
+          database, pulling from one persistent frontier. Reports requests
+          against distinct URLs; URLs fetched twice show up as duplicates.
+
+Every mode crawls into its own temporary database and download folder. The
+report is JSON with wall time, pages/sec, and the highest number of requests
+any fixture domain saw in flight at once. With --trace-memory it also reports
+the peak Python heap of each mode (tracemalloc), which should not grow with
+--pdf-kb now that downloads are streamed to disk.
+
+    python -m scripts.benchmarks.bench_crawler --domains 3 --pages 200 --latency-ms 50 --concurrency 8
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List
+
+from insucompass.config import settings
+
+class FixtureSite:
+    """A synthetic site served on 127.0.0.1 that counts requests and peak concurrency."""
+
+    def __init__(self, pages: int, pdfs: int, fanout: int, pdf_kb: int, latency_ms: float, seed: int):
+        rng = random.Random(seed)
+        self.pages: Dict[str, bytes] = {}
+        self.pdf = b"%PDF-1.4\n" + rng.randbytes(pdf_kb * 1024) + b"\n%%EOF\n"
+        self.pdf_paths = {f"/docs/form-{j}.pdf" for j in range(pdfs)}
+        nav = "".join(f'<li><a href="/page/{i}.html">Section {i}</a></li>' for i in range(min(pages, 10)))
+        for i in range(pages):
+            children = [i * fanout + k for k in range(1, fanout + 1) if i * fanout + k < pages]
+            links = [f"/page/{child}.html" for child in children]
+            links += [f"/page/{rng.randrange(pages)}.html#top" for _ in range(2)]
+            if pdfs and rng.random() < 0.3:
+                links.append(f"/docs/form-{rng.randrange(pdfs)}.pdf")
+            links.append("https://elsewhere.example.org/outside")
+            body = "".join(f'<p>Paragraph {n} about coverage and enrollment. <a href="{link}">link</a></p>' for n, link in enumerate(links))
+            self.pages[f"/page/{i}.html"] = (
+                f"<!DOCTYPE html><html><head><title>Page {i}</title></head><body>"
+                f"<nav><ul>{nav}</ul></nav><main><h1>Page {i}</h1>{body}</main></body></html>"
+            ).encode("utf-8")
+        self.latency = latency_ms / 1000.0
+        self.last_modified = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime())
+        self.requests = 0
+        self.paths_served = set()
+        self.bytes_sent = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def domain(self) -> str:
+        return f"127.0.0.1:{self.server.server_address[1]}"
+
+    def _handler(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                with site._lock:
+                    site.requests += 1
+                    site.paths_served.add(self.path)
+                    site.in_flight += 1
+                    site.max_in_flight = max(site.max_in_flight, site.in_flight)
+                try:
+                    time.sleep(site.latency)
+                    path = self.path.split("?")[0]
+                    if path in site.pages:
+                        body, content_type = site.pages[path], "text/html; charset=utf-8"
+                    elif path in site.pdf_paths:
+                        body, content_type = site.pdf, "application/pdf"
+                    else:
+                        self.send_error(404)
+                        return
+                    etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+                    if self.headers.get("If-None-Match") == etag:
+                        self.send_response(304)
+                        self.send_header("ETag", etag)
+                        self.end_headers()
+                        return
+                    self.send_response(200)
+                    self.send_header("Content-Type", content_type)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.send_header("ETag", etag)
+                    self.send_header("Last-Modified", site.last_modified)
+                    self.end_headers()
+                    self.wfile.write(body)
+                    with site._lock:
+                        site.bytes_sent += len(body)
+                finally:
+                    with site._lock:
+                        site.in_flight -= 1
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread.start()
+
+    def reset(self):
+        with self._lock:
+            self.requests = self.max_in_flight = self.bytes_sent = 0
+            self.paths_served = set()
+
+    def edit_pages(self, fraction: float, seed: int) -> int:
+        """Changes the content of a fraction of the pages, as a site update between crawls would."""
+        rng = random.Random(seed)
+        paths = rng.sample(sorted(self.pages), int(len(self.pages) * fraction))
+        for path in paths:
+            self.pages[path] = self.pages[path].replace(b"</main>", b"<p>Updated guidance.</p></main>")
+        return len(paths)
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def make_jobs(sites: List[FixtureSite], depth: int, concurrency: int, rate: float) -> List[dict]:
+    return [
+        {
+            "name": f"Fixture {site.domain}",
+            "start_url": f"http://{site.domain}/page/0.html",
+            "method": "requests_crawl",
+            "domain_lock": site.domain,
+            "crawl_depth": depth,
+            "max_concurrency": concurrency,
+            "requests_per_second": rate,
+            "status": "active",
+        }
+        for site in sites
+    ]
+
+def _crawl_process(jobs: List[dict], database_url: str, raw_dir: str):
+    settings.DATABASE_URL, settings.CRAWLER_RAW_DATA_DIR = database_url, raw_dir
+    from scripts.data_processing.async_crawler import crawl_jobs
+    asyncio.run(crawl_jobs(jobs))
+
+async def _interrupted_crawl(jobs: List[dict], seconds: float):
+    from scripts.data_processing.async_crawler import crawl_jobs
+    try:
+        await asyncio.wait_for(crawl_jobs(jobs), seconds)
+    except asyncio.TimeoutError:
+        pass
+
+def run_mode(mode: str, root: Path, sites: List[FixtureSite], args) -> dict:
+    # A fresh database and download folder per mode, so no mode sees another's sources.
+    settings.DATABASE_URL = str(root / f"{mode}.db")
+    settings.CRAWLER_RAW_DATA_DIR = str(root / mode)
+    from insucompass.services.database import setup_database
+    setup_database()
+    for site in sites:
+        site.reset()
+
+    extra = {}
+    if mode == "recrawl":
+        from scripts.data_processing.async_crawler import crawl_jobs
+        jobs = make_jobs(sites, args.depth, args.concurrency, args.rate)
+        asyncio.run(crawl_jobs(jobs))
+        first_bytes = sum(site.bytes_sent for site in sites)
+        # The previous crawl's downloads count as ingested, as they would be after run_ingestion.
+        from insucompass.services.database import get_db_connection
+        with get_db_connection() as conn:
+            conn.execute("UPDATE data_sources SET status = 'ingested' WHERE status = 'processed'")
+            conn.commit()
+        edited = sum(site.edit_pages(args.change_fraction, args.seed) for site in sites)
+        for site in sites:
+            site.reset()
+        extra = {"first_crawl_bytes_sent": first_bytes, "pages_edited": edited}
+    elif mode == "resume":
+        asyncio.run(_interrupted_crawl(make_jobs(sites, args.depth, args.concurrency, args.rate), args.interrupt_after))
+        extra = {"interrupted_run_requests": sum(site.requests for site in sites)}
+        for site in sites:
+            site.reset()
+
+    if args.trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    if mode == "legacy":
+        from scripts.data_processing.crawler import crawl_with_requests
+        for job in make_jobs(sites, args.depth, 1, 0):
+            crawl_with_requests(job)
+        stats = {}
+    elif mode == "shared":
+        # Forked, so the children reach the fixture servers of this process.
+        context = multiprocessing.get_context("fork")
+        jobs = make_jobs(sites, args.depth, args.concurrency, args.rate)
+        processes = [
+            context.Process(target=_crawl_process, args=(jobs, settings.DATABASE_URL, settings.CRAWLER_RAW_DATA_DIR))
+            for _ in range(args.processes)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        stats = {"processes": args.processes, "distinct_urls": sum(len(site.paths_served) for site in sites)}
+    else:
+        from scripts.data_processing.async_crawler import crawl_jobs
+        concurrency, rate = (1, 0.0) if mode == "serial" else (args.concurrency, args.rate)
+        stats = asyncio.run(crawl_jobs(make_jobs(sites, args.depth, concurrency, rate)))
+    elapsed = time.perf_counter() - start
+    if args.trace_memory:
+        extra["peak_heap_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+        tracemalloc.stop()
+    if mode == "recrawl":
+        from insucompass.services.database import get_db_connection
+        with get_db_connection() as conn:
+            extra["marked_for_ingestion"] = conn.execute(
+                "SELECT COUNT(*) FROM data_sources WHERE status IN ('processed', 'updated')"
+            ).fetchone()[0]
+
+    requests = sum(site.requests for site in sites)
+    return {
+        "mode": mode,
+        "seconds": round(elapsed, 3),
+        "requests": requests,
+        "requests_per_s": round(requests / elapsed, 1) if elapsed else 0.0,
+        "max_in_flight_per_domain": max(site.max_in_flight for site in sites),
+        "bytes_sent": sum(site.bytes_sent for site in sites),
+        **stats,
+        **extra,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the crawler against local fixture sites.")
+    parser.add_argument("--domains", type=int, default=3, help="Number of fixture sites (one crawl job each).")
+    parser.add_argument("--pages", type=int, default=200, help="HTML pages per site.")
+    parser.add_argument("--pdfs", type=int, default=20, help="PDFs per site.")
+    parser.add_argument("--pdf-kb", type=int, default=256, help="Size of each PDF in KiB.")
+    parser.add_argument("--fanout", type=int, default=4, help="Child pages linked from each page.")
+    parser.add_argument("--depth", type=int, default=4, help="Crawl depth of each job.")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Simulated latency per response.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight per domain (async mode).")
+    parser.add_argument("--rate", type=float, default=0.0, help="Requests per second per domain, 0 = unlimited (async mode).")
+    parser.add_argument("--modes", default="serial,async,recrawl", help="Comma-separated subset of serial,async,legacy,recrawl,resume,shared.")
+    parser.add_argument("--change-fraction", type=float, default=0.1, help="Share of pages edited before the recrawl.")
+    parser.add_argument("--interrupt-after", type=float, default=1.0, help="Seconds before the first run of resume mode is interrupted.")
+    parser.add_argument("--processes", type=int, default=3, help="Crawler processes in shared mode.")
+    parser.add_argument("--trace-memory", action="store_true", help="Report each mode's peak Python heap (slows the crawl).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Also write the JSON report to this file.")
+    args = parser.parse_args()
+
+    sites = [
+        FixtureSite(args.pages, args.pdfs, args.fanout, args.pdf_kb, args.latency_ms, args.seed + i)
+        for i in range(args.domains)
+    ]
+    for site in sites:
+        site.start()
+    try:
+        with tempfile.TemporaryDirectory(prefix="insucompass-bench-crawl-") as tmp:
+            results = [run_mode(mode.strip(), Path(tmp), sites, args) for mode in args.modes.split(",") if mode.strip()]
+            from insucompass.services.database import close_db_connection
+            close_db_connection()
+    finally:
+        for site in sites:
+            site.stop()
+
+    baseline = next((result for result in results if result["mode"] == "serial"), None)
+    if baseline:
+        for result in results:
+            if result["mode"] in ("recrawl", "resume", "shared"):
+                continue
+            result["speedup_vs_serial"] = round(baseline["seconds"] / result["seconds"], 2) if result["seconds"] else None
+    report = {
+        "fixture": {key: getattr(args, key) for key in ("domains", "pages", "pdfs", "pdf_kb", "fanout", "depth", "latency_ms", "concurrency", "rate")},
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
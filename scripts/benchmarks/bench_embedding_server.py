@@ -0,0 +1,56 @@
+"""
+Compares query-encoding throughput under concurrency for an in-process
+sentence-transformers model and the shared embedding server.
+
+Start the server first:
+    python -m scripts.run_embedding_server --socket /tmp/insucompass_embeddings.sock
+Then run:
+    python -m scripts.benchmarks.bench_embedding_server --socket /tmp/insucompass_embeddings.sock --threads 16
+"""
+import argparse
+import json
+import resource
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from insucompass.config import settings
+from insucompass.services.embedding_server import RemoteEmbeddings
+
+SAMPLE_QUERIES = [
+    "Am I eligible for Medicaid in California with a household of three?",
+    "What is the out-of-pocket maximum for a silver marketplace plan?",
+    "Does Medicare Part D cover insulin?",
+    "How do I appeal a denied TRICARE claim?",
+    "When is open enrollment for ACA plans?",
+]
+
+def _run(encode_one, threads: int, requests: int) -> dict:
+    queries = [SAMPLE_QUERIES[i % len(SAMPLE_QUERIES)] + f" #{i}" for i in range(requests)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(encode_one, queries))
+    elapsed = time.perf_counter() - start
+    return {"requests": requests, "threads": threads, "seconds": round(elapsed, 3), "requests_per_s": round(requests / elapsed, 1)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the shared embedding server against an in-process model.")
+    parser.add_argument("--socket", required=True)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=1000)
+    args = parser.parse_args()
+
+    report = {}
+    remote = RemoteEmbeddings(args.socket)
+    remote.embed_query("warm up")
+    report["server"] = _run(remote.embed_query, args.threads, args.requests)
+    report["server"]["client_peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(settings.EMBEDDING_MODEL_NAME, device='cpu')
+    model.encode(["warm up"])
+    report["in_process"] = _run(lambda q: model.encode([q]), args.threads, args.requests)
+    report["in_process"]["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Compares the lxml and BeautifulSoup HTML text extraction paths over a corpus of
+saved pages: pages/sec for each, and whether both produce the same text.
+
+    python -m scripts.benchmarks.bench_html_extraction --corpus data/raw --limit 2000
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+from scripts.data_processing.document_loader import extract_html_text_bs4, extract_html_text_lxml
+
+def _time_extractor(extract, pages):
+    outputs = []
+    start = time.perf_counter()
+    for html in pages:
+        try:
+            outputs.append(extract(html))
+        except Exception:
+            outputs.append(None)
+    elapsed = time.perf_counter() - start
+    return outputs, {"seconds": round(elapsed, 3), "pages_per_s": round(len(pages) / elapsed, 1) if elapsed else 0.0}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark HTML text extraction engines.")
+    parser.add_argument("--corpus", default="data/raw", help="Directory searched recursively for .html files.")
+    parser.add_argument("--limit", type=int, default=0, help="Use at most this many pages (0 = all).")
+    parser.add_argument("--show-mismatches", type=int, default=3, help="Print the paths of the first N pages whose text differs.")
+    args = parser.parse_args()
+
+    paths = sorted(Path(args.corpus).rglob("*.html"))
+    if args.limit:
+        paths = paths[:args.limit]
+    pages = [path.read_bytes() for path in paths]
+    if not pages:
+        raise SystemExit(f"No .html files found under {args.corpus}")
+
+    bs4_texts, bs4_report = _time_extractor(extract_html_text_bs4, pages)
+    lxml_texts, lxml_report = _time_extractor(extract_html_text_lxml, pages)
+
+    mismatches = [str(path) for path, a, b in zip(paths, bs4_texts, lxml_texts) if a != b]
+    report = {
+        "pages": len(pages),
+        "bytes": sum(len(html) for html in pages),
+        "bs4": bs4_report,
+        "lxml": lxml_report,
+        "speedup": round(bs4_report["seconds"] / lxml_report["seconds"], 2) if lxml_report["seconds"] else None,
+        "identical_text": len(pages) - len(mismatches),
+        "lxml_failures": sum(text is None for text in lxml_texts),
+        "mismatch_examples": mismatches[:args.show_mismatches],
+    }
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+"""
+End-to-end ingestion benchmark over a reproducible synthetic corpus.
+
+Generates HTML pages and PDFs shaped like the crawl (navigation/footer
+boilerplate, headed sections, lists, multi-page PDFs), registers them in a
+`data_sources` table and ingests them into a temporary SQLite database and
+Chroma directory, so the real knowledge base is never touched. Three modes:
+
+- stages:   a serial, instrumented run timing load/parse, chunk, embed,
+            vector write and SQLite write separately.
+- pipeline: the staged IngestionPipeline with run_ingestion's writer.
+- service:  IngestionService, the dynamic path used for web search results.
+
+Each mode writes to its own knowledge base version so none reuses another's
+chunks. The embedding and parsed text caches are off unless --with-cache is given. The report is
+JSON with per-stage timings, docs/sec, chunks/sec and peak RSS.
+
+    python -m scripts.benchmarks.bench_ingestion --html 200 --pdf 10 --output bench_ingestion.json
+"""
+import argparse
+import json
+import random
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from insucompass.config import settings
+
+VOCABULARY = (
+    "plan coverage premium deductible copayment coinsurance enrollment marketplace subsidy "
+    "tax credit household income eligibility medicaid medicare chip dependent spouse provider "
+    "network hospital prescription drug benefit preventive care claim appeal exchange period "
+    "special qualifying event bronze silver gold platinum catastrophic out-of-pocket maximum "
+    "employer small business waiver state federal poverty level application renewal notice "
+    "document verification immigration status tribal member pregnancy newborn disability"
+).split()
+
+NAV = "".join(f'<li><a href="/{word}/">{word.title()}</a></li>' for word in VOCABULARY[:12])
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(VOCABULARY) for _ in range(rng.randint(8, 24))]
+    return " ".join(words).capitalize() + "."
+
+def _paragraph(rng: random.Random) -> str:
+    return " ".join(_sentence(rng) for _ in range(rng.randint(3, 7)))
+
+def make_html_page(rng: random.Random, index: int) -> str:
+    """A page with crawl-like boilerplate around 3-8 headed sections of paragraphs and lists."""
+    sections = []
+    for _ in range(rng.randint(3, 8)):
+        body = "".join(f"<p>{_paragraph(rng)}</p>" for _ in range(rng.randint(1, 4)))
+        if rng.random() < 0.4:
+            body += "<ul>" + "".join(f"<li>{_sentence(rng)}</li>" for _ in range(rng.randint(3, 6))) + "</ul>"
+        sections.append(f"<h2>{_sentence(rng)[:60]}</h2>{body}")
+    return (
+        f"<!DOCTYPE html><html><head><title>Page {index}</title>"
+        f"<script>window.dataLayer = [];</script><style>body {{ margin: 0; }}</style></head><body>"
+        f"<header><nav><ul>{NAV}</ul></nav></header>"
+        f"<main><h1>{_sentence(rng)[:80]}</h1>{''.join(sections)}</main>"
+        f"<footer><p>HealthCare.gov is the federal government's website.</p><ul>{NAV}</ul></footer>"
+        f"</body></html>"
+    )
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def write_pdf(path: Path, pages: List[List[str]]):
+    """Writes a minimal text-only PDF with one Helvetica text object per page."""
+    objects = {1: b"<< /Type /Catalog /Pages 2 0 R >>", 3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"}
+    kids = []
+    for i, lines in enumerate(pages):
+        page_id, content_id = 4 + 2 * i, 5 + 2 * i
+        stream = "BT /F1 10 Tf 12 TL 50 760 Td " + " ".join(f"({_pdf_escape(line)}) Tj T*" for line in lines) + " ET"
+        data = stream.encode("latin-1")
+        objects[content_id] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(data), data)
+        objects[page_id] = (
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        kids.append(b"%d 0 R" % page_id)
+    objects[2] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), len(kids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for number in sorted(objects):
+        offsets[number] = len(out)
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, objects[number])
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for number in sorted(objects):
+        out += b"%010d 00000 n \n" % offsets[number]
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    path.write_bytes(bytes(out))
+
+def make_pdf_pages(rng: random.Random, page_count: int) -> List[List[str]]:
+    """Pages of ~55 wrapped lines, like the plan brochures and notices in the crawl."""
+    pages = []
+    for _ in range(page_count):
+        lines, line = [], ""
+        while len(lines) < 55:
+            for word in _sentence(rng).split():
+                if len(line) + len(word) > 95:
+                    lines.append(line)
+                    line = ""
+                line = f"{line} {word}".strip()
+        pages.append(lines[:55])
+    return pages
+
+def generate_corpus(root: Path, html_count: int, pdf_count: int, pdf_pages: int, seed: int) -> List[dict]:
+    """
+    Writes the corpus under `root` and registers it as 'processed' data sources.
+
+    Returns:
+        The data source rows, as run_ingestion reads them.
+    """
+    from insucompass.services.database import get_db_connection
+    from scripts.data_processing.crawler_utils import get_content_hash
+
+    rng = random.Random(seed)
+    entries = []
+    for i in range(html_count):
+        path = root / "html" / f"page-{i}.html"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(make_html_page(rng, i), encoding="utf-8")
+        entries.append((f"https://www.healthcare.gov/bench/page-{i}/", "html", path))
+    for i in range(pdf_count):
+        path = root / "pdf" / f"brochure-{i}.pdf"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write_pdf(path, make_pdf_pages(rng, pdf_pages))
+        entries.append((f"https://www.cms.gov/bench/brochure-{i}.pdf", "pdf", path))
+
+    with get_db_connection() as conn:
+        conn.cursor().executemany(
+            "INSERT INTO data_sources (name, url, data_type, category, local_path, content_hash, status) VALUES (?, ?, ?, ?, ?, ?, 'processed')",
+            [(path.name, url, data_type, "bench", str(path), get_content_hash(path.read_bytes())) for url, data_type, path in entries]
+        )
+        conn.commit()
+        return [dict(row) for row in conn.cursor().execute("SELECT * FROM data_sources ORDER BY id").fetchall()]
+
+def peak_rss_mb() -> Dict[str, float]:
+    """Peak resident set size so far of this process and of its (reaped) worker processes."""
+    # ru_maxrss is in KiB on Linux and in bytes on macOS.
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+def _throughput(documents: int, chunks: int, seconds: float) -> dict:
+    return {
+        "seconds": round(seconds, 3),
+        "docs_per_s": round(documents / seconds, 2) if seconds else 0.0,
+        "chunks_per_s": round(chunks / seconds, 2) if seconds else 0.0,
+    }
+
+def bench_stages(sources: List[dict], batch_size: int) -> dict:
+    """Runs each ingestion stage over the whole corpus in turn, timing each one."""
+    from insucompass.services.chunk_store import INSERT_CHUNK_QUERY, chunk_row, set_source_chunk_count
+    from insucompass.services.database import get_db_connection
+    from insucompass.services.vector_store import content_addressed_ids, vector_store_service
+    from scripts.data_processing.chunker import chunk_pages, chunk_texts, number_chunks
+    from scripts.data_processing.document_loader import iter_pdf_pages_cached, load_document
+
+    version, timings = "bench-stages", {}
+    wall = time.perf_counter()
+
+    start = time.perf_counter()
+    loaded = []
+    for source in sources:
+        if source["data_type"] == "pdf":
+            loaded.append(list(iter_pdf_pages_cached(Path(source["local_path"]), source["content_hash"])))
+        else:
+            loaded.append(load_document(source["local_path"], source["content_hash"]))
+    timings["load_parse_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    # Other documents are chunked in one batch, as the pipeline's parse tasks do.
+    others = iter(chunk_texts(
+        [content for source, content in zip(sources, loaded) if source["data_type"] != "pdf"],
+        [source for source in sources if source["data_type"] != "pdf"],
+    ))
+    per_source = []
+    for source, content in zip(sources, loaded):
+        if source["data_type"] == "pdf":
+            per_source.append(number_chunks(list(chunk_pages(content, source_metadata=source))))
+        else:
+            per_source.append(next(others))
+    timings["chunk_s"] = time.perf_counter() - start
+    documents = [doc for docs in per_source for doc in docs]
+
+    start = time.perf_counter()
+    texts = [doc.page_content for doc in documents]
+    embeddings = []
+    for offset in range(0, len(texts), batch_size):
+        embeddings.extend(vector_store_service.embedding_function.embed_documents(texts[offset:offset + batch_size]))
+    timings["embed_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ids_per_source = []
+    offset = 0
+    for docs in per_source:
+        ids = content_addressed_ids(docs)
+        vector_store_service.add_embedded_documents(docs, embeddings[offset:offset + len(docs)], version=version, ids=ids)
+        ids_per_source.append(ids)
+        offset += len(docs)
+    timings["vector_write_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        for source, docs, ids in zip(sources, per_source, ids_per_source):
+            cursor.executemany(INSERT_CHUNK_QUERY, [chunk_row(source["id"], doc, vector_id, version) for doc, vector_id in zip(docs, ids)])
+            set_source_chunk_count(source["id"], len(docs), cursor=cursor)
+            cursor.execute("UPDATE data_sources SET status = 'ingested', ingested_hash = ? WHERE id = ?", (source["content_hash"], source["id"]))
+            conn.commit()
+    timings["sqlite_write_s"] = time.perf_counter() - start
+
+    report = _throughput(len(sources), len(documents), time.perf_counter() - wall)
+    report.update({key: round(value, 3) for key, value in timings.items()})
+    report["chunks"] = len(documents)
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+def bench_pipeline(sources: List[dict], workers: int, batch_size: int, queue_size: int, embed_workers: int) -> dict:
+    """Runs the staged pipeline with run_ingestion's writer into a fresh version."""
+    from insucompass.services.vector_store import vector_store_service
+    from scripts.data_processing.ingestion_pipeline import IngestionPipeline
+    from scripts.run_ingestion import mark_source_status, write_source_chunks
+
+    version = "bench-pipeline"
+    write_seconds = {"total": 0.0}
+
+    def write(source, documents, embeddings, reused_ids):
+        start = time.perf_counter()
+        write_source_chunks(source, documents, embeddings, reused_ids, version)
+        write_seconds["total"] += time.perf_counter() - start
+
+    with vector_store_service.bulk_embedding(embed_workers) as embeddings:
+        pipeline = IngestionPipeline(
+            embed_fn=embeddings.embed_documents,
+            write_fn=write,
+            fail_fn=mark_source_status,
+            workers=workers,
+            batch_size=batch_size * max(1, embed_workers),
+            queue_size=queue_size,
+            pdf_pages_per_task=settings.PDF_PAGES_PER_TASK,
+        )
+        start = time.perf_counter()
+        stages = pipeline.run(sources)
+        elapsed = time.perf_counter() - start
+
+    chunks = next((stage["chunks"] for stage in stages if stage["stage"] == "write"), 0)
+    report = _throughput(len(sources), chunks, elapsed)
+    report.update({"chunks": chunks, "stages": stages, "write_s": round(write_seconds["total"], 3), "peak_rss_mb": peak_rss_mb()})
+    return report
+
+def bench_service(sources: List[dict]) -> dict:
+    """Runs IngestionService over the HTML sources, as if they were web search results."""
+    from langchain_core.documents import Document
+    from insucompass.services.ingestion_service import IngestionService
+
+    results = [
+        Document(page_content="", metadata={
+            "source_url": source["url"].replace("/bench/", "/bench-search/"),
+            "source_name": source["name"],
+            "source_local_path": source["local_path"],
+        })
+        for source in sources if source["data_type"] == "html"
+    ]
+    start = time.perf_counter()
+    IngestionService().ingest_documents(results)
+    elapsed = time.perf_counter() - start
+    report = _throughput(len(results), 0, elapsed)
+    del report["chunks_per_s"]
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingestion over a synthetic corpus.")
+    parser.add_argument("--html", type=int, default=200, help="Number of HTML pages to generate.")
+    parser.add_argument("--pdf", type=int, default=10, help="Number of PDFs to generate.")
+    parser.add_argument("--pdf-pages", type=int, default=30, help="Pages per generated PDF.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--modes", default="stages,pipeline,service", help="Comma-separated subset of stages,pipeline,service.")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--embed-workers", type=int, default=0, help="Encode processes for the pipeline mode (0 = in-process).")
+    parser.add_argument("--queue-size", type=int, default=8)
+    parser.add_argument("--with-cache", action="store_true", help="Keep the embedding and parsed text caches enabled.")
+    parser.add_argument("--output", default=None, help="Also write the JSON report to this file.")
+    args = parser.parse_args()
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+
+    with tempfile.TemporaryDirectory(prefix="insucompass-bench-") as tmp:
+        root = Path(tmp)
+        # Redirect every store before the services are imported: the vector store is created on import.
+        settings.DATABASE_URL = str(root / "bench.db")
+        settings.CHROMA_PATH = str(root / "vector_store")
+        settings.FLAT_INDEX_PATH = str(root / "flat_index")
+        settings.KB_ACTIVE_VERSION_FILE = str(root / "kb_active_version.json")
+        settings.VECTOR_BACKEND = "chroma"
+        settings.EMBEDDING_CACHE_ENABLED = args.with_cache
+        settings.PARSED_TEXT_CACHE_ENABLED = args.with_cache
+        from insucompass.services.database import close_db_connection, setup_database
+        setup_database()
+
+        start = time.perf_counter()
+        sources = generate_corpus(root / "corpus", args.html, args.pdf, args.pdf_pages, args.seed)
+        corpus = {
+            "html": args.html,
+            "pdf": args.pdf,
+            "pdf_pages": args.pdf_pages,
+            "seed": args.seed,
+            "bytes": sum(Path(source["local_path"]).stat().st_size for source in sources),
+            "generate_s": round(time.perf_counter() - start, 3),
+        }
+
+        report = {
+            "corpus": corpus, "workers": args.workers, "embed_workers": args.embed_workers,
+            "batch_size": args.batch_size, "embedding_cache": args.with_cache,
+        }
+        if "stages" in modes:
+            report["stages"] = bench_stages(sources, args.batch_size)
+        if "pipeline" in modes:
+            report["pipeline"] = bench_pipeline(sources, args.workers, args.batch_size, args.queue_size, args.embed_workers)
+        if "service" in modes:
+            report["service"] = bench_service(sources)
+        close_db_connection()
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        Path(args.output).write_text(output + "\n", encoding="utf-8")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Selenium crawler benchmark against a local fixture site, so no real domain is touched.
+Requires Chrome and the Selenium dependencies.
+
+Serves a deterministic site of linked pages on 127.0.0.1 with an artificial
+per-response latency. A share of the pages (--js-fraction) are client-rendered:
+their HTML is an empty shell whose script fetches the content and links from a
+JSON endpoint, as on the CMS, Medicare and TRICARE sites. The other pages are
+static HTML with an analytics-style script. The same crawl job is run with:
+
+- sleep:    one driver, every page rendered, then the previous fixed wait
+            (<body> present, then 3 s).
+- serial:   one driver, every page rendered, readiness checks (document
+            loaded, DOM and network quiet).
+- pool:     --drivers drivers, every page rendered, readiness checks.
+- precheck: --drivers drivers, pages fetched with plain HTTP first and only
+            rendered in the browser if they need JavaScript.
+
+Every mode crawls into its own temporary database and download folder. The
+report is JSON with wall time (including driver start-up), pages saved,
+browser renders, and client-rendered pages saved without their content, which
+should be 0 in every mode.
+
+    python -m scripts.benchmarks.bench_selenium_crawler --pages 60 --js-fraction 0.3 --drivers 4
+"""
+import argparse
+import json
+import random
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Set
+
+from insucompass.config import settings
+
+class JsFixtureSite:
+    """A synthetic site on 127.0.0.1 mixing static and client-rendered pages."""
+
+    def __init__(self, pages: int, js_fraction: float, fanout: int, latency_ms: float, seed: int):
+        rng = random.Random(seed)
+        self.js_pages: Set[int] = set(rng.sample(range(pages), int(pages * js_fraction)))
+        self.responses: Dict[str, tuple] = {}
+        nav = "".join(f'<li><a href="/page/{i}.html">Section {i}</a></li>' for i in range(min(pages, 10)))
+        for i in range(pages):
+            children = [i * fanout + k for k in range(1, fanout + 1) if i * fanout + k < pages]
+            body = "".join(
+                f'<p>Paragraph {n} about plan coverage, enrollment periods and eligibility. <a href="/page/{child}.html">More</a></p>'
+                for n, child in enumerate(children + [rng.randrange(pages)])
+            )
+            text = "".join(
+                f"<p>Section {n} of page {i} explains how premiums, deductibles and out-of-pocket limits apply to this plan.</p>"
+                for n in range(8)
+            )
+            content = f'<h1 data-rendered="page-{i}">Page {i}</h1>{text}{body}'
+            if i in self.js_pages:
+                html = (
+                    f'<main id="app"></main><script>fetch("/api/page/{i}.json").then(r => r.json())'
+                    f'.then(d => {{ document.getElementById("app").innerHTML = d.html; }});</script>'
+                )
+                self.responses[f"/api/page/{i}.json"] = (json.dumps({"html": content}).encode("utf-8"), "application/json")
+            else:
+                html = f"<main>{content}</main><script>window.analytics = [];</script>"
+            page = f"<!DOCTYPE html><html><head><title>Page {i}</title></head><body><nav><ul>{nav}</ul></nav>{html}</body></html>"
+            self.responses[f"/page/{i}.html"] = (page.encode("utf-8"), "text/html; charset=utf-8")
+        self.latency = latency_ms / 1000.0
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def domain(self) -> str:
+        return f"127.0.0.1:{self.server.server_address[1]}"
+
+    def _handler(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                with site._lock:
+                    site.requests += 1
+                time.sleep(site.latency)
+                response = site.responses.get(self.path.split("?")[0])
+                if response is None:
+                    self.send_error(404)
+                    return
+                body, content_type = response
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def _fixed_sleep_wait(driver, timeout: float, quiet_ms: int) -> bool:
+    """The crawler's wait before the readiness checks: <body> present, then 3 seconds."""
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+    WebDriverWait(driver, 20).until(EC.presence_of_element_located((By.TAG_NAME, "body")))
+    time.sleep(3)
+    return True
+
+def run_mode(mode: str, root: Path, site: JsFixtureSite, args) -> dict:
+    settings.DATABASE_URL = str(root / f"{mode}.db")
+    settings.CRAWLER_RAW_DATA_DIR = str(root / mode)
+    from insucompass.services.database import get_db_connection, setup_database
+    from scripts.data_processing import selenium_pool
+    from scripts.data_processing.crawler import crawl_with_selenium
+    setup_database()
+
+    drivers = 1 if mode in ("sleep", "serial") else args.drivers
+    job = {
+        "name": f"Selenium fixture ({mode})",
+        "start_url": f"http://{site.domain}/page/0.html",
+        "method": "selenium_crawl",
+        "domain_lock": site.domain,
+        "crawl_depth": args.depth,
+        "max_concurrency": drivers,
+        "requests_per_second": 0,
+        "precheck": mode == "precheck",
+        "status": "active",
+    }
+    wait_until_ready = selenium_pool.wait_until_ready
+    if mode == "sleep":
+        selenium_pool.wait_until_ready = _fixed_sleep_wait
+    site.requests = 0
+    start = time.perf_counter()
+    try:
+        with selenium_pool.SeleniumPool(drivers, factory=selenium_pool.create_driver) as pool:
+            crawl_with_selenium(pool, job)
+    finally:
+        selenium_pool.wait_until_ready = wait_until_ready
+    elapsed = time.perf_counter() - start
+
+    with get_db_connection() as conn:
+        rows = conn.execute("SELECT url, local_path FROM data_sources WHERE local_path IS NOT NULL").fetchall()
+    missing = 0
+    for row in rows:
+        number = int(row["url"].rsplit("/", 1)[-1].split(".")[0])
+        if number in site.js_pages and f'data-rendered="page-{number}"' not in Path(row["local_path"]).read_text(encoding="utf-8"):
+            missing += 1
+    return {
+        "mode": mode,
+        "drivers": drivers,
+        "seconds": round(elapsed, 3),
+        "pages_saved": len(rows),
+        "pages_per_s": round(len(rows) / elapsed, 2) if elapsed else 0.0,
+        "browser_renders": pool.renders,
+        "http_requests": site.requests,
+        "js_pages_missing_content": missing,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Selenium crawler against a local fixture site.")
+    parser.add_argument("--pages", type=int, default=60, help="Pages on the fixture site.")
+    parser.add_argument("--js-fraction", type=float, default=0.3, help="Share of pages rendered client-side.")
+    parser.add_argument("--fanout", type=int, default=3, help="Child pages linked from each page.")
+    parser.add_argument("--depth", type=int, default=4, help="Crawl depth.")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Simulated latency per response.")
+    parser.add_argument("--drivers", type=int, default=4, help="Drivers in the pool (pool and precheck modes).")
+    parser.add_argument("--modes", default="sleep,serial,pool,precheck", help="Comma-separated subset of sleep,serial,pool,precheck.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Also write the JSON report to this file.")
+    args = parser.parse_args()
+
+    site = JsFixtureSite(args.pages, args.js_fraction, args.fanout, args.latency_ms, args.seed)
+    site.start()
+    try:
+        with tempfile.TemporaryDirectory(prefix="insucompass-bench-selenium-") as tmp:
+            results: List[dict] = [run_mode(mode.strip(), Path(tmp), site, args) for mode in args.modes.split(",") if mode.strip()]
+            from insucompass.services.database import close_db_connection
+            close_db_connection()
+    finally:
+        site.stop()
+
+    baseline = next((result for result in results if result["mode"] == "sleep"), None)
+    if baseline:
+        for result in results:
+            result["speedup_vs_sleep"] = round(baseline["seconds"] / result["seconds"], 2) if result["seconds"] else None
+    report = {
+        "fixture": {key: getattr(args, key) for key in ("pages", "js_fraction", "fanout", "depth", "latency_ms", "drivers")},
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Micro-benchmark of the SQLite access patterns of the crawler and ingestion, comparing
+the database layer (WAL, pragmas, per-thread connection, indexes) with the previous
+behaviour (a new default-journal connection per call and no lookup indexes).
+
+    python -m scripts.benchmarks.bench_sqlite --urls 5000 --chunks 50000
+"""
+import argparse
+import json
+import random
+import sqlite3
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+from insucompass.config import settings
+from insucompass.services import database
+
+@contextmanager
+def _legacy_connection(path: str):
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+def _rate(count: int, seconds: float) -> float:
+    return round(count / seconds, 1) if seconds else 0.0
+
+def _run(connection, urls, chunks, lookups) -> dict:
+    results = {}
+
+    # Crawler: one lookup-or-insert per discovered URL, then re-discovery of known URLs.
+    start = time.perf_counter()
+    for url in urls + urls:
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id FROM data_sources WHERE url = ?", (url,))
+            if cursor.fetchone():
+                continue
+            cursor.execute(
+                "INSERT INTO data_sources (name, url, data_type, category, status) VALUES (?, ?, ?, ?, ?)",
+                (url.rsplit('/', 1)[-1], url, 'html', 'bench', 'pending')
+            )
+            conn.commit()
+    results["crawler_url_ops_per_s"] = _rate(2 * len(urls), time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(len(urls)):
+        with connection() as conn:
+            conn.cursor().execute("SELECT id FROM data_sources WHERE status = 'processed' LIMIT 1").fetchone()
+    results["status_lookups_per_s"] = _rate(len(urls), time.perf_counter() - start)
+
+    # Ingestion: chunk rows written per source in executemany batches.
+    start = time.perf_counter()
+    for offset in range(0, len(chunks), 200):
+        with connection() as conn:
+            conn.cursor().executemany(
+                "INSERT INTO knowledge_chunks (source_id, chunk_text, metadata_json, vector_id, chunk_number) VALUES (?, ?, ?, ?, ?)",
+                chunks[offset:offset + 200]
+            )
+            conn.commit()
+    results["chunk_inserts_per_s"] = _rate(len(chunks), time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for vector_id in lookups:
+        with connection() as conn:
+            conn.cursor().execute("SELECT id FROM knowledge_chunks WHERE vector_id = ?", (vector_id,)).fetchone()
+    results["vector_id_lookups_per_s"] = _rate(len(lookups), time.perf_counter() - start)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the SQLite layer against per-call connections.")
+    parser.add_argument("--urls", type=int, default=5000)
+    parser.add_argument("--chunks", type=int, default=50000)
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    urls = [f"https://www.healthcare.gov/bench/page-{i}" for i in range(args.urls)]
+    chunks = [
+        (rng.randint(1, args.urls), "x" * 800, "{}", str(uuid.UUID(int=rng.getrandbits(128))), i)
+        for i in range(args.chunks)
+    ]
+    lookups = [rng.choice(chunks)[3] for _ in range(args.lookups)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = str(Path(tmp) / "legacy.db")
+        with _legacy_connection(legacy_path) as conn:
+            conn.execute("CREATE TABLE data_sources (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, url TEXT NOT NULL UNIQUE, data_type TEXT NOT NULL, category TEXT, status TEXT)")
+            conn.execute("CREATE TABLE knowledge_chunks (id INTEGER PRIMARY KEY AUTOINCREMENT, source_id INTEGER NOT NULL, chunk_text TEXT NOT NULL, metadata_json TEXT, vector_id TEXT, chunk_number INTEGER)")
+            conn.commit()
+        legacy = _run(lambda: _legacy_connection(legacy_path), urls, chunks, lookups)
+
+        settings.DATABASE_URL = str(Path(tmp) / "layer.db")
+        database.setup_database()
+        layer = _run(database.get_db_connection, urls, chunks, lookups)
+        database.close_db_connection()
+
+    report = {
+        "legacy": legacy,
+        "layer": layer,
+        "speedup": {key: round(layer[key] / legacy[key], 2) if legacy[key] else None for key in layer},
+    }
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
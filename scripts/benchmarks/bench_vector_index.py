@@ -0,0 +1,132 @@
+"""
+Benchmarks the memory-mapped flat index against a persistent Chroma collection
+on synthetic MiniLM-sized vectors: build time, load time, query latency and
+recall@k against exact brute-force search.
+
+Usage:
+    python -m scripts.benchmarks.bench_vector_index --rows 200000 --queries 200
+"""
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import chromadb
+import numpy as np
+
+from insucompass.services.flat_index import FlatVectorIndex
+
+def _synthetic_corpus(rows: int, dim: int, seed: int):
+    rng = np.random.default_rng(seed)
+    # Clustered vectors resemble real embeddings better than uniform noise.
+    centers = rng.normal(size=(max(1, rows // 500), dim)).astype(np.float32)
+    assignments = rng.integers(0, len(centers), size=rows)
+    vectors = centers[assignments] + 0.3 * rng.normal(size=(rows, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    num_queries = max(1000, rows // 100)
+    queries = vectors[rng.integers(0, rows, size=num_queries)] + 0.1 * rng.normal(size=(num_queries, dim)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return vectors, queries, assignments
+
+def _latency_summary(samples_ms):
+    ordered = sorted(samples_ms)
+    return {
+        "p50_ms": round(ordered[len(ordered) // 2], 3),
+        "p95_ms": round(ordered[int(len(ordered) * 0.95) - 1], 3),
+        "mean_ms": round(sum(ordered) / len(ordered), 3),
+    }
+
+def _recall(found, truth):
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+def run(rows: int, dim: int, num_queries: int, k: int, quantization: str, seed: int) -> dict:
+    vectors, queries, assignments = _synthetic_corpus(rows, dim, seed)
+    queries = queries[:num_queries]
+    ids = [f"vec_{i}" for i in range(rows)]
+    texts = [f"synthetic chunk {i}" for i in range(rows)]
+    metadatas = [{"source_id": int(a), "chunk_number": i % 50 + 1} for i, a in enumerate(assignments)]
+    truth = [list(np.argsort(-(vectors @ q))[:k]) for q in queries]
+    report = {"rows": rows, "dim": dim, "queries": len(queries), "k": k, "quantization": quantization}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+
+        # --- Flat index ---
+        start = time.perf_counter()
+        FlatVectorIndex.build(tmp / "flat", ids, vectors, texts, metadatas, quantization=quantization).close()
+        build_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index = FlatVectorIndex(tmp / "flat")
+        load_s = time.perf_counter() - start
+
+        latencies, found = [], []
+        for q in queries:
+            start = time.perf_counter()
+            hits = index.search([q], k=k, search_type="similarity")[0]
+            latencies.append((time.perf_counter() - start) * 1000)
+            found.append([int(doc.page_content.rsplit(" ", 1)[1]) for doc, _ in hits])
+
+        start = time.perf_counter()
+        index.search(queries, k=k, search_type="similarity")
+        batch_s = time.perf_counter() - start
+        index.close()
+        report["flat"] = {
+            "build_s": round(build_s, 3),
+            "load_s": round(load_s, 4),
+            "query": _latency_summary(latencies),
+            "batched_queries_per_s": round(len(queries) / batch_s, 1),
+            "recall_at_k": round(_recall(found, truth), 4),
+            "disk_mb": round(sum(f.stat().st_size for f in (tmp / "flat").iterdir()) / 1e6, 1),
+        }
+
+        # --- Chroma ---
+        start = time.perf_counter()
+        client = chromadb.PersistentClient(path=str(tmp / "chroma"))
+        collection = client.get_or_create_collection("bench", embedding_function=None)
+        batch = 5000
+        for offset in range(0, rows, batch):
+            collection.add(
+                ids=ids[offset:offset + batch],
+                embeddings=vectors[offset:offset + batch].tolist(),
+                documents=texts[offset:offset + batch],
+                metadatas=metadatas[offset:offset + batch],
+            )
+        build_s = time.perf_counter() - start
+        del collection, client
+
+        start = time.perf_counter()
+        client = chromadb.PersistentClient(path=str(tmp / "chroma"))
+        collection = client.get_collection("bench")
+        collection.query(query_embeddings=[queries[0].tolist()], n_results=1)
+        load_s = time.perf_counter() - start
+
+        latencies, found = [], []
+        for q in queries:
+            start = time.perf_counter()
+            result = collection.query(query_embeddings=[q.tolist()], n_results=k, include=[])
+            latencies.append((time.perf_counter() - start) * 1000)
+            found.append([int(vector_id.split("_")[1]) for vector_id in result["ids"][0]])
+        report["chroma"] = {
+            "build_s": round(build_s, 3),
+            "load_s": round(load_s, 4),
+            "query": _latency_summary(latencies),
+            "recall_at_k": round(_recall(found, truth), 4),
+            "disk_mb": round(sum(f.stat().st_size for f in (tmp / "chroma").rglob("*") if f.is_file()) / 1e6, 1),
+        }
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the flat vector index against Chroma.")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--quantization", default="int8", choices=["int8", "float16"])
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    print(json.dumps(run(args.rows, args.dim, args.queries, args.k, args.quantization, args.seed), indent=2))
+
+if __name__ == "__main__":
+    main()
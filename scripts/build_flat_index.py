@@ -0,0 +1,76 @@
+import argparse
+import logging
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+from insucompass.config import settings
+from insucompass.services import kb_versions
+from insucompass.services.flat_index import FlatVectorIndex
+from insucompass.services.vector_store import vector_store_service
+
+# Configure logging
+logging.basicConfig(level=settings.LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 5000
+
+def export_collection(collection):
+    """Reads every id, embedding, document and metadata out of a Chroma collection in pages."""
+    ids, embeddings, texts, metadatas = [], [], [], []
+    offset = 0
+    while True:
+        page = collection.get(include=["embeddings", "documents", "metadatas"], limit=PAGE_SIZE, offset=offset)
+        if not page["ids"]:
+            break
+        ids.extend(page["ids"])
+        embeddings.append(np.asarray(page["embeddings"], dtype=np.float32))
+        texts.extend(page["documents"])
+        metadatas.extend(page["metadatas"])
+        offset += len(page["ids"])
+        logger.info(f"Exported {offset} vectors from Chroma...")
+    matrix = np.vstack(embeddings) if embeddings else np.zeros((0, 0), dtype=np.float32)
+    return ids, matrix, texts, metadatas
+
+def build_flat_index(version: str = None, quantization: str = None, output: Path = None) -> int:
+    """
+    Builds the flat index of a knowledge base version from its Chroma collection
+    and swaps it into place. Defaults to the active version.
+
+    Returns:
+        The number of vectors in the new index.
+    """
+    version = version or vector_store_service.active_version
+    quantization = quantization or settings.FLAT_INDEX_QUANTIZATION
+    output = Path(output) if output else kb_versions.flat_index_dir_for(version)
+
+    logger.info(f"--- Building flat vector index for version '{version}' from Chroma ---")
+    ids, matrix, texts, metadatas = export_collection(vector_store_service.get_collection(version))
+
+    staging = output.with_name(output.name + ".building")
+    if staging.exists():
+        shutil.rmtree(staging)
+    FlatVectorIndex.build(staging, ids, matrix, texts, metadatas, quantization=quantization, embedding_model=vector_store_service.embedding_model_for(version)).close()
+
+    # Swap directories. Workers that still map the old files keep reading them until they reload.
+    previous = output.with_name(output.name + ".previous")
+    if previous.exists():
+        shutil.rmtree(previous)
+    if output.exists():
+        output.rename(previous)
+    staging.rename(output)
+    logger.info(f"--- Flat index with {len(ids)} vectors written to {output} ---")
+    return len(ids)
+
+def main():
+    """Builds the memory-mapped flat index from the Chroma collection and swaps it into place."""
+    parser = argparse.ArgumentParser(description="Build the flat vector index from the Chroma collection.")
+    parser.add_argument("--version", default=None, help="Knowledge base version to index. Defaults to the active version.")
+    parser.add_argument("--output", default=None, help="Index directory to (re)build. Defaults to the version's directory.")
+    parser.add_argument("--quantization", default=settings.FLAT_INDEX_QUANTIZATION, choices=["int8", "float16"])
+    args = parser.parse_args()
+    build_flat_index(args.version, args.quantization, args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import argparse
+import json
+import logging
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from insucompass.config import settings
+from insucompass.services.database import get_db_connection
+from insucompass.services.vector_store import vector_store_service, CHROMA_PATH
+
+# Configure logging
+logging.basicConfig(level=settings.LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 5000
+
+def _directory_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+def find_duplicates(collection) -> Tuple[int, List[str]]:
+    """
+    Scans a Chroma collection and finds vectors that duplicate an earlier one.
+
+    Two vectors are duplicates when they share source URL, chunk number and text,
+    which is what repeated ingestion of the same page used to produce.
+
+    Returns:
+        (total vector count, IDs of the duplicates to delete).
+    """
+    first_seen: Dict[Tuple[str, int, str], str] = {}
+    duplicates: List[str] = []
+    total = 0
+    offset = 0
+    while True:
+        page = collection.get(include=["documents", "metadatas"], limit=PAGE_SIZE, offset=offset)
+        if not page["ids"]:
+            break
+        for vector_id, text, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+            if not text:
+                # Slim vectors carry no text; they were written with content-addressed IDs, which cannot repeat.
+                continue
+            metadata = metadata or {}
+            key = (metadata.get("source_url") or "", metadata.get("chunk_number") or 0, text or "")
+            if key in first_seen:
+                duplicates.append(vector_id)
+            else:
+                first_seen[key] = vector_id
+        total += len(page["ids"])
+        offset += len(page["ids"])
+    return total, duplicates
+
+def compact_vector_store(version: str = None, dry_run: bool = False) -> Dict[str, int]:
+    """
+    Removes duplicate vectors from a knowledge base version's collection and the
+    matching knowledge_chunks rows. Defaults to the active version.
+
+    Returns:
+        A report with vector counts and on-disk size before and after.
+    """
+    collection = vector_store_service.get_collection(version)
+    size_before = _directory_size(Path(CHROMA_PATH))
+    total, duplicates = find_duplicates(collection)
+    logger.info(f"Found {len(duplicates)} duplicate vectors out of {total} in '{collection.name}'.")
+
+    if duplicates and not dry_run:
+        for start in range(0, len(duplicates), PAGE_SIZE):
+            batch = duplicates[start:start + PAGE_SIZE]
+            collection.delete(ids=batch)
+            with get_db_connection() as conn:
+                conn.cursor().executemany("DELETE FROM knowledge_chunks WHERE vector_id = ?", [(vector_id,) for vector_id in batch])
+                conn.commit()
+
+    return {
+        "vectors_before": total,
+        "vectors_after": collection.count() if not dry_run else total - len(duplicates),
+        "duplicates_removed": 0 if dry_run else len(duplicates),
+        # Chroma reuses freed pages, so the directory may not shrink until new data is added.
+        "bytes_before": size_before,
+        "bytes_after": _directory_size(Path(CHROMA_PATH)),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Remove duplicate chunks from the vector store.")
+    parser.add_argument("--version", default=None, help="Knowledge base version to compact. Defaults to the active one.")
+    parser.add_argument("--dry-run", action="store_true", help="Only report how many duplicates would be removed.")
+    args = parser.parse_args()
+
+    report = compact_vector_store(version=args.version, dry_run=args.dry_run)
+    print(json.dumps(report, indent=2))
+    if settings.VECTOR_BACKEND == "flat" and report["duplicates_removed"]:
+        logger.info("Rebuild the flat index (scripts/build_flat_index.py) to drop the removed vectors from it.")
+
+if __name__ == "__main__":
+    main()
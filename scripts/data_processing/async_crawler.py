@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+import httpx
+
+from insucompass.config import settings
+from insucompass.services.database import get_crawl_state, mark_source_not_modified
+from insucompass.services.downloads import CHUNK_SIZE, DownloadTooLarge, astream_to_temp_file, content_length_of
+from .crawler_utils import USER_AGENT, conditional_headers, extract_links, response_validators, save_download
+from .frontier import POLL_SECONDS, CrawlFrontier, links_to_follow
+
+logger = logging.getLogger(__name__)
+
+class DomainLimiter:
+    """
+    Per-domain politeness: at most `concurrency` requests in flight and request
+    starts spaced at least 1/`rate` seconds apart. A rate of 0 disables spacing.
+    """
+
+    def __init__(self, concurrency: int, rate: float):
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = asyncio.Lock()
+        self._next_start = 0.0
+
+    async def __aenter__(self):
+        await self._semaphore.acquire()
+        if self._interval:
+            async with self._lock:
+                now = asyncio.get_running_loop().time()
+                wait = self._next_start - now
+                self._next_start = max(now, self._next_start) + self._interval
+            if wait > 0:
+                await asyncio.sleep(wait)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._semaphore.release()
+
+class AsyncCrawler:
+    """
+    Crawls the requests_crawl jobs of settings.CRAWLING_JOBS concurrently on one
+    pooled HTTP client. Each job is a breadth-first crawl of its domain's
+    persistent CrawlFrontier with the same rules as crawl_with_requests: HTML
+    pages are followed to `crawl_depth`, PDFs linked from any crawled page are
+    downloaded, and links outside `domain_lock` are ignored. Requests are
+    throttled by a DomainLimiter shared by all jobs on that domain.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, dest_folder: Optional[Path] = None):
+        self.client = client
+        self.dest_folder = Path(dest_folder or settings.CRAWLER_RAW_DATA_DIR)
+        self._limiters: Dict[str, DomainLimiter] = {}
+        # Downloads by outcome: 'not_modified' (304), 'unchanged' (same content hash), 'changed' or 'new'.
+        self.stats = {"pages": 0, "pdfs": 0, "failed": 0, "bytes": 0, "not_modified": 0, "unchanged": 0, "changed": 0, "new": 0}
+
+    def _limiter(self, job: dict) -> DomainLimiter:
+        domain = urlparse(job['start_url']).netloc
+        if domain not in self._limiters:
+            self._limiters[domain] = DomainLimiter(
+                job.get('max_concurrency', settings.CRAWLER_DOMAIN_CONCURRENCY),
+                job.get('requests_per_second', settings.CRAWLER_DOMAIN_RATE),
+            )
+        return self._limiters[domain]
+
+    async def crawl_job(self, job: dict):
+        """Crawls one job to completion, resuming its unfinished crawl if there is one."""
+        logger.info(f"Starting ASYNC crawl for '{job['name']}'")
+        start = time.perf_counter()
+        limiter = self._limiter(job)
+        frontier = CrawlFrontier(job)
+        await asyncio.to_thread(frontier.start)
+
+        # URLs are leased in batches that keep the limiter's slots busy, and the links and
+        # completions of finished URLs are written back in one round trip per batch.
+        capacity = 2 * job.get('max_concurrency', settings.CRAWLER_DOMAIN_CONCURRENCY)
+        in_flight: Set[asyncio.Task] = set()
+        found: List[Tuple[str, int]] = []
+        completed: List[str] = []
+        failed: List[str] = []
+
+        def sync_frontier(limit: int) -> List[dict]:
+            frontier.push(found)
+            frontier.complete(completed)
+            # Failed URLs go back to the queue until they run out of attempts.
+            frontier.retry(failed)
+            return frontier.lease(limit) if limit > 0 else []
+
+        try:
+            while True:
+                batch = await asyncio.to_thread(sync_frontier, capacity - len(in_flight))
+                found, completed, failed = [], [], []
+                for entry in batch:
+                    in_flight.add(asyncio.create_task(self._crawl_entry(job, limiter, entry)))
+                if not in_flight:
+                    if await asyncio.to_thread(frontier.finished):
+                        break
+                    # Other crawler processes still hold URLs of this job and may queue more.
+                    await asyncio.sleep(POLL_SECONDS)
+                    continue
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    url, links, ok = task.result()
+                    found += links
+                    (completed if ok else failed).append(url)
+        except BaseException:
+            for task in in_flight:
+                task.cancel()
+            await asyncio.gather(*in_flight, return_exceptions=True)
+            await asyncio.to_thread(frontier.release)
+            raise
+        logger.info(f"Finished ASYNC crawl for '{job['name']}' in {time.perf_counter() - start:.1f}s: {await asyncio.to_thread(frontier.counts)}")
+
+    async def _crawl_entry(self, job: dict, limiter: DomainLimiter, entry: dict) -> Tuple[str, List[Tuple[str, int]], bool]:
+        """
+        Crawls one leased frontier entry. Returns its URL, the (url, depth) links to
+        queue, and whether the crawl succeeded; failed URLs are retried, not completed.
+        """
+        try:
+            return entry['url'], await self._crawl_url(job, limiter, entry['url'], entry['depth'], entry['source_id']), True
+        except (httpx.HTTPError, DownloadTooLarge) as e:
+            self.stats["failed"] += 1
+            logger.error(f"Failed to download {entry['url']}: {e}")
+        except Exception as e:
+            self.stats["failed"] += 1
+            logger.error(f"Failed to crawl {entry['url']}: {e}")
+        return entry['url'], [], False
+
+    async def _crawl_url(self, job: dict, limiter: DomainLimiter, url: str, depth: int, source_id: int) -> List[Tuple[str, int]]:
+        """
+        Downloads one URL and returns the (url, depth) links it adds to the job's frontier.
+
+        Raises:
+            httpx.HTTPError, DownloadTooLarge: The download failed.
+        """
+        logger.info(f"Crawling (depth {depth}): {url}")
+        state = await asyncio.to_thread(get_crawl_state, source_id)
+        download = None
+        async with limiter:
+            # The body is streamed to a temporary file, so memory does not grow with file size.
+            async with self.client.stream("GET", url, headers=conditional_headers(state)) as response:
+                if response.status_code != 304:
+                    response.raise_for_status()
+                    download = await astream_to_temp_file(
+                        response.aiter_bytes(CHUNK_SIZE), self.dest_folder, content_length=content_length_of(response.headers)
+                    )
+
+        if download is None:
+            await asyncio.to_thread(mark_source_not_modified, source_id)
+            self.stats["not_modified"] += 1
+            # Links are read from the copy saved by the previous crawl.
+            local_path = Path(state['local_path'])
+            is_pdf = local_path.suffix == '.pdf'
+        else:
+            is_pdf = 'pdf' in response.headers.get('content-type', '').lower()
+            outcome, local_path = await asyncio.to_thread(
+                save_download, self.dest_folder, url, source_id, download, is_pdf, response_validators(response.headers)
+            )
+            self.stats[outcome] += 1
+            self.stats["pdfs" if is_pdf else "pages"] += 1
+            self.stats["bytes"] += download.size
+        if is_pdf or depth >= job['crawl_depth']:
+            return []
+
+        content = await asyncio.to_thread(local_path.read_bytes)
+        links = await asyncio.to_thread(extract_links, content, str(response.url))
+        return links_to_follow(job, links, depth)
+
+def create_client() -> httpx.AsyncClient:
+    """The pooled HTTP client shared by all crawl jobs."""
+    return httpx.AsyncClient(
+        headers={"User-Agent": USER_AGENT},
+        timeout=settings.CRAWLER_TIMEOUT_SECONDS,
+        limits=httpx.Limits(max_connections=settings.CRAWLER_MAX_CONNECTIONS, max_keepalive_connections=settings.CRAWLER_MAX_CONNECTIONS),
+        follow_redirects=True,
+        # Government sites often have certificate chain issues; matches the requests crawler.
+        verify=False,
+    )
+
+async def crawl_jobs(jobs: List[dict], dest_folder: Optional[Path] = None) -> dict:
+    """
+    Runs crawl jobs in parallel. Jobs on different domains proceed independently;
+    jobs on the same domain share its politeness limits.
+
+    Returns:
+        Crawl statistics: pages, PDFs and failed requests, bytes downloaded.
+    """
+    async with create_client() as client:
+        crawler = AsyncCrawler(client, dest_folder)
+        results = await asyncio.gather(*(crawler.crawl_job(job) for job in jobs), return_exceptions=True)
+    for job, result in zip(jobs, results):
+        if isinstance(result, Exception):
+            logger.error(f"Crawl job '{job['name']}' failed: {result}")
+    return crawler.stats
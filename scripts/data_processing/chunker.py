@@ -1,11 +1,195 @@
 import logging
 import json
-from typing import List, Dict, Any
+import re
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 
+from insucompass.config import settings
+from .crawler_utils import get_content_hash
+
 logger = logging.getLogger(__name__)
 
+# Number of PDF pages tokenized together by the token-aware chunker.
+PAGE_BATCH_SIZE = 16
+
+# Number of other documents (HTML pages, text files) loaded and tokenized together by the ingestion pipeline.
+DOCUMENT_BATCH_SIZE = 16
+
+_BLANK_LINE = re.compile(r'\n\s*\n')
+
+@lru_cache(maxsize=1)
+def _get_character_splitter() -> RecursiveCharacterTextSplitter:
+    # Using RecursiveCharacterTextSplitter as it's robust for general text.
+    # These parameters can be tuned based on embedding model's context window and performance.
+    return RecursiveCharacterTextSplitter(
+        chunk_size=1000,
+        chunk_overlap=200,
+        length_function=len,
+        is_separator_regex=False,
+        separators=["\n\n", "\n", ". ", " ", ""],
+    )
+
+class TokenAwareChunker:
+    """
+    Packs text into chunks measured in embedding-model tokens, along the
+    document's own structure.
+
+    Text is split into blocks: paragraphs, headings ('#' lines) and list items
+    ('- ' lines) from the structured HTML loader, or lines of a PDF page.
+    Consecutive blocks are packed greedily up to `chunk_tokens`. A heading always
+    starts a new chunk, so sections are not mixed. When a chunk is closed
+    because it is full, its last block is repeated at the start of the next one
+    if it fits in `overlap_tokens`. Only blocks longer than `chunk_tokens` are
+    cut mid-text, into token windows that overlap by `overlap_tokens`.
+
+    The tokenizer is loaded once per process; all blocks of a batch of texts are
+    tokenized in a single call.
+    """
+
+    def __init__(self, tokenizer_name: str, chunk_tokens: int, overlap_tokens: int):
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_name, use_fast=True)
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = min(overlap_tokens, chunk_tokens // 2)
+
+    @staticmethod
+    def split_blocks(text: str) -> List[str]:
+        """Splits text into structural blocks: paragraphs, or lines if the text has no blank lines."""
+        blocks = [block.strip() for block in _BLANK_LINE.split(text)]
+        if len(blocks) == 1 and '\n' in blocks[0]:
+            blocks = [line.strip() for line in blocks[0].split('\n')]
+        return [block for block in blocks if block]
+
+    def _split_long_block(self, block: str, offsets: List[Tuple[int, int]], first_budget: int) -> List[str]:
+        """Cuts a block into overlapping token windows; the first window holds at most `first_budget` tokens."""
+        pieces = []
+        start, budget = 0, first_budget
+        while True:
+            end = min(start + budget, len(offsets))
+            pieces.append(block[offsets[start][0]:offsets[end - 1][1]])
+            if end == len(offsets):
+                return pieces
+            start, budget = end - self.overlap_tokens, self.chunk_tokens
+
+    def _pack(self, blocks: List[str], offsets: List[List[Tuple[int, int]]]) -> List[str]:
+        chunks: List[str] = []
+        current: List[Tuple[str, int]] = []
+        current_tokens = 0
+
+        def close(carry_overlap: bool):
+            nonlocal current, current_tokens
+            if current:
+                chunks.append('\n'.join(text for text, _ in current))
+            last = current[-1] if current else None
+            current, current_tokens = [], 0
+            if carry_overlap and last is not None and last[1] <= self.overlap_tokens and not last[0].startswith('#'):
+                current, current_tokens = [last], last[1]
+
+        for block, block_offsets in zip(blocks, offsets):
+            n_tokens = len(block_offsets)
+            if block.startswith('#'):
+                close(carry_overlap=False)
+            if n_tokens > self.chunk_tokens:
+                # Keep a heading that is still waiting for content in front of the first window.
+                heading = current if current and all(text.startswith('#') for text, _ in current) else []
+                heading_tokens = sum(tokens + 1 for _, tokens in heading)
+                if not heading:
+                    close(carry_overlap=False)
+                pieces = self._split_long_block(block, block_offsets, max(self.chunk_tokens - heading_tokens, self.overlap_tokens + 1))
+                if heading:
+                    pieces[0] = '\n'.join([text for text, _ in heading] + [pieces[0]])
+                    current, current_tokens = [], 0
+                chunks.extend(pieces)
+                continue
+            # +1 for the newline joining blocks.
+            if current and current_tokens + n_tokens + 1 > self.chunk_tokens:
+                close(carry_overlap=True)
+                if current_tokens + n_tokens + 1 > self.chunk_tokens:
+                    # The carried-over block does not fit next to this one; drop it.
+                    current, current_tokens = [], 0
+            current.append((block, n_tokens))
+            current_tokens += n_tokens + (1 if len(current) > 1 else 0)
+        close(carry_overlap=False)
+        return chunks
+
+    def chunk_texts(self, texts: List[str]) -> List[List[str]]:
+        """
+        Chunks a batch of texts.
+
+        Returns:
+            One list of chunk strings per input text.
+        """
+        blocks_per_text = [self.split_blocks(text or '') for text in texts]
+        all_blocks = [block for blocks in blocks_per_text for block in blocks]
+        if not all_blocks:
+            return [[] for _ in texts]
+        encoded = self.tokenizer(all_blocks, add_special_tokens=False, return_offsets_mapping=True, verbose=False)
+        all_offsets = encoded['offset_mapping']
+
+        results, position = [], 0
+        for blocks in blocks_per_text:
+            results.append(self._pack(blocks, all_offsets[position:position + len(blocks)]))
+            position += len(blocks)
+        return results
+
+@lru_cache(maxsize=1)
+def get_token_chunker() -> TokenAwareChunker:
+    """Returns this process's shared TokenAwareChunker, built from settings."""
+    return TokenAwareChunker(settings.CHUNK_TOKENIZER, settings.CHUNK_TOKENS, settings.CHUNK_OVERLAP_TOKENS)
+
+def _split(texts: List[str]) -> List[List[str]]:
+    """Splits each text with the configured chunker."""
+    if settings.CHUNKER == "token":
+        return get_token_chunker().chunk_texts(texts)
+    splitter = _get_character_splitter()
+    return [splitter.split_text(text) for text in texts]
+
+def _chunk_document(chunk_text: str, source_metadata: Dict[str, Any], **extra: Any) -> Document:
+    # This metadata is crucial for the Fairness Agent and for filtering.
+    chunk_metadata = {
+        "source_id": source_metadata.get("id"),
+        "source_url": source_metadata.get("url"),
+        "source_name": source_metadata.get("name"),
+        "source_local_path": source_metadata.get("local_path"),
+        **extra,
+        # Lets re-ingestion recognise chunks whose text did not change.
+        "chunk_hash": get_content_hash(chunk_text.encode('utf-8'))
+    }
+    return Document(page_content=chunk_text, metadata=chunk_metadata)
+
+def number_chunks(documents: List[Document]) -> List[Document]:
+    """Sets chunk_number (1-based) and total_chunks on a source's complete, ordered list of chunks."""
+    for i, doc in enumerate(documents):
+        doc.metadata["chunk_number"] = i + 1
+        doc.metadata["total_chunks"] = len(documents)
+    return documents
+
+def chunk_texts(texts: List[str], sources_metadata: List[Dict[str, Any]]) -> List[List[Document]]:
+    """
+    Chunks several documents at once, e.g. a batch of HTML pages. With the token
+    chunker, the blocks of all of them are tokenized in a single call.
+
+    Args:
+        texts: The full text content of each document.
+        sources_metadata: The metadata of each document's source, aligned with `texts`.
+
+    Returns:
+        One list of numbered chunks per document; empty for an empty text.
+    """
+    results = []
+    for text, source_metadata, split_texts in zip(texts, sources_metadata, _split([text or '' for text in texts])):
+        if not text:
+            logger.warning(f"Received empty text for source_id {source_metadata.get('id')}. No chunks created.")
+            results.append([])
+            continue
+        documents = number_chunks([_chunk_document(chunk_text, source_metadata) for chunk_text in split_texts])
+        logger.info(f"Created {len(documents)} chunks for source_id {source_metadata.get('id')}")
+        results.append(documents)
+    return results
+
 def chunk_text(text: str, source_metadata: Dict[str, Any]) -> List[Document]:
     """
     Chunks the given text and attaches rich metadata to each chunk.
@@ -18,36 +202,32 @@ def chunk_text(text: str, source_metadata: Dict[str, Any]) -> List[Document]:
     Returns:
         A list of LangChain Document objects, each representing a chunk.
     """
-    if not text:
-        logger.warning(f"Received empty text for source_id {source_metadata.get('id')}. No chunks created.")
-        return []
-        
-    # Using RecursiveCharacterTextSplitter as it's robust for general text.
-    # These parameters can be tuned based on embedding model's context window and performance.
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
-        length_function=len,
-        is_separator_regex=False,
-        separators=["\n\n", "\n", ". ", " ", ""],
-    )
-    
-    split_texts = text_splitter.split_text(text)
-    
-    documents = []
-    for i, chunk_text in enumerate(split_texts):
-        # This metadata is crucial for the Fairness Agent and for filtering.
-        chunk_metadata = {
-            "source_id": source_metadata.get("id"),
-            "source_url": source_metadata.get("url"),
-            "source_name": source_metadata.get("name"),
-            "source_local_path": source_metadata.get("local_path"),
-            "chunk_number": i + 1,
-            "total_chunks": len(split_texts)
-        }
-        
-        doc = Document(page_content=chunk_text, metadata=chunk_metadata)
-        documents.append(doc)
-        
-    logger.info(f"Created {len(documents)} chunks for source_id {source_metadata.get('id')}")
-    return documents
\ No newline at end of file
+    return chunk_texts([text], [source_metadata])[0]
+
+def chunk_pages(pages: Iterable[Tuple[int, str]], source_metadata: Dict[str, Any]) -> Iterator[Document]:
+    """
+    Streams chunks from (page_number, text) pairs, holding at most PAGE_BATCH_SIZE pages in memory.
+
+    Chunks never span pages and carry a `page_number`. They are not numbered;
+    call number_chunks once all chunks of the source are collected.
+
+    Args:
+        pages: An iterable of (page_number, page_text), e.g. from iter_pdf_pages.
+        source_metadata: A dictionary containing metadata about the source document.
+
+    Yields:
+        LangChain Document objects, in page order.
+    """
+    batch: List[Tuple[int, str]] = []
+
+    def flush():
+        for (page_number, _), page_chunks in zip(batch, _split([page_text for _, page_text in batch])):
+            for chunk_text in page_chunks:
+                yield _chunk_document(chunk_text, source_metadata, page_number=page_number)
+        batch.clear()
+
+    for page in pages:
+        batch.append(page)
+        if len(batch) >= PAGE_BATCH_SIZE:
+            yield from flush()
+    yield from flush()
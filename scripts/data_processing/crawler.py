@@ -1,166 +1,193 @@
 import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
 from pathlib import Path
 import time
-from collections import deque
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
 
 # Suppress only the InsecureRequestWarning from urllib3
 import urllib3
 from urllib3.exceptions import InsecureRequestWarning
 urllib3.disable_warnings(InsecureRequestWarning)
 
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service as ChromeService
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.common.exceptions import TimeoutException, WebDriverException
-
-from insucompass.services.database import get_db_connection, add_discovered_source
+from insucompass.services.database import get_crawl_state, mark_source_not_modified
+from insucompass.services.downloads import CHUNK_SIZE, DownloadTooLarge, content_length_of, stream_to_temp_file
 from insucompass.config import settings
-from .crawler_utils import get_content_hash, sanitize_filename
+from .crawler_utils import USER_AGENT, conditional_headers, extract_links, needs_javascript, response_validators, save_download
+from .frontier import POLL_SECONDS, CrawlFrontier, links_to_follow
+from .selenium_pool import SeleniumPool
 
 logger = logging.getLogger(__name__)
 
 def get_session():
     """Creates a requests session with a user agent."""
     session = requests.Session()
-    session.headers.update({"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"})
+    session.headers.update({"User-Agent": USER_AGENT})
     return session
 
-def download_and_save_content(session: requests.Session, url: str, dest_folder: Path, source_id: int):
-    """Downloads a file (HTML, PDF), saves it using the new naming convention, and updates the database."""
+class RenderFailed(Exception):
+    """Raised when a page could not be rendered in the browser, so the crawl can retry it."""
+
+def download_and_save_content(
+    session: requests.Session, url: str, dest_folder: Path, source_id: int, render: Optional[Callable[[str], Optional[bytes]]] = None
+):
+    """
+    Downloads a file (HTML, PDF) with a conditional GET, saves it if it changed, and updates the database.
+    Returns the HTML of a page (read from disk if it was not modified), or None.
+
+    With `render`, an HTML page that needs JavaScript (see needs_javascript) is
+    rendered by it and the rendered HTML is saved instead, under the validators
+    of the HTTP response, so a 304 on the next crawl reuses the rendered copy.
+
+    Raises:
+        RenderFailed: The page needs JavaScript and could not be rendered.
+    """
+    state = get_crawl_state(source_id)
     try:
-        response = session.get(url, timeout=30, verify=False)
-        response.raise_for_status()
-    except requests.RequestException as e:
+        # The body is streamed to a temporary file, so memory does not grow with file size.
+        with session.get(url, timeout=30, verify=False, headers=conditional_headers(state), stream=True) as response:
+            response.raise_for_status()
+            if response.status_code == 304:
+                mark_source_not_modified(source_id)
+                logger.info(f"Not modified since the last crawl: {url}")
+                local_path = Path(state['local_path'])
+                return local_path.read_bytes() if local_path.suffix == '.html' else None
+            download = stream_to_temp_file(
+                response.iter_content(CHUNK_SIZE), dest_folder, content_length=content_length_of(response.headers)
+            )
+    except (requests.RequestException, DownloadTooLarge) as e:
         logger.error(f"Failed to download {url}: {e}")
         return
 
     content_type = response.headers.get('content-type', '').lower()
-    file_ext = '.pdf' if 'pdf' in content_type else '.html'
-    
-    sanitized_name = sanitize_filename(url)
-    final_filename = f"source_{source_id}_{sanitized_name}{file_ext}"
-    save_path = dest_folder / final_filename
-    
-    save_path.parent.mkdir(parents=True, exist_ok=True)
-    
-    with open(save_path, 'wb') as f:
-        f.write(response.content)
-        
-    content_hash = get_content_hash(response.content)
-    
-    with get_db_connection() as conn:
-        conn.cursor().execute(
-            "UPDATE data_sources SET local_path = ?, content_hash = ?, status = ?, updated_at = ? WHERE id = ?",
-            (str(save_path), content_hash, 'processed', time.strftime('%Y-%m-%d %H:%M:%S'), source_id)
-        )
-        conn.commit()
-    logger.info(f"Successfully processed and saved {url} to {save_path}")
-    return response.content if file_ext == '.html' else None
+    is_pdf = 'pdf' in content_type
+    if render and not is_pdf and needs_javascript(download.path.read_bytes(), settings.SELENIUM_MIN_STATIC_TEXT):
+        download.discard()
+        logger.info(f"Page needs JavaScript, rendering it in the browser: {url}")
+        rendered = render(url)
+        if rendered is None:
+            raise RenderFailed(f"Could not render {url}")
+        download = stream_to_temp_file([rendered], dest_folder)
+    _, save_path = save_download(dest_folder, url, source_id, download, is_pdf, response_validators(response.headers))
+    return None if is_pdf else save_path.read_bytes()
+
+class _Throttle:
+    """Spaces the request starts of a job's worker threads at least 1/`rate` seconds apart. A rate of 0 disables it."""
+
+    def __init__(self, rate: float):
+        self._interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+
+    def wait(self):
+        if not self._interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_start - now
+            self._next_start = max(now, self._next_start) + self._interval
+        if wait > 0:
+            time.sleep(wait)
+
+def _crawl_frontier(
+    job: dict,
+    method: str,
+    fetch_page: Callable[[requests.Session, Path, dict], Optional[bytes]],
+    workers: int = 1,
+    throttle: Optional[_Throttle] = None,
+):
+    """
+    Works through a job's persistent frontier with `workers` threads until no URL
+    is left, resuming an unfinished crawl. PDFs are downloaded with requests;
+    `fetch_page` saves an HTML page and returns its HTML, whose links are then
+    queued. Pages for which it raises RenderFailed are queued again, up to
+    CRAWLER_FRONTIER_MAX_ATTEMPTS attempts.
+    """
+    dest_folder = Path(settings.CRAWLER_RAW_DATA_DIR)
+    CrawlFrontier(job).start()
+    stop = threading.Event()
+
+    logger.info(f"Starting {method} crawl for '{job['name']}' ({workers} workers)")
+
+    def work(worker: int):
+        session = get_session()
+        # Each worker holds its own leases, so one that fails releases only its URLs.
+        frontier = CrawlFrontier(job, worker=f"w{worker}" if workers > 1 else None)
+        batch_size = max(1, settings.CRAWLER_FRONTIER_BATCH // workers)
+        try:
+            while not stop.is_set():
+                batch = frontier.lease(batch_size)
+                if not batch:
+                    if frontier.finished():
+                        break
+                    # Other workers or crawler processes still hold URLs of this job and may queue more.
+                    time.sleep(POLL_SECONDS)
+                    continue
+
+                found, failed = [], []
+                for entry in batch:
+                    current_url, current_depth = entry['url'], entry['depth']
+                    logger.info(f"Crawling (depth {current_depth}): {current_url}")
+                    if throttle:
+                        throttle.wait()
+                    if current_url.lower().endswith('.pdf'):
+                        download_and_save_content(session, current_url, dest_folder, entry['source_id'])
+                        continue
+
+                    try:
+                        html_content = fetch_page(session, dest_folder, entry)
+                    except RenderFailed as e:
+                        logger.warning(f"{e}, queueing it again.")
+                        failed.append(entry['url'])
+                        continue
+                    if html_content and current_depth < job['crawl_depth']:
+                        found += links_to_follow(job, extract_links(html_content, current_url), current_depth)
+                # Links are queued before their pages are completed, so a crash in between loses nothing.
+                frontier.push(found)
+                frontier.complete([entry['url'] for entry in batch if entry['url'] not in failed])
+                frontier.retry(failed)
+        finally:
+            frontier.release()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="crawl") as executor:
+        futures = [executor.submit(work, worker) for worker in range(workers)]
+        try:
+            for future in futures:
+                future.result()
+        except BaseException:
+            stop.set()
+            raise
+    logger.info(f"Finished {method} crawl for '{job['name']}': {CrawlFrontier(job).counts()}")
 
 def crawl_with_requests(job: dict):
     """Crawls a domain using the requests library for static sites."""
-    session = get_session()
-    dest_folder = Path("data/raw")
-    
-    queue = deque([(job['start_url'], 0)])
-    visited_urls = {job['start_url']}
-
-    logger.info(f"Starting REQUESTS crawl for '{job['name']}'")
-
-    while queue:
-        current_url, current_depth = queue.popleft()
-        if current_depth > job['crawl_depth']:
-            continue
-
-        logger.info(f"Crawling (depth {current_depth}): {current_url}")
-        
-        source_id = add_discovered_source(current_url, job['domain_lock'], 'html')
-        html_content = download_and_save_content(session, current_url, dest_folder, source_id)
-        
-        if not html_content or current_depth >= job['crawl_depth']:
-            continue
-
-        soup = BeautifulSoup(html_content, 'lxml')
-        for link in soup.find_all('a', href=True):
-            href = link['href']
-            full_url = urljoin(current_url, href).split('#')[0]
-
-            if not full_url.startswith(('http', 'https')):
-                continue
-
-            if full_url not in visited_urls and urlparse(full_url).netloc.endswith(job['domain_lock']):
-                visited_urls.add(full_url)
-                if full_url.lower().endswith('.pdf'):
-                    pdf_id = add_discovered_source(full_url, job['domain_lock'], 'pdf')
-                    download_and_save_content(session, full_url, dest_folder, pdf_id)
-                else:
-                    queue.append((full_url, current_depth + 1))
-        time.sleep(1)
-
-def crawl_with_selenium(driver: webdriver.Chrome, job: dict):
-    """Crawls a domain using Selenium for dynamic sites."""
-    session = get_session()
-    dest_folder = Path("data/raw")
-    
-    queue = deque([(job['start_url'], 0)])
-    visited_urls = {job['start_url']}
-
-    logger.info(f"Starting SELENIUM crawl for '{job['name']}'")
-
-    while queue:
-        current_url, current_depth = queue.popleft()
-        if current_depth > job['crawl_depth']:
-            continue
 
-        logger.info(f"Crawling (depth {current_depth}): {current_url}")
-        try:
-            driver.get(current_url)
-            WebDriverWait(driver, 20).until(EC.presence_of_element_located((By.TAG_NAME, "body")))
-            time.sleep(3)
-            page_source = driver.page_source
-        except (TimeoutException, WebDriverException) as e:
-            logger.error(f"Selenium failed to get {current_url}: {e}")
-            continue
-            
-        source_id = add_discovered_source(current_url, job['domain_lock'], 'html')
-        
-        sanitized_name = sanitize_filename(current_url)
-        final_filename = f"source_{source_id}_{sanitized_name}.html"
-        save_path = dest_folder / final_filename
-        
-        save_path.parent.mkdir(parents=True, exist_ok=True)
-        save_path.write_text(page_source, encoding='utf-8')
-        
-        content_hash = get_content_hash(page_source.encode('utf-8'))
-        with get_db_connection() as conn:
-            conn.cursor().execute(
-                "UPDATE data_sources SET local_path = ?, content_hash = ?, status = ?, updated_at = ? WHERE id = ?",
-                (str(save_path), content_hash, 'processed', time.strftime('%Y-%m-%d %H:%M:%S'), source_id)
-            )
-            conn.commit()
-        logger.info(f"Successfully processed and saved {current_url} to {save_path}")
-
-        if current_depth >= job['crawl_depth']:
-            continue
-
-        soup = BeautifulSoup(page_source, 'lxml')
-        for link in soup.find_all('a', href=True):
-            href = link['href']
-            full_url = urljoin(current_url, href).split('#')[0]
-
-            if not full_url.startswith(('http', 'https')):
-                continue
-
-            if full_url not in visited_urls and urlparse(full_url).netloc.endswith(job['domain_lock']):
-                visited_urls.add(full_url)
-                if full_url.lower().endswith('.pdf'):
-                    pdf_id = add_discovered_source(full_url, job['domain_lock'], 'pdf')
-                    download_and_save_content(session, full_url, dest_folder, pdf_id)
-                else:
-                    queue.append((full_url, current_depth + 1))
\ No newline at end of file
+    def fetch_page(session: requests.Session, dest_folder: Path, entry: dict) -> Optional[bytes]:
+        html_content = download_and_save_content(session, entry['url'], dest_folder, entry['source_id'])
+        time.sleep(1)
+        return html_content
+
+    _crawl_frontier(job, "REQUESTS", fetch_page)
+
+def crawl_with_selenium(pool: SeleniumPool, job: dict):
+    """
+    Crawls a domain using Selenium for dynamic sites, with one worker thread per
+    pool driver (up to the job's max_concurrency). Unless the job sets
+    "precheck": False, pages are fetched with plain HTTP first and only rendered
+    in the browser if they need JavaScript.
+    """
+    precheck = job.get('precheck', settings.SELENIUM_PRECHECK)
+
+    def fetch_page(session: requests.Session, dest_folder: Path, entry: dict) -> Optional[bytes]:
+        if precheck:
+            return download_and_save_content(session, entry['url'], dest_folder, entry['source_id'], render=pool.render)
+        page_source = pool.render(entry['url'])
+        if page_source is None:
+            raise RenderFailed(f"Could not render {entry['url']}")
+        save_download(dest_folder, entry['url'], entry['source_id'], stream_to_temp_file([page_source], dest_folder), is_pdf=False)
+        return page_source
+
+    workers = min(pool.size, job.get('max_concurrency', settings.CRAWLER_DOMAIN_CONCURRENCY))
+    throttle = _Throttle(job.get('requests_per_second', settings.CRAWLER_DOMAIN_RATE))
+    _crawl_frontier(job, "SELENIUM", fetch_page, workers=workers, throttle=throttle)
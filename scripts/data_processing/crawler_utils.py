@@ -1,8 +1,17 @@
 import hashlib
+import logging
 import re
-from urllib.parse import urlparse
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+from urllib.parse import urljoin, urlparse
 from pathlib import Path
 
+from insucompass.services.database import get_crawl_state, mark_source_downloaded
+from insucompass.services.downloads import StreamedDownload, content_length_of
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
 def get_content_hash(content: bytes) -> str:
     """Generates a SHA-256 hash for the given binary content."""
     return hashlib.sha256(content).hexdigest()
@@ -24,4 +33,93 @@ def sanitize_filename(url: str) -> str:
     sanitized = re.sub(r'[<>:"/\\|?*]', '_', path_part)
     
     # Limit length to avoid OS errors
-    return sanitized[:150]
\ No newline at end of file
+    return sanitized[:150]
+
+def extract_links(html: bytes, base_url: str) -> List[str]:
+    """
+    Returns the absolute http(s) URLs of a page's <a href> links, without
+    fragments, deduplicated in document order. Uses lxml's C parser and an
+    XPath over the href attributes; falls back to BeautifulSoup if that fails.
+    """
+    try:
+        import lxml.html
+        hrefs = lxml.html.document_fromstring(html).xpath('//a/@href')
+    except Exception:
+        from bs4 import BeautifulSoup
+        hrefs = [link['href'] for link in BeautifulSoup(html, 'html.parser').find_all('a', href=True)]
+
+    links = {}
+    for href in hrefs:
+        full_url = urljoin(base_url, href.strip()).split('#')[0]
+        if full_url.startswith(('http://', 'https://')):
+            links[full_url] = None
+    return list(links)
+
+def conditional_headers(state: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    """
+    Request headers that turn a recrawl into a conditional GET, from the
+    validators of the last download. None if that download is no longer on
+    disk, since a 304 would leave nothing to read links from.
+    """
+    if not state or not state.get('local_path') or not Path(state['local_path']).exists():
+        return {}
+    headers = {}
+    if state.get('etag'):
+        headers['If-None-Match'] = state['etag']
+    if state.get('last_modified'):
+        headers['If-Modified-Since'] = state['last_modified']
+    return headers
+
+def response_validators(headers: Mapping[str, str]) -> Dict[str, Any]:
+    """The HTTP validators of a response worth keeping for the next conditional GET."""
+    return {
+        'etag': headers.get('etag'),
+        'last_modified': headers.get('last-modified'),
+        'content_length': content_length_of(headers),
+    }
+
+def save_download(
+    dest_folder: Path, url: str, source_id: int, download: StreamedDownload, is_pdf: bool, validators: Optional[Dict[str, Any]] = None
+) -> Tuple[str, Path]:
+    """
+    Moves a streamed download into place with the crawler's naming convention and
+    records it in data_sources. If the content did not change, the existing file
+    is kept and the download discarded.
+
+    Returns:
+        ('new', 'changed' or 'unchanged' (see mark_source_downloaded), the saved file's path).
+    """
+    save_path = dest_folder / f"source_{source_id}_{sanitize_filename(url)}{'.pdf' if is_pdf else '.html'}"
+    state = get_crawl_state(source_id)
+    if state and state['content_hash'] == download.sha256 and save_path.exists():
+        download.discard()
+    else:
+        download.commit(save_path)
+    outcome = mark_source_downloaded(source_id, str(save_path), download.sha256, validators)
+    logger.info(f"Saved {url} to {save_path} ({outcome}, {download.size} bytes)")
+    return outcome, save_path
+
+def needs_javascript(html: bytes, min_text_chars: int) -> bool:
+    """
+    True if a page fetched with plain HTTP looks like it is rendered in the browser:
+    it has scripts, but its main content (<main>, role="main", else <body>) has fewer
+    than `min_text_chars` characters of text outside <script>, <style>, <noscript>
+    and <template>. Uses lxml and falls back to BeautifulSoup if that fails.
+    """
+    try:
+        import lxml.html
+        tree = lxml.html.document_fromstring(html)
+        has_scripts = bool(tree.xpath('//script'))
+        main = (tree.xpath('//main | //*[@role="main"]') or tree.xpath('//body') or [tree])[0]
+        for element in main.xpath('.//script | .//style | .//noscript | .//template'):
+            element.drop_tree()
+        text = main.text_content()
+    except Exception:
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(html, 'html.parser')
+        has_scripts = soup.find('script') is not None
+        main = soup.find('main') or soup.find(attrs={'role': 'main'}) or soup.body or soup
+        for element in main.find_all(['script', 'style', 'noscript', 'template']):
+            element.decompose()
+        text = main.get_text(' ')
+    return has_scripts and len(' '.join(text.split())) < min_text_chars
@@ -1,46 +1,254 @@
+import hashlib
 import logging
+import re
+import threading
 from pathlib import Path
 from bs4 import BeautifulSoup
 from pypdf import PdfReader
-from typing import Optional
+from typing import Iterator, List, Optional, Tuple
+
+from insucompass.config import settings
+from scripts.data_processing.parsed_text_cache import get_parsed_text, join_pages, put_parsed_text, split_pages
 
 logger = logging.getLogger(__name__)
 
-def load_html_content(file_path: Path) -> Optional[str]:
-    """Loads and extracts clean text content from an HTML file."""
+# Boilerplate removed before extracting page text: script, style, nav, footer, header, and other common clutter.
+BOILERPLATE_TAGS = ('script', 'style', 'nav', 'footer', 'header', 'aside', 'form')
+
+_lxml_parsers = threading.local()
+
+_HEADING = re.compile(r'^#+ (.*)$', re.MULTILINE)
+
+def file_content_hash(file_path: Path) -> str:
+    """SHA-256 of a raw file, the same hash the crawler stores as content_hash."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _cache_hash(file_path: Path, content_hash: Optional[str]) -> Optional[str]:
+    if content_hash or not settings.PARSED_TEXT_CACHE_ENABLED:
+        return content_hash
+    try:
+        return file_content_hash(file_path)
+    except OSError:
+        return None
+
+def _get_lxml_parser():
+    # lxml parser instances must not be shared between threads.
+    parser = getattr(_lxml_parsers, "parser", None)
+    if parser is None:
+        import lxml.html
+        parser = lxml.html.HTMLParser(encoding='utf-8', remove_comments=True, remove_pis=True)
+        _lxml_parsers.parser = parser
+    return parser
+
+def extract_html_text_lxml(html: bytes) -> str:
+    """
+    Extracts clean text from HTML with lxml's C parser and no Python-level tree.
+    Applies the same boilerplate rules and whitespace normalisation as the BeautifulSoup path.
+    """
+    import lxml.html
+    from lxml import etree
+
+    root = lxml.html.document_fromstring(html, parser=_get_lxml_parser())
+    # with_tail=False keeps the text that follows a removed element.
+    etree.strip_elements(root, *BOILERPLATE_TAGS, with_tail=False)
+    return ' '.join(' '.join(root.itertext()).split())
+
+# Elements that start a new block in structured extraction.
+BLOCK_TAGS = frozenset({
+    'title', 'body', 'main', 'article', 'section', 'div', 'p', 'br', 'blockquote', 'pre',
+    'ul', 'ol', 'li', 'dl', 'dt', 'dd', 'table', 'tr', 'td', 'th', 'caption',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+})
+
+def _block_prefix(tag: str) -> str:
+    if len(tag) == 2 and tag[0] == 'h' and tag[1].isdigit():
+        return '#' * int(tag[1]) + ' '
+    if tag == 'li':
+        return '- '
+    return ''
+
+def extract_html_text_structured(html: bytes) -> str:
+    """
+    Extracts text from HTML with lxml, keeping block structure: one block per
+    paragraph-level element separated by blank lines, headings prefixed with
+    '#' per level and list items with '- '. Uses the same boilerplate rules as
+    extract_html_text_lxml.
+    """
+    import lxml.html
+    from lxml import etree
+
+    root = lxml.html.document_fromstring(html, parser=_get_lxml_parser())
+    etree.strip_elements(root, *BOILERPLATE_TAGS, with_tail=False)
+
+    blocks: List[str] = []
+    buffer: List[str] = []
+    open_blocks: List[str] = []
+
+    def flush():
+        text = ' '.join(' '.join(buffer).split())
+        buffer.clear()
+        if text:
+            blocks.append(_block_prefix(open_blocks[-1] if open_blocks else '') + text)
+
+    for event, element in etree.iterwalk(root, events=('start', 'end')):
+        tag = element.tag if isinstance(element.tag, str) else ''
+        if event == 'start':
+            if tag in BLOCK_TAGS:
+                flush()
+                open_blocks.append(tag)
+            if element.text:
+                buffer.append(element.text)
+        else:
+            if tag in BLOCK_TAGS:
+                flush()
+                open_blocks.pop()
+            if element.tail:
+                buffer.append(element.tail)
+    flush()
+    return '\n\n'.join(blocks)
+
+def extract_html_text_bs4(html: bytes) -> str:
+    """Extracts clean text from HTML with BeautifulSoup."""
+    soup = BeautifulSoup(html.decode('utf-8'), 'lxml')
+
+    for element in soup(list(BOILERPLATE_TAGS)):
+        element.decompose()
+
+    # Get text, strip whitespace, and join lines
+    return ' '.join(soup.get_text(separator=' ', strip=True).split())
+
+def load_html_content(file_path: Path, structured: Optional[bool] = None, content_hash: Optional[str] = None) -> Optional[str]:
+    """
+    Loads and extracts clean text content from an HTML file.
+
+    Args:
+        file_path: Path to the HTML file.
+        structured: Keep headings, list items and paragraphs as separate blocks
+                    (see extract_html_text_structured). Defaults to True when the
+                    token-aware chunker is configured.
+        content_hash: SHA-256 of the file, if known. Extracted text is cached under it.
+    """
     logger.debug(f"Loading HTML from: {file_path}")
+    if structured is None:
+        structured = settings.CHUNKER == "token"
+    kind = "html:structured" if structured else f"html:{settings.HTML_EXTRACTOR}"
+    content_hash = _cache_hash(file_path, content_hash)
+    cached = get_parsed_text(content_hash, kind)
+    if cached is not None:
+        return cached[0]
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            soup = BeautifulSoup(f.read(), 'lxml')
-        
-        # Remove script, style, nav, footer, header, and other common clutter
-        for element in soup(['script', 'style', 'nav', 'footer', 'header', 'aside', 'form']):
-            element.decompose()
+        with open(file_path, 'rb') as f:
+            html = f.read()
 
-        # Get text, strip whitespace, and join lines
-        text = ' '.join(soup.get_text(separator=' ', strip=True).split())
+        text = None
+        if settings.HTML_EXTRACTOR == "lxml" or structured:
+            try:
+                text = extract_html_text_structured(html) if structured else extract_html_text_lxml(html)
+            except Exception as e:
+                logger.debug(f"lxml extraction failed for {file_path}, falling back to BeautifulSoup: {e}")
+        if text is None:
+            text = extract_html_text_bs4(html)
         
         if not text:
             logger.warning(f"No text content could be extracted from {file_path}")
             return None
+        sections = [[match.group(1), match.start()] for match in _HEADING.finditer(text)] if structured else []
+        put_parsed_text(content_hash, kind, text, sections)
         return text
     except Exception as e:
         logger.error(f"Failed to load or parse HTML file {file_path}: {e}")
         return None
 
-def load_pdf_content(file_path: Path) -> Optional[str]:
+def count_pdf_pages(file_path: Path) -> int:
+    """Returns the number of pages of a PDF without extracting any text."""
+    return len(PdfReader(file_path).pages)
+
+def pdf_page_count(file_path: Path, content_hash: Optional[str] = None) -> int:
+    """count_pdf_pages, served from the parsed text cache once the file was seen."""
+    content_hash = _cache_hash(file_path, content_hash)
+    cached = get_parsed_text(content_hash, "pdf:page_count")
+    if cached is not None:
+        return int(cached[0])
+    page_count = count_pdf_pages(file_path)
+    put_parsed_text(content_hash, "pdf:page_count", str(page_count))
+    return page_count
+
+def iter_pdf_pages(file_path: Path, start: int = 0, stop: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+    """
+    Yields (page_number, text) for each page of a PDF that has text, one page at a time.
+
+    Args:
+        file_path: Path to the PDF.
+        start: Index of the first page to extract (0-based).
+        stop: Index after the last page to extract. Defaults to the end of the document.
+    """
+    reader = PdfReader(file_path)
+    stop = len(reader.pages) if stop is None else min(stop, len(reader.pages))
+    for index in range(start, stop):
+        page_text = reader.pages[index].extract_text()
+        if page_text:
+            yield index + 1, page_text
+
+def iter_pdf_pages_cached(
+    file_path: Path,
+    content_hash: Optional[str] = None,
+    start: int = 0,
+    stop: Optional[int] = None
+) -> Iterator[Tuple[int, str]]:
+    """
+    iter_pdf_pages backed by the parsed text cache. The text is cached in blocks
+    of PARSED_TEXT_PDF_BLOCK_PAGES pages: a page range only reads the blocks it
+    overlaps, and a block is stored as soon as its pages are extracted, so at
+    most one block of text is held in memory. Blocks a range only partly covers
+    are extracted but not stored.
+    """
+    content_hash = _cache_hash(file_path, content_hash)
+    if not content_hash or not settings.PARSED_TEXT_CACHE_ENABLED:
+        yield from iter_pdf_pages(file_path, start, stop)
+        return
+
+    page_count = pdf_page_count(file_path, content_hash)
+    stop = page_count if stop is None else min(stop, page_count)
+    block_pages = max(1, settings.PARSED_TEXT_PDF_BLOCK_PAGES)
+    reader = None
+    for first in range(start - start % block_pages, stop, block_pages):
+        last = min(first + block_pages, page_count)
+        low, high = max(first, start), min(last, stop)
+        # The block size is part of the key, so changing it never mixes blocks of different sizes.
+        kind = f"pdf:{block_pages}[{first}]"
+        cached = get_parsed_text(content_hash, kind)
+        if cached is not None:
+            for page_number, page_text in split_pages(*cached):
+                if low < page_number <= high:
+                    yield page_number, page_text
+            continue
+
+        if reader is None:
+            reader = PdfReader(file_path)
+        complete = (low, high) == (first, last)
+        pages = []
+        for index in range(low, high):
+            page_text = reader.pages[index].extract_text()
+            if page_text:
+                if complete:
+                    pages.append((index + 1, page_text))
+                yield index + 1, page_text
+        if complete:
+            put_parsed_text(content_hash, kind, *join_pages(pages))
+
+def load_pdf_content(file_path: Path, content_hash: Optional[str] = None) -> Optional[str]:
     """Loads and extracts text content from a PDF file."""
     logger.debug(f"Loading PDF from: {file_path}")
     if not file_path.exists():
         logger.error(f"PDF file not found at {file_path}")
         return None
     try:
-        reader = PdfReader(file_path)
-        text = ""
-        for page in reader.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text + "\n\n" # Add space between pages
+        # Add space between pages
+        text, _ = join_pages(list(iter_pdf_pages_cached(file_path, content_hash)))
         
         if not text:
             logger.warning(f"No text could be extracted from PDF {file_path}")
@@ -50,10 +258,14 @@ def load_pdf_content(file_path: Path) -> Optional[str]:
         logger.error(f"Failed to load or parse PDF file {file_path}: {e}")
         return None
 
-def load_document(file_path_str: str) -> Optional[str]:
+def load_document(file_path_str: str, content_hash: Optional[str] = None) -> Optional[str]:
     """
     Generic document loader that dispatches to the correct function
     based on file extension.
+
+    Text extracted before from a file with the same content is served from the
+    parsed text cache without parsing. Pass the file's content_hash when it is
+    known to skip hashing the file.
     """
     file_path = Path(file_path_str)
     if not file_path.exists():
@@ -62,9 +274,9 @@ def load_document(file_path_str: str) -> Optional[str]:
 
     extension = file_path.suffix.lower()
     if extension == '.html':
-        return load_html_content(file_path)
+        return load_html_content(file_path, content_hash=content_hash)
     elif extension == '.pdf':
-        return load_pdf_content(file_path)
+        return load_pdf_content(file_path, content_hash=content_hash)
     else:
         logger.warning(f"Unsupported file type '{extension}' for file {file_path}. Skipping.")
-        return None
\ No newline at end of file
+        return None
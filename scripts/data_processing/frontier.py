@@ -0,0 +1,145 @@
+import logging
+import os
+import socket
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+from insucompass.config import settings
+from insucompass.services.database import (
+    add_discovered_sources,
+    complete_frontier,
+    enqueue_frontier,
+    filter_new_frontier_urls,
+    get_frontier_counts,
+    get_frontier_lease_owners,
+    lease_frontier,
+    release_frontier_leases,
+    retry_frontier,
+    start_crawl_frontier,
+)
+
+logger = logging.getLogger(__name__)
+
+# Seconds a crawler waits for URLs while other processes still hold leases on the job.
+POLL_SECONDS = 1.0
+
+def _is_dead_local_owner(owner: str) -> bool:
+    """True if a lease owner is a process on this host that no longer runs."""
+    host, pid = (owner.split(":") + [""])[:2]
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        return False
+    return False
+
+class CrawlFrontier:
+    """
+    A crawl job's queue and visited set, kept in the crawl_frontier table so a
+    crawl survives restarts and can be shared by several crawler processes.
+    Every crawler (requests, Selenium, async) works the same way: start(), then
+    lease() URLs, push() the links found on them and complete() them (or retry()
+    the ones that failed), until finished().
+    """
+
+    def __init__(self, job: dict, worker: Optional[str] = None):
+        self.job = job
+        self.name = job['name']
+        # Leases are held per process, or per worker thread if `worker` names one.
+        self._process = f"{socket.gethostname()}:{os.getpid()}"
+        self.owner = f"{self._process}:{worker}" if worker else self._process
+        # URLs this process already pushed; saves a database lookup for links repeated on every page.
+        self._known: Set[str] = set()
+
+    def start(self) -> bool:
+        """
+        Resumes the job's unfinished crawl or starts a new one from its start URL.
+        Call it once per process, before leasing. Leases left behind by this
+        process or by dead processes on this host are returned to the queue first.
+
+        Returns:
+            True if an unfinished crawl was resumed.
+        """
+        stale = [
+            owner for owner in get_frontier_lease_owners(self.name)
+            if owner.split(":")[:2] == self._process.split(":") or _is_dead_local_owner(owner)
+        ]
+        if stale:
+            released = release_frontier_leases(self.name, stale)
+            logger.info(f"Released {released} stale frontier leases of '{self.name}'.")
+        add_discovered_sources([(self.job['start_url'], self.job['domain_lock'], 'html')])
+        resumed = start_crawl_frontier(self.name, self.job['start_url'])
+        self._known = {self.job['start_url']}
+        if resumed:
+            logger.info(f"Resuming the unfinished crawl of '{self.name}': {self.counts()}")
+        return resumed
+
+    def lease(self, limit: Optional[int] = None) -> List[Dict]:
+        """Leases the next URLs to this process: dicts with url, depth and source_id."""
+        return lease_frontier(
+            self.name, self.owner, limit or settings.CRAWLER_FRONTIER_BATCH,
+            settings.CRAWLER_FRONTIER_LEASE_SECONDS, settings.CRAWLER_FRONTIER_MAX_ATTEMPTS,
+        )
+
+    def push(self, links: Iterable[Tuple[str, int]]) -> int:
+        """
+        Adds links found during the crawl. New ones are registered as data sources
+        and queued, breadth-first: the priority of a link is its depth.
+
+        Args:
+            links: (url, depth) pairs, e.g. from links_to_follow.
+
+        Returns:
+            The number of URLs queued.
+        """
+        depths: Dict[str, int] = {}
+        for url, depth in links:
+            if url not in self._known and url not in depths:
+                depths[url] = depth
+        if not depths:
+            return 0
+        self._known.update(depths)
+        new = filter_new_frontier_urls(self.name, list(depths))
+        if not new:
+            return 0
+        domain = self.job['domain_lock']
+        add_discovered_sources([(url, domain, 'pdf' if url.lower().endswith('.pdf') else 'html') for url in new])
+        return enqueue_frontier(self.name, [(url, depths[url], depths[url]) for url in new])
+
+    def complete(self, urls: List[str]):
+        """Marks leased URLs as crawled."""
+        if urls:
+            complete_frontier(self.name, self.owner, urls)
+
+    def retry(self, urls: List[str]):
+        """Queues leased URLs whose crawl failed again, up to CRAWLER_FRONTIER_MAX_ATTEMPTS attempts."""
+        if urls:
+            retry_frontier(self.name, self.owner, urls, settings.CRAWLER_FRONTIER_MAX_ATTEMPTS)
+
+    def release(self):
+        """Returns this process's unfinished leases to the queue, e.g. when a crawl is interrupted."""
+        release_frontier_leases(self.name, [self.owner])
+
+    def counts(self) -> Dict[str, int]:
+        return get_frontier_counts(self.name)
+
+    def finished(self) -> bool:
+        """True once no URL is queued or leased by any process."""
+        counts = self.counts()
+        return not counts.get('queued') and not counts.get('leased')
+
+def links_to_follow(job: dict, links: Iterable[str], depth: int) -> List[Tuple[str, int]]:
+    """
+    The (url, depth) entries a page at `depth` adds to the frontier: links on the
+    job's domain, PDFs at the page's depth (they are downloaded whatever their
+    depth) and pages one level deeper.
+    """
+    entries = []
+    for link in links:
+        if not urlparse(link).netloc.endswith(job['domain_lock']):
+            continue
+        entries.append((link, depth if link.lower().endswith('.pdf') else depth + 1))
+    return entries
@@ -0,0 +1,412 @@
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from langchain_core.documents import Document
+
+from insucompass.config import settings
+from scripts.data_processing.document_loader import iter_pdf_pages_cached, load_document, pdf_page_count
+from scripts.data_processing.chunker import DOCUMENT_BATCH_SIZE, chunk_pages, chunk_texts, number_chunks
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of a stage's output on a queue.
+_END = object()
+
+# How often a stage blocked on a queue checks whether the pipeline was stopped.
+_STOP_POLL_SECONDS = 0.5
+
+class _Stopped(Exception):
+    """Raised in a stage blocked on a queue once the pipeline is stopped."""
+
+def _init_parse_worker(settings_values: Dict[str, Any]):
+    """
+    Runs first in every parse worker. Workers are spawned, not forked, so they
+    start from a fresh interpreter: apply the parent's settings, including ones
+    changed at runtime, and its logging.
+    """
+    for name, value in settings_values.items():
+        setattr(settings, name, value)
+    logging.basicConfig(level=settings.LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
+
+class StageStats:
+    """Counts the work a pipeline stage did and the time it spent busy."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.chunks = 0
+        self.reused = 0
+        self.busy_seconds = 0.0
+
+    def to_dict(self, wall_seconds: float) -> Dict[str, Any]:
+        return {
+            "stage": self.name,
+            "sources": self.items,
+            "chunks": self.chunks,
+            "reused": self.reused,
+            "busy_s": round(self.busy_seconds, 3),
+            "sources_per_s": round(self.items / wall_seconds, 2) if wall_seconds else 0.0,
+            "chunks_per_s": round(self.chunks / wall_seconds, 2) if wall_seconds else 0.0,
+        }
+
+def _is_pdf(source: Dict[str, Any]) -> bool:
+    local_path = Path(source.get('local_path') or '')
+    return local_path.suffix.lower() == '.pdf' and local_path.exists()
+
+def load_and_chunk_source(
+    source: Dict[str, Any],
+    page_range: Optional[Tuple[int, int]] = None
+) -> Tuple[Optional[List[Document]], Optional[str], float]:
+    """
+    Parse stage, run in a worker process: loads and chunks one source.
+
+    PDFs are streamed page by page, so only one page's text is held at a time and
+    each chunk carries its page_number. With `page_range`, only those pages
+    (0-based, end exclusive) are extracted and the chunks are left unnumbered
+    for the caller to number once all ranges are merged.
+
+    Returns:
+        (documents, failure_status, seconds). failure_status is set when the
+        source could not be loaded; documents is an empty list when the text
+        produced no chunks.
+    """
+    if not _is_pdf(source):
+        return load_and_chunk_sources([source])[0]
+
+    start = time.perf_counter()
+    pages = iter_pdf_pages_cached(Path(source['local_path']), source.get('content_hash'), *(page_range or (0, None)))
+    documents = list(chunk_pages(pages, source_metadata=source))
+    if not documents and page_range is None:
+        logger.error(f"Could not load content from {source['local_path']}. Skipping ingestion for this source.")
+        return None, 'ingestion_failed', time.perf_counter() - start
+    if page_range is None:
+        number_chunks(documents)
+        logger.info(f"Created {len(documents)} chunks for source_id {source.get('id')}")
+    return documents, None, time.perf_counter() - start
+
+def load_and_chunk_sources(sources: List[Dict[str, Any]]) -> List[Tuple[Optional[List[Document]], Optional[str], float]]:
+    """
+    Parse stage for a batch of non-PDF sources (HTML pages, text files), run in a
+    worker process: loads them all, then chunks them together so the tokenizer
+    sees one batch across documents.
+
+    Returns:
+        One (documents, failure_status, seconds) per source, as load_and_chunk_source.
+        The batch's time is split evenly between its sources.
+    """
+    start = time.perf_counter()
+    texts = [load_document(source['local_path'], source.get('content_hash')) for source in sources]
+    loaded = [(source, text) for source, text in zip(sources, texts) if text]
+    chunked = iter(chunk_texts([text for _, text in loaded], [source for source, _ in loaded]))
+    seconds = (time.perf_counter() - start) / max(1, len(sources))
+
+    results = []
+    for source, text in zip(sources, texts):
+        if not text:
+            logger.error(f"Could not load content from {source['local_path']}. Skipping ingestion for this source.")
+            results.append((None, 'ingestion_failed', seconds))
+        else:
+            results.append((next(chunked), None, seconds))
+    return results
+
+def _load_and_chunk_part(source: Dict[str, Any], page_range: Optional[Tuple[int, int]]) -> List[Tuple[Optional[List[Document]], Optional[str], float]]:
+    """load_and_chunk_source for one PDF or page range, shaped like a batch result of one."""
+    return [load_and_chunk_source(source, page_range)]
+
+def pdf_page_ranges(source: Dict[str, Any], pages_per_task: int) -> List[Optional[Tuple[int, int]]]:
+    """
+    Splits a large PDF source into page ranges that can be extracted in parallel.
+    Returns [None] (one task for the whole source) for everything else.
+    """
+    if pages_per_task <= 0 or not _is_pdf(source):
+        return [None]
+    local_path = Path(source['local_path'])
+    try:
+        # Cached text is stored per block of pages, so ranges of an extracted PDF still only read their own pages.
+        page_count = pdf_page_count(local_path, source.get('content_hash'))
+    except Exception as e:
+        logger.warning(f"Could not count pages of {local_path}, extracting it in one task: {e}")
+        return [None]
+    if page_count <= pages_per_task:
+        return [None]
+    return [(start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)]
+
+class IngestionPipeline:
+    """
+    A staged ingestion pipeline:
+
+        parse (process pool) -> embed (one batching thread) -> write (one thread)
+
+    Parsing and chunking of HTML/PDF sources runs in `workers` processes; PDFs
+    longer than `pdf_pages_per_task` pages are split into page ranges so one
+    large document is extracted by several workers at once, and other sources
+    are parsed in batches of DOCUMENT_BATCH_SIZE, tokenized together. The
+    embed stage fills encode batches of at least `batch_size` chunks across
+    sources, so the model always sees large batches. A single writer keeps
+    Chroma and SQLite writes serialized. Bounded queues between the stages
+    apply backpressure so memory stays flat on large crawls. If a stage fails
+    or the run is interrupted, every stage is stopped and run() raises.
+
+    If `diff_fn` is given, it returns the existing vector ID of each chunk that
+    is already stored (None otherwise); only the remaining chunks are
+    embedded. It may instead return a status string, which skips the whole
+    source and hands it to `fail_fn` with that status. `write_fn` receives the embeddings aligned with the documents,
+    with None in place of reused chunks, and the list of reused vector IDs.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], List[List[float]]],
+        write_fn: Callable[[Dict[str, Any], List[Document], List[Optional[List[float]]], List[Optional[str]]], None],
+        fail_fn: Callable[[Dict[str, Any], str], None],
+        diff_fn: Optional[Callable[[Dict[str, Any], List[Document]], Union[List[Optional[str]], str]]] = None,
+        workers: int = 4,
+        batch_size: int = 256,
+        queue_size: int = 64,
+        pdf_pages_per_task: int = 0,
+    ):
+        self.embed_fn = embed_fn
+        self.write_fn = write_fn
+        self.fail_fn = fail_fn
+        self.diff_fn = diff_fn
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.pdf_pages_per_task = pdf_pages_per_task
+        self.stats = {name: StageStats(name) for name in ("parse", "embed", "write")}
+        self._stop = threading.Event()
+        self._failed_stage: Optional[str] = None
+
+    def _put(self, out: queue.Queue, item: Any):
+        while not self._stop.is_set():
+            try:
+                out.put(item, timeout=_STOP_POLL_SECONDS)
+                return
+            except queue.Full:
+                continue
+        raise _Stopped()
+
+    def _get(self, inbox: queue.Queue) -> Any:
+        while not self._stop.is_set():
+            try:
+                return inbox.get(timeout=_STOP_POLL_SECONDS)
+            except queue.Empty:
+                continue
+        raise _Stopped()
+
+    def _run_stage(self, name: str, stage: Callable[..., None], *args):
+        """Runs a stage thread; if it fails, the other stages are stopped instead of waiting on it forever."""
+        try:
+            stage(*args)
+        except _Stopped:
+            pass
+        except BaseException as e:
+            logger.error(f"Ingestion stage '{name}' failed, stopping the pipeline: {e}", exc_info=True)
+            self._failed_stage = name
+            self._stop.set()
+
+    def _parse_stage(self, pool: ProcessPoolExecutor, sources: Iterable[Dict[str, Any]], out: queue.Queue):
+        stats = self.stats["parse"]
+        # Parts of sources split into page ranges, keyed by source ID, until every part is back.
+        partial: Dict[Any, List[Any]] = {}
+        # Each task returns a list of results, one per (source, part) entry.
+        in_flight: Dict[Any, List[Tuple[Dict[str, Any], Optional[int]]]] = {}
+        batch: List[Dict[str, Any]] = []
+
+        def submit(entries, fn, *args):
+            # Keep a bounded number of tasks in flight across the pool.
+            if len(in_flight) >= self.queue_size:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                self._forward_parsed(done, in_flight, partial, out, stats)
+            in_flight[pool.submit(fn, *args)] = entries
+
+        for source in sources:
+            if not _is_pdf(source):
+                batch.append(source)
+                if len(batch) >= DOCUMENT_BATCH_SIZE:
+                    submit([(s, None) for s in batch], load_and_chunk_sources, batch)
+                    batch = []
+                continue
+            page_ranges = pdf_page_ranges(source, self.pdf_pages_per_task)
+            if len(page_ranges) > 1:
+                partial[source['id']] = [None] * len(page_ranges)
+            for part, page_range in enumerate(page_ranges):
+                submit([(source, part if page_range else None)], _load_and_chunk_part, source, page_range)
+        if batch:
+            submit([(s, None) for s in batch], load_and_chunk_sources, batch)
+        done, _ = wait(in_flight)
+        self._forward_parsed(done, in_flight, partial, out, stats)
+        self._put(out, _END)
+
+    def _forward_parsed(self, futures, in_flight: Dict[Any, List[Tuple[Dict[str, Any], Optional[int]]]], partial: Dict[Any, List[Any]], out: queue.Queue, stats: StageStats):
+        for future in futures:
+            entries = in_flight.pop(future)
+            try:
+                results = future.result()
+            except Exception as e:
+                logger.error(f"Parsing failed for source_id(s) {', '.join(str(source['id']) for source, _ in entries)}: {e}")
+                results = [(None, 'ingestion_failed', 0.0)] * len(entries)
+            for (source, part), result in zip(entries, results):
+                self._forward_source(source, part, result, partial, out, stats)
+
+    def _forward_source(self, source: Dict[str, Any], part: Optional[int], result: Tuple[Optional[List[Document]], Optional[str], float], partial: Dict[Any, List[Any]], out: queue.Queue, stats: StageStats):
+        documents, failure, seconds = result
+        # Summed across worker processes, so this can exceed wall time.
+        stats.busy_seconds += seconds
+
+        if part is not None:
+            parts = partial[source['id']]
+            parts[part] = (documents, failure)
+            if any(p is None for p in parts):
+                return
+            del partial[source['id']]
+            failure = next((f for _, f in parts if f), None)
+            documents = None if failure else number_chunks([doc for docs, _ in parts for doc in docs])
+            if documents == []:
+                logger.error(f"Could not load content from {source['local_path']}. Skipping ingestion for this source.")
+                documents, failure = None, 'ingestion_failed'
+            if documents is not None:
+                logger.info(f"Created {len(documents)} chunks for source_id {source['id']} from {len(parts)} page ranges")
+
+        stats.items += 1
+        stats.chunks += len(documents or [])
+        self._put(out, (source, documents, failure))
+
+    def _embed_stage(self, inbox: queue.Queue, out: queue.Queue):
+        stats = self.stats["embed"]
+        buffered: List[Tuple[Dict[str, Any], List[Document], List[Optional[str]]]] = []
+        buffered_chunks = 0
+
+        def flush():
+            nonlocal buffered, buffered_chunks
+            if not buffered:
+                return
+            texts = [
+                doc.page_content
+                for _, documents, reused in buffered
+                for doc, vector_id in zip(documents, reused) if vector_id is None
+            ]
+            start = time.perf_counter()
+            try:
+                embeddings = self.embed_fn(texts) if texts else []
+            except Exception as e:
+                logger.error(f"Embedding batch of {len(texts)} chunks failed: {e}")
+                for source, _, _ in buffered:
+                    self._put(out, (source, None, 'embedding_failed'))
+            else:
+                stats.busy_seconds += time.perf_counter() - start
+                stats.chunks += len(texts)
+                remaining = iter(embeddings)
+                for source, documents, reused in buffered:
+                    stats.items += 1
+                    aligned = [next(remaining) if vector_id is None else None for vector_id in reused]
+                    self._put(out, (source, documents, (aligned, reused)))
+            buffered, buffered_chunks = [], 0
+
+        while True:
+            item = self._get(inbox)
+            if item is _END:
+                flush()
+                self._put(out, _END)
+                return
+            source, documents, failure = item
+            if failure or not documents:
+                if not documents and not failure:
+                    logger.warning(f"No chunks were created for source_id: {source['id']}. Skipping embedding.")
+                self._put(out, (source, None, failure))
+                continue
+            reused = [None] * len(documents)
+            if self.diff_fn is not None:
+                try:
+                    reused = self.diff_fn(source, documents)
+                except Exception as e:
+                    logger.error(f"Chunk diff failed for source_id {source['id']}, re-embedding all chunks: {e}")
+            if isinstance(reused, str):
+                self._put(out, (source, None, reused))
+                continue
+            stats.reused += sum(vector_id is not None for vector_id in reused)
+            buffered.append((source, documents, reused))
+            buffered_chunks += sum(vector_id is None for vector_id in reused)
+            if buffered_chunks >= self.batch_size:
+                flush()
+
+    def _write_stage(self, inbox: queue.Queue):
+        stats = self.stats["write"]
+        while True:
+            item = self._get(inbox)
+            if item is _END:
+                return
+            source, documents, payload = item
+            start = time.perf_counter()
+            try:
+                if documents is None:
+                    if payload:
+                        self.fail_fn(source, payload)
+                else:
+                    embeddings, reused = payload
+                    self.write_fn(source, documents, embeddings, reused)
+                    stats.items += 1
+                    stats.chunks += len(documents)
+            except Exception as e:
+                logger.error(f"A critical error occurred while writing source_id {source['id']}: {e}", exc_info=True)
+                try:
+                    self.fail_fn(source, 'ingestion_failed')
+                except Exception as status_error:
+                    logger.error(f"Could not record failure for source_id {source['id']}: {status_error}")
+            stats.busy_seconds += time.perf_counter() - start
+
+    def run(self, sources: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Runs all sources through the pipeline and returns per-stage throughput stats."""
+        parsed: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        embedded: queue.Queue = queue.Queue(maxsize=self.queue_size)
+
+        self._stop.clear()
+        self._failed_stage = None
+
+        start = time.perf_counter()
+        # Spawned, not forked: by now the caller has loaded the embedding model and its
+        # encode threads, and a forked child could inherit a lock one of them holds.
+        pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_parse_worker,
+            initargs=(dict(vars(settings)),),
+        )
+        embedder = threading.Thread(target=self._run_stage, args=("embed", self._embed_stage, parsed, embedded), name="ingest-embed", daemon=True)
+        writer = threading.Thread(target=self._run_stage, args=("write", self._write_stage, embedded), name="ingest-write", daemon=True)
+        embedder.start()
+        writer.start()
+        try:
+            self._parse_stage(pool, sources, parsed)
+        except _Stopped:
+            pass
+        except BaseException:
+            # Interrupted or failed while parsing: stop the embed and write stages too.
+            self._stop.set()
+            raise
+        finally:
+            pool.shutdown(wait=True, cancel_futures=self._stop.is_set())
+            embedder.join()
+            writer.join()
+        if self._failed_stage:
+            raise RuntimeError(f"Ingestion pipeline stopped: the {self._failed_stage} stage failed.")
+        wall_seconds = time.perf_counter() - start
+
+        report = [stats.to_dict(wall_seconds) for stats in self.stats.values()]
+        for stage in report:
+            logger.info(
+                f"Stage '{stage['stage']}': {stage['sources']} sources, {stage['chunks']} chunks, "
+                f"busy {stage['busy_s']}s, {stage['chunks_per_s']} chunks/s"
+            )
+        embed = self.stats["embed"]
+        if embed.reused:
+            total = embed.chunks + embed.reused
+            logger.info(f"Embedding work saved: {embed.reused} of {total} chunks reused unchanged ({embed.reused / total:.0%}).")
+        logger.info(f"Pipeline finished in {wall_seconds:.1f}s.")
+        return report
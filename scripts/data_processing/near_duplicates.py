@@ -0,0 +1,172 @@
+import hashlib
+import logging
+import re
+import zlib
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from insucompass.services.database import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+# Mersenne prime 2^31 - 1; with 32-bit shingle hashes and 31-bit coefficients, a * x + b fits in uint64.
+_PRIME = np.uint64((1 << 31) - 1)
+_WORD = re.compile(r'\w+')
+
+class NearDuplicateIndex:
+    """
+    A MinHash/LSH index of ingested documents and chunks, persisted in SQLite.
+
+    Each text is reduced to a MinHash signature over word `shingle_size`-grams.
+    The signature is cut into `bands` bands; texts sharing any band are
+    candidates, and a candidate is a near-duplicate when the estimated Jaccard
+    similarity of the two signatures is at least `threshold`. A document's
+    signature is the element-wise minimum of its chunk signatures, which is
+    exactly the MinHash of the union of their shingles.
+
+    Entries are scoped to one knowledge base version, so a rebuild starts from
+    an empty index.
+    """
+
+    def __init__(self, kb_version: str, threshold: float = 0.85, num_perm: int = 64, bands: int = 8, shingle_size: int = 5):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.kb_version = kb_version
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        # Fixed seed: signatures are persisted and must stay comparable across runs.
+        rng = np.random.default_rng(0x5EED)
+        self._a = rng.integers(1, int(_PRIME), size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, int(_PRIME), size=num_perm, dtype=np.uint64)
+        self.documents_checked = 0
+        self.documents_duplicate = 0
+        self.chunks_checked = 0
+        self.chunks_linked = 0
+
+    def signature(self, text: str) -> np.ndarray:
+        """Returns the MinHash signature (uint32 per permutation) of a text."""
+        words = _WORD.findall(text.lower())
+        n = self.shingle_size
+        shingles = {' '.join(words[i:i + n]) for i in range(max(len(words) - n + 1, 1))}
+        hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64, count=len(shingles))
+        permuted = (np.outer(hashes, self._a) + self._b) % _PRIME
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray) -> List[Tuple[int, int]]:
+        keys = []
+        for band in range(self.bands):
+            digest = hashlib.blake2b(signature[band * self.rows:(band + 1) * self.rows].tobytes(), digest_size=8).digest()
+            keys.append((band, int.from_bytes(digest, 'big', signed=True)))
+        return keys
+
+    def _find(self, cursor, kind: str, signature: np.ndarray, exclude_source_id: Optional[int]) -> Optional[Tuple[str, int]]:
+        band_keys = self._band_keys(signature)
+        placeholders = ",".join("(?, ?)" for _ in band_keys)
+        cursor.execute(
+            f"SELECT DISTINCT s.item_key, s.source_id, s.signature FROM near_duplicate_bands b "
+            f"JOIN near_duplicate_signatures s ON s.kind = b.kind AND s.kb_version = b.kb_version AND s.item_key = b.item_key "
+            f"WHERE b.kind = ? AND b.kb_version = ? AND (b.band, b.band_hash) IN (VALUES {placeholders})",
+            (kind, self.kb_version, *[value for key in band_keys for value in key])
+        )
+        best = None
+        for row in cursor.fetchall():
+            if exclude_source_id is not None and row['source_id'] == exclude_source_id:
+                continue
+            similarity = float(np.mean(np.frombuffer(row['signature'], dtype=np.uint32) == signature))
+            if similarity >= self.threshold and (best is None or similarity > best[2]):
+                best = (row['item_key'], row['source_id'], similarity)
+        return best[:2] if best else None
+
+    def _add(self, cursor, kind: str, key: str, source_id: int, signature: np.ndarray):
+        self._remove(cursor, kind, [key])
+        cursor.execute(
+            "INSERT INTO near_duplicate_signatures (kind, kb_version, item_key, source_id, signature) VALUES (?, ?, ?, ?, ?)",
+            (kind, self.kb_version, key, source_id, signature.tobytes())
+        )
+        cursor.executemany(
+            "INSERT INTO near_duplicate_bands (kind, kb_version, band, band_hash, item_key) VALUES (?, ?, ?, ?, ?)",
+            [(kind, self.kb_version, band, band_hash, key) for band, band_hash in self._band_keys(signature)]
+        )
+
+    def _remove(self, cursor, kind: str, keys: Sequence[str]):
+        params = [(kind, self.kb_version, key) for key in keys]
+        cursor.executemany("DELETE FROM near_duplicate_signatures WHERE kind = ? AND kb_version = ? AND item_key = ?", params)
+        cursor.executemany("DELETE FROM near_duplicate_bands WHERE kind = ? AND kb_version = ? AND item_key = ?", params)
+
+    def check_source(
+        self,
+        source_id: int,
+        chunk_keys: List[str],
+        chunk_texts: List[str],
+        check: List[bool]
+    ) -> Tuple[Optional[int], List[Optional[str]]]:
+        """
+        Checks a source and its chunks against the index and registers whatever is new.
+
+        Args:
+            source_id: The data source being ingested.
+            chunk_keys: The vector ID each chunk will be stored under.
+            chunk_texts: The chunk texts.
+            check: Which chunks to look up; the others are only registered.
+
+        Returns:
+            (duplicate_of, links). duplicate_of is the ID of an already ingested source
+            this whole document nearly duplicates, in which case nothing is registered.
+            Otherwise links holds, per chunk, the vector ID of the near-duplicate chunk
+            it should point to, or None if it has to be embedded.
+        """
+        signatures = [self.signature(text) for text in chunk_texts]
+        links: List[Optional[str]] = [None] * len(chunk_keys)
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            self.documents_checked += 1
+            if signatures:
+                document_signature = np.minimum.reduce(signatures)
+                match = self._find(cursor, "document", document_signature, exclude_source_id=source_id)
+                if match is not None:
+                    self.documents_duplicate += 1
+                    self.chunks_checked += len(chunk_keys)
+                    self.chunks_linked += len(chunk_keys)
+                    return match[1], links
+                self._add(cursor, "document", str(source_id), source_id, document_signature)
+
+            for i, (key, signature) in enumerate(zip(chunk_keys, signatures)):
+                if check[i]:
+                    self.chunks_checked += 1
+                    match = self._find(cursor, "chunk", signature, exclude_source_id=None)
+                    if match is not None and match[0] != key:
+                        links[i] = match[0]
+                        self.chunks_linked += 1
+                        continue
+                self._add(cursor, "chunk", key, source_id, signature)
+            conn.commit()
+        return None, links
+
+    def forget_chunks(self, chunk_keys: Sequence[str]):
+        """Removes deleted chunks from the index so nothing links to them any more."""
+        if not chunk_keys:
+            return
+        with get_db_connection() as conn:
+            self._remove(conn.cursor(), "chunk", chunk_keys)
+            conn.commit()
+
+    def forget_document(self, source_id: int):
+        """Removes a source's document signature, so no other source is judged a duplicate of it."""
+        with get_db_connection() as conn:
+            self._remove(conn.cursor(), "document", [str(source_id)])
+            conn.commit()
+
+    def report(self, embed_seconds_per_chunk: float = 0.0) -> dict:
+        """Summarizes duplicates found in this run and the embedding time they saved."""
+        return {
+            "documents_checked": self.documents_checked,
+            "documents_duplicate": self.documents_duplicate,
+            "document_duplicate_ratio": round(self.documents_duplicate / self.documents_checked, 4) if self.documents_checked else 0.0,
+            "chunks_checked": self.chunks_checked,
+            "chunks_linked": self.chunks_linked,
+            "chunk_duplicate_ratio": round(self.chunks_linked / self.chunks_checked, 4) if self.chunks_checked else 0.0,
+            "embedding_seconds_saved": round(self.chunks_linked * embed_seconds_per_chunk, 2),
+        }
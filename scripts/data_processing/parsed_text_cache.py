@@ -0,0 +1,81 @@
+import json
+import logging
+from typing import List, Optional, Tuple
+
+from insucompass.config import settings
+from insucompass.services.database import get_db_connection
+from insucompass.services.text_codec import best_codec, compress_text, decompress_text
+
+logger = logging.getLogger(__name__)
+
+# Bump when extraction changes in a way that alters the text, so old entries are no longer used.
+PARSER_VERSION = 1
+
+CODEC = best_codec()
+
+def variant_key(kind: str) -> str:
+    """Qualifies an extraction kind (e.g. 'pdf', 'html:structured') with the parser version."""
+    return f"{kind}/v{PARSER_VERSION}"
+
+def get_parsed_text(content_hash: Optional[str], kind: str) -> Optional[Tuple[str, list]]:
+    """
+    Looks up previously extracted text of a raw file.
+
+    Args:
+        content_hash: SHA-256 of the raw file.
+        kind: The extraction that produced the text.
+
+    Returns:
+        (text, offsets), or None on a miss. offsets are [label, start] pairs:
+        [page_number, start] for PDFs, [heading, start] for structured HTML.
+    """
+    if not content_hash or not settings.PARSED_TEXT_CACHE_ENABLED:
+        return None
+    try:
+        with get_db_connection() as conn:
+            row = conn.cursor().execute(
+                "SELECT codec, text, offsets_json FROM parsed_texts WHERE content_hash = ? AND variant = ?",
+                (content_hash, variant_key(kind))
+            ).fetchone()
+        if row is None:
+            return None
+        text = decompress_text(row['text'], row['codec'])
+        if text is None:
+            return None
+        return text, json.loads(row['offsets_json'] or '[]')
+    except Exception as e:
+        logger.warning(f"Parsed text cache lookup failed for {content_hash}: {e}")
+        return None
+
+def put_parsed_text(content_hash: Optional[str], kind: str, text: str, offsets: Optional[list] = None):
+    """Stores extracted text of a raw file, compressed. Failures only cost a future re-parse."""
+    if not content_hash or not settings.PARSED_TEXT_CACHE_ENABLED:
+        return
+    try:
+        with get_db_connection() as conn:
+            conn.cursor().execute(
+                "INSERT OR REPLACE INTO parsed_texts (content_hash, variant, codec, text, offsets_json, text_bytes) VALUES (?, ?, ?, ?, ?, ?)",
+                (content_hash, variant_key(kind), CODEC, compress_text(text, CODEC), json.dumps(offsets or []), len(text.encode('utf-8')))
+            )
+            conn.commit()
+    except Exception as e:
+        logger.warning(f"Could not store parsed text for {content_hash}: {e}")
+
+def join_pages(pages: List[Tuple[int, str]], separator: str = "\n\n") -> Tuple[str, list]:
+    """Joins page texts and returns the text with [page_number, start] offsets."""
+    offsets, parts, position = [], [], 0
+    for page_number, page_text in pages:
+        if parts:
+            position += len(separator)
+        offsets.append([page_number, position])
+        parts.append(page_text)
+        position += len(page_text)
+    return separator.join(parts), offsets
+
+def split_pages(text: str, offsets: list, separator: str = "\n\n") -> List[Tuple[int, str]]:
+    """Inverse of join_pages."""
+    pages = []
+    for i, (page_number, start) in enumerate(offsets):
+        end = offsets[i + 1][1] - len(separator) if i + 1 < len(offsets) else len(text)
+        pages.append((page_number, text[start:end]))
+    return pages
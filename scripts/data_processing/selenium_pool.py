@@ -0,0 +1,172 @@
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Callable, List, Optional
+
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service as ChromeService
+from webdriver_manager.chrome import ChromeDriverManager
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+from insucompass.config import settings
+from .crawler_utils import USER_AGENT
+
+logger = logging.getLogger(__name__)
+
+# Resolves once the document is loaded and no DOM mutation or new resource request was seen for
+# `quietMs`, or after `timeoutMs`. Passes the readyState and whether the page settled.
+_READY_SCRIPT = """
+const [quietMs, timeoutMs, done] = arguments;
+const start = performance.now();
+let last = start;
+let resources = performance.getEntriesByType('resource').length;
+const observer = new MutationObserver(() => { last = performance.now(); });
+observer.observe(document, {subtree: true, childList: true, attributes: true, characterData: true});
+(function check() {
+    const now = performance.now();
+    const count = performance.getEntriesByType('resource').length;
+    if (count !== resources) { resources = count; last = now; }
+    const settled = document.readyState === 'complete' && now - last >= quietMs;
+    if (settled || now - start >= timeoutMs) {
+        observer.disconnect();
+        done([document.readyState, settled]);
+    } else {
+        setTimeout(check, 50);
+    }
+})();
+"""
+
+def create_driver() -> Optional[webdriver.Chrome]:
+    """Initializes a headless Chrome WebDriver."""
+    logger.info("Setting up Selenium WebDriver...")
+    try:
+        options = webdriver.ChromeOptions()
+        options.add_argument("--headless")
+        options.add_argument("--no-sandbox")
+        options.add_argument("--disable-dev-shm-usage")
+        options.add_argument("--disable-gpu")
+        options.add_argument(f"user-agent={USER_AGENT}")
+        # This will handle SSL certificate issues often seen with government sites
+        options.add_argument('--ignore-certificate-errors')
+
+        driver = webdriver.Chrome(service=ChromeService(ChromeDriverManager().install()), options=options)
+        logger.info("WebDriver setup complete.")
+        return driver
+    except Exception as e:
+        logger.error(f"Failed to setup Selenium driver: {e}")
+        return None
+
+def wait_until_ready(driver: webdriver.Chrome, timeout: float, quiet_ms: int) -> bool:
+    """
+    Waits until the loaded page stopped changing: no DOM mutations and no new
+    network requests for `quiet_ms`. Returns False if it was still changing after `timeout` seconds.
+    """
+    driver.set_script_timeout(timeout + 5)
+    _, settled = driver.execute_async_script(_READY_SCRIPT, quiet_ms, int(timeout * 1000))
+    return settled
+
+class SeleniumPool:
+    """
+    Up to `size` headless Chrome drivers shared by crawler threads. Drivers are
+    started on first use, handed out one thread at a time and replaced if they
+    break.
+    """
+
+    def __init__(self, size: Optional[int] = None, factory: Callable[[], Optional[webdriver.Chrome]] = create_driver):
+        self.size = max(1, size or settings.SELENIUM_POOL_SIZE)
+        self.factory = factory
+        self.renders = 0
+        self._idle: queue.Queue = queue.Queue()
+        self._drivers: List[webdriver.Chrome] = []
+        # Drivers started or starting; at most `size`.
+        self._slots = 0
+        self._lock = threading.Lock()
+
+    def _checkout(self) -> webdriver.Chrome:
+        while True:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+            with self._lock:
+                start_new = self._slots < self.size
+                if start_new:
+                    self._slots += 1
+            if start_new:
+                driver = self.factory()
+                with self._lock:
+                    if driver is None:
+                        self._slots -= 1
+                    else:
+                        self._drivers.append(driver)
+                if driver is None:
+                    raise WebDriverException("Failed to start a Selenium driver")
+                return driver
+            # Waits in short steps, as a discarded driver frees a slot without returning to the queue.
+            try:
+                return self._idle.get(timeout=1.0)
+            except queue.Empty:
+                continue
+
+    @contextmanager
+    def driver(self):
+        """Checks out an idle driver, starting one if the pool is not full, or waits for one."""
+        driver = self._checkout()
+        try:
+            yield driver
+        except TimeoutException:
+            self._idle.put(driver)
+            raise
+        except WebDriverException:
+            # The browser may have crashed; a fresh driver takes its slot on next use.
+            self._discard(driver)
+            raise
+        except BaseException:
+            self._idle.put(driver)
+            raise
+        else:
+            self._idle.put(driver)
+
+    def _discard(self, driver: webdriver.Chrome):
+        with self._lock:
+            self._drivers.remove(driver)
+            self._slots -= 1
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def render(self, url: str) -> Optional[bytes]:
+        """Loads a page in a browser and returns its HTML once rendered, or None if it failed."""
+        try:
+            with self.driver() as driver:
+                driver.get(url)
+                if not wait_until_ready(driver, settings.SELENIUM_READY_TIMEOUT_SECONDS, settings.SELENIUM_DOM_QUIET_MS):
+                    logger.warning(f"Page still changing after {settings.SELENIUM_READY_TIMEOUT_SECONDS}s, saving it as is: {url}")
+                page_source = driver.page_source
+        except (TimeoutException, WebDriverException) as e:
+            logger.error(f"Selenium failed to get {url}: {e}")
+            return None
+        with self._lock:
+            self.renders += 1
+        return page_source.encode('utf-8')
+
+    def close(self):
+        with self._lock:
+            drivers, self._drivers = self._drivers, []
+            self._slots = 0
+            self._idle = queue.Queue()
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception as e:
+                logger.warning(f"Failed to close a Selenium driver: {e}")
+        if drivers:
+            logger.info(f"Closed {len(drivers)} Selenium WebDrivers.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
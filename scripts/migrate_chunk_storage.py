@@ -0,0 +1,247 @@
+import argparse
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from insucompass.config import settings
+from insucompass.services import kb_versions
+from insucompass.services.chunk_store import (
+    INSERT_CHUNK_QUERY, decode_chunk_text, encode_chunk_text, row_metadata, vector_metadata
+)
+from insucompass.services.database import get_db_connection, get_vector_ids_with_rows, setup_database
+from insucompass.services.vector_store import vector_store_service, CHROMA_PATH
+
+# Configure logging
+logging.basicConfig(level=settings.LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 1000
+
+def _directory_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+def _database_size() -> int:
+    base = Path(settings.DATABASE_URL)
+    return sum(p.stat().st_size for p in (base, base.with_name(base.name + "-wal")) if p.exists())
+
+def _query_latency(queries: List[str]) -> Optional[Dict[str, float]]:
+    """p50/p95 latency in ms of single retriever searches against the active version."""
+    if not queries:
+        return None
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        vector_store_service.search(query, k=settings.RETRIEVER_K)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "p50_ms": round(timings[len(timings) // 2], 2),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 2),
+    }
+
+def _sample_queries(db_version: Optional[str], count: int) -> List[str]:
+    # Opening words of random chunks stand in for user questions.
+    with get_db_connection() as conn:
+        rows = conn.cursor().execute(
+            "SELECT chunk_text, text_codec FROM knowledge_chunks WHERE kb_version IS ? ORDER BY RANDOM() LIMIT ?", (db_version, count)
+        ).fetchall()
+    texts = [decode_chunk_text(row['chunk_text'], row['text_codec']) or "" for row in rows]
+    return [" ".join(text.split()[:12]) for text in texts if text]
+
+def normalize_rows(db_version: Optional[str], dry_run: bool) -> Dict[str, int]:
+    """
+    Strips source-level fields from the chunk rows of a version, moving total_chunks
+    to data_sources, and (re)encodes chunk text with CHUNK_TEXT_COMPRESSION.
+    """
+    rewritten = bytes_before = bytes_after = 0
+    last_id = 0
+    while True:
+        with get_db_connection() as conn:
+            rows = conn.cursor().execute(
+                "SELECT id, source_id, chunk_text, text_codec, metadata_json FROM knowledge_chunks "
+                "WHERE kb_version IS ? AND id > ? ORDER BY id LIMIT ?",
+                (db_version, last_id, PAGE_SIZE)
+            ).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1]['id']
+
+        updates, chunk_counts = [], {}
+        for row in rows:
+            metadata = json.loads(row['metadata_json'] or '{}')
+            text = decode_chunk_text(row['chunk_text'], row['text_codec'])
+            if text is None:
+                continue
+            value, codec = encode_chunk_text(text)
+            slim = row_metadata(metadata)
+            if metadata.get('total_chunks') is not None:
+                chunk_counts[row['source_id']] = metadata['total_chunks']
+            if slim != metadata or codec != row['text_codec']:
+                bytes_before += len(row['chunk_text']) + len(row['metadata_json'] or '')
+                slim_json = json.dumps(slim)
+                bytes_after += len(value) + len(slim_json)
+                updates.append((value, codec, slim_json, row['id']))
+        rewritten += len(updates)
+
+        if not dry_run:
+            with get_db_connection() as conn:
+                cursor = conn.cursor()
+                cursor.executemany("UPDATE knowledge_chunks SET chunk_text = ?, text_codec = ?, metadata_json = ? WHERE id = ?", updates)
+                cursor.executemany(
+                    "UPDATE data_sources SET total_chunks = ? WHERE id = ? AND total_chunks IS NULL",
+                    [(count, source_id) for source_id, count in chunk_counts.items()]
+                )
+                conn.commit()
+    return {"rows_rewritten": rewritten, "row_payload_bytes_before": bytes_before, "row_payload_bytes_after": bytes_after}
+
+def _pending_batch_path(version: str) -> Path:
+    return Path(CHROMA_PATH) / f"slim-vectors-{version}.pending.json"
+
+def _swap_vectors(collection, pending: Path, ids: List[str], embeddings: list, metadatas: List[dict]):
+    """
+    Replaces vectors with slimmed copies. The batch is journaled to `pending` (written
+    atomically) before the vectors are deleted, and the journal removed once they are
+    back, so a crash in between never loses embeddings: the next run replays it.
+    """
+    tmp_path = pending.with_name(pending.name + ".tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump({"ids": ids, "embeddings": [[float(x) for x in embedding] for embedding in embeddings], "metadatas": metadatas}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, pending)
+    # Chroma keeps a stored document on update or upsert, so the vectors are re-added without one.
+    collection.delete(ids=ids)
+    collection.add(ids=ids, embeddings=embeddings, metadatas=metadatas)
+    pending.unlink()
+
+def replay_pending_batch(collection, version: str) -> int:
+    """Finishes a batch swap an interrupted migration of `version` journaled. Returns the number of vectors restored."""
+    pending = _pending_batch_path(version)
+    if not pending.exists():
+        return 0
+    batch = json.loads(pending.read_text())
+    collection.delete(ids=batch["ids"])
+    collection.add(ids=batch["ids"], embeddings=batch["embeddings"], metadatas=batch["metadatas"])
+    pending.unlink()
+    logger.info(f"Restored {len(batch['ids'])} vectors of a batch an interrupted migration left journaled.")
+    return len(batch["ids"])
+
+def slim_vectors(version: str, db_version: Optional[str], dry_run: bool) -> Dict[str, int]:
+    """
+    Removes text and non-filterable metadata from a version's vectors. Vectors
+    without a chunk row (dynamic web search results written before rows were kept
+    for them) get one first, so no text is lost.
+    """
+    collection = vector_store_service.get_collection(version)
+    pending = _pending_batch_path(version)
+    if not dry_run:
+        replay_pending_batch(collection, version)
+    all_ids: List[str] = []
+    offset = 0
+    while True:
+        page = collection.get(include=[], limit=PAGE_SIZE, offset=offset)
+        if not page["ids"]:
+            break
+        all_ids.extend(page["ids"])
+        offset += len(page["ids"])
+
+    slimmed = rows_created = skipped = payload_bytes = 0
+    for start in range(0, len(all_ids), PAGE_SIZE):
+        page = collection.get(ids=all_ids[start:start + PAGE_SIZE], include=["embeddings", "documents", "metadatas"])
+        with_rows = get_vector_ids_with_rows(page["ids"], db_version)
+        ids, embeddings, metadatas, new_rows, source_fields = [], [], [], [], {}
+        for vector_id, embedding, text, metadata in zip(page["ids"], page["embeddings"], page["documents"], page["metadatas"]):
+            metadata = metadata or {}
+            if not text:
+                continue
+            if vector_id not in with_rows:
+                if metadata.get("source_id") is None:
+                    skipped += 1
+                    continue
+                value, codec = encode_chunk_text(text)
+                new_rows.append((
+                    metadata["source_id"], value, codec, json.dumps(row_metadata(metadata)), vector_id,
+                    metadata.get("chunk_number"), db_version, metadata.get("chunk_hash"), 0
+                ))
+            if metadata.get("source_id") is not None and metadata.get("total_chunks") is not None:
+                source_fields[metadata["source_id"]] = metadata["total_chunks"]
+            payload_bytes += len(text.encode('utf-8')) + len(json.dumps(metadata)) - len(json.dumps(vector_metadata(metadata)))
+            ids.append(vector_id)
+            embeddings.append(embedding)
+            metadatas.append(vector_metadata(metadata))
+        slimmed += len(ids)
+        rows_created += len(new_rows)
+        if dry_run or not ids:
+            continue
+
+        # Rows are committed before the vectors lose their text.
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(INSERT_CHUNK_QUERY, new_rows)
+            cursor.executemany(
+                "UPDATE data_sources SET total_chunks = ? WHERE id = ? AND total_chunks IS NULL",
+                [(count, source_id) for source_id, count in source_fields.items()]
+            )
+            conn.commit()
+        _swap_vectors(collection, pending, ids, embeddings, metadatas)
+        logger.info(f"Slimmed {slimmed} of {len(all_ids)} vectors...")
+    return {"vectors": len(all_ids), "vectors_slimmed": slimmed, "rows_created": rows_created,
+            "vectors_skipped_without_source": skipped, "vector_payload_bytes_removed": payload_bytes}
+
+def migrate_chunk_storage(version: str = None, dry_run: bool = False, latency_queries: int = 0, vacuum: bool = False) -> dict:
+    """
+    Migrates a knowledge base version (default: the active one) to normalized chunk
+    storage and reports on-disk sizes and query latency before and after.
+    """
+    version = version or vector_store_service.active_version
+    db_version = kb_versions.db_version_for(version)
+    measure_latency = latency_queries > 0 and version == vector_store_service.active_version
+    queries = _sample_queries(db_version, latency_queries) if measure_latency else []
+
+    report = {
+        "version": version,
+        "dry_run": dry_run,
+        "chunk_text_compression": settings.CHUNK_TEXT_COMPRESSION,
+        "before": {"chroma_bytes": _directory_size(Path(CHROMA_PATH)), "sqlite_bytes": _database_size(), "latency": _query_latency(queries)},
+    }
+    report["rows"] = normalize_rows(db_version, dry_run)
+    if settings.SLIM_VECTOR_STORE:
+        report["vectors"] = slim_vectors(version, db_version, dry_run)
+    else:
+        logger.info("SLIM_VECTOR_STORE is off; leaving the vectors' text and metadata in place.")
+
+    if vacuum and not dry_run:
+        # Deleted pages are only returned to the file system by VACUUM; both stores must be idle.
+        import sqlite3
+        with get_db_connection() as conn:
+            conn.execute("VACUUM")
+        chroma_db = Path(CHROMA_PATH) / "chroma.sqlite3"
+        if chroma_db.exists():
+            chroma = sqlite3.connect(chroma_db)
+            chroma.execute("VACUUM")
+            chroma.close()
+
+    report["after"] = {"chroma_bytes": _directory_size(Path(CHROMA_PATH)), "sqlite_bytes": _database_size(), "latency": _query_latency(queries)}
+    if settings.VECTOR_BACKEND == "flat":
+        logger.info("Rebuild the flat index (scripts/build_flat_index.py) to drop text from its records as well.")
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Move chunk text and source metadata out of the vector store into SQLite.")
+    parser.add_argument("--version", default=None, help="Knowledge base version to migrate. Defaults to the active one.")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would change.")
+    parser.add_argument("--compression", choices=["none", "zstd", "zlib"], default=None, help="Overrides CHUNK_TEXT_COMPRESSION.")
+    parser.add_argument("--latency-queries", type=int, default=50, help="Sample queries timed before and after (active version only, 0 to skip).")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM SQLite and Chroma afterwards. Stop the API and ingestion first.")
+    args = parser.parse_args()
+
+    if args.compression:
+        settings.CHUNK_TEXT_COMPRESSION = args.compression
+    setup_database()
+    print(json.dumps(migrate_chunk_storage(args.version, args.dry_run, args.latency_queries, args.vacuum), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import argparse
+import json
+import logging
+from typing import Dict, List, Set
+
+from insucompass.config import settings
+from insucompass.services import kb_versions
+from insucompass.services.database import get_db_connection, get_running_ingestion_runs, get_running_reembed_jobs
+from insucompass.services.vector_store import vector_store_service
+
+# Configure logging
+logging.basicConfig(level=settings.LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 5000
+
+def _vector_store_ids(collection) -> Dict[str, dict]:
+    """Returns every vector ID in a collection with its metadata."""
+    found: Dict[str, dict] = {}
+    offset = 0
+    while True:
+        page = collection.get(include=["metadatas"], limit=PAGE_SIZE, offset=offset)
+        if not page["ids"]:
+            break
+        for vector_id, metadata in zip(page["ids"], page["metadatas"]):
+            found[vector_id] = metadata or {}
+        offset += len(page["ids"])
+    return found
+
+def _unindexed_web_search_source_ids(db_version) -> Set[int]:
+    # Web-search results with no knowledge_chunks rows in the version were stored before rows were
+    # kept for them (migrate_chunk_storage creates those) or are being written right now.
+    with get_db_connection() as conn:
+        rows = conn.cursor().execute(
+            "SELECT id FROM data_sources WHERE data_type = 'web_search_result' "
+            "AND NOT EXISTS (SELECT 1 FROM knowledge_chunks WHERE source_id = data_sources.id AND kb_version IS ?)",
+            (db_version,)
+        ).fetchall()
+    return {row['id'] for row in rows}
+
+def _writers_of(version: str) -> List[str]:
+    """Describes the ingestion runs and re-embed jobs currently writing to a version."""
+    writers = [f"ingestion run {run['id']}" for run in get_running_ingestion_runs() if run['kb_version'] == version]
+    writers += [
+        f"re-embed job {job['id']}" for job in get_running_reembed_jobs()
+        if version in (job['source_version'], job['target_version'])
+    ]
+    return writers
+
+def reconcile_stores(version: str = None, dry_run: bool = False, force: bool = False) -> Dict[str, int]:
+    """
+    Compares a knowledge base version's vector store with its knowledge_chunks rows
+    and removes what only one side has. Defaults to the active version.
+
+    - Vectors without a row (left by a write that crashed before SQLite committed)
+      are deleted from the vector store.
+    - Rows whose vector is missing are deleted, and their sources are set back to
+      'updated' with their ingested hash cleared so the next ingestion run redoes them.
+
+    Vectors and rows an ingestion run or re-embed job is in the middle of writing
+    would look orphaned, so the version is not reconciled while one is running.
+
+    Args:
+        force: Reconcile even though a run or job is recorded as running, e.g. one
+            whose process died without finishing it.
+
+    Returns:
+        A report of what was found and removed.
+
+    Raises:
+        RuntimeError: An ingestion run or re-embed job is writing to the version.
+    """
+    version = version or vector_store_service.active_version
+    writers = _writers_of(version)
+    if writers and not force:
+        raise RuntimeError(f"Version '{version}' is being written by {', '.join(writers)}. Try again once it finishes.")
+    db_version = kb_versions.db_version_for(version)
+    collection = vector_store_service.get_collection(version)
+
+    vectors = _vector_store_ids(collection)
+    with get_db_connection() as conn:
+        rows = conn.cursor().execute(
+            "SELECT id, source_id, vector_id FROM knowledge_chunks WHERE kb_version IS ?", (db_version,)
+        ).fetchall()
+    row_vector_ids = {row['vector_id'] for row in rows if row['vector_id']}
+
+    web_sources = _unindexed_web_search_source_ids(db_version)
+    orphan_vectors = [
+        vector_id for vector_id, metadata in vectors.items()
+        if vector_id not in row_vector_ids and metadata.get("source_id") not in web_sources
+    ]
+    orphan_rows = [row for row in rows if row['vector_id'] and row['vector_id'] not in vectors]
+    sources_to_redo = sorted({row['source_id'] for row in orphan_rows})
+
+    logger.info(
+        f"Version '{version}': {len(vectors)} vectors, {len(rows)} rows. "
+        f"{len(orphan_vectors)} orphaned vectors, {len(orphan_rows)} orphaned rows."
+    )
+    if not dry_run:
+        for start in range(0, len(orphan_vectors), PAGE_SIZE):
+            collection.delete(ids=orphan_vectors[start:start + PAGE_SIZE])
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany("DELETE FROM knowledge_chunks WHERE id = ?", [(row['id'],) for row in orphan_rows])
+            cursor.executemany(
+                "UPDATE data_sources SET status = 'updated', ingested_hash = NULL WHERE id = ?",
+                [(source_id,) for source_id in sources_to_redo]
+            )
+            conn.commit()
+
+    return {
+        "vectors": len(vectors),
+        "rows": len(rows),
+        "orphaned_vectors": len(orphan_vectors),
+        "orphaned_rows": len(orphan_rows),
+        "sources_marked_for_reingestion": len(sources_to_redo),
+        "dry_run": dry_run,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Find and remove vectors or chunk rows that exist in only one store.")
+    parser.add_argument("--version", default=None, help="Knowledge base version to reconcile. Defaults to the active one.")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be removed.")
+    parser.add_argument("--force", action="store_true", help="Reconcile even while an ingestion run or re-embed job is recorded as running.")
+    args = parser.parse_args()
+    try:
+        report = reconcile_stores(version=args.version, dry_run=args.dry_run, force=args.force)
+    except RuntimeError as e:
+        raise SystemExit(str(e))
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+import argparse
+import hashlib
+import json
+import logging
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from insucompass.config import settings
+from insucompass.services import kb_versions
+from insucompass.services.chunk_store import load_chunks
+from insucompass.services.database import (
+    get_db_connection, setup_database, create_reembed_job, get_running_reembed_jobs, update_reembed_job,
+    copy_near_duplicate_entries, get_linked_vector_ids
+)
+from insucompass.services.vector_store import vector_store_service
+
+# Configure logging
+logging.basicConfig(level=settings.LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Copying a knowledge base version to another embedding model:
+# - the target is a new version whose collection records the new model, so its vectors never
+#   mix with the old model's; queries keep using the active (source) version meanwhile;
+# - sources are re-embedded from their knowledge_chunks rows in throttled batches. Each source's
+#   rows are fingerprinted, so sources re-ingested or added while the job runs are synced again;
+#   run_ingestion.py also syncs every source it writes (dual write);
+# - once every source is synced (100% coverage), the target is promoted like a rebuilt version.
+
+class ReembedJob:
+    """Syncs the sources of a re-embed job's source version into its target version."""
+
+    def __init__(self, job: dict, embeddings: Optional[Embeddings] = None):
+        self.id = job['id']
+        self.source_version = job['source_version']
+        self.target_version = job['target_version']
+        self.embedding_model = job['embedding_model']
+        self.source_db = kb_versions.db_version_for(self.source_version)
+        self.target_db = kb_versions.db_version_for(self.target_version)
+        # Loaded on first use, so dual writes only load the new model when a source is written.
+        self._embeddings = embeddings
+
+    @property
+    def embeddings(self) -> Embeddings:
+        if self._embeddings is None:
+            self._embeddings = vector_store_service.document_encoder(self.embedding_model)
+        return self._embeddings
+
+    def source_fingerprints(self, source_ids: Optional[List[int]] = None) -> Dict[int, str]:
+        """
+        Hashes the chunk rows (vector ID, chunk number, duplicate flag) of each source
+        in the source version. A source whose fingerprint changed has to be synced again.
+        """
+        query = "SELECT source_id, vector_id, chunk_number, is_duplicate FROM knowledge_chunks WHERE kb_version IS ?"
+        params: list = [self.source_db]
+        if source_ids is not None:
+            query += f" AND source_id IN ({','.join('?' * len(source_ids))})"
+            params.extend(source_ids)
+        digests = {}
+        with get_db_connection() as conn:
+            for row in conn.cursor().execute(query + " ORDER BY source_id, id", params):
+                digest = digests.setdefault(row['source_id'], hashlib.sha1())
+                digest.update(f"{row['vector_id']}:{row['chunk_number']}:{row['is_duplicate']}\n".encode('utf-8'))
+        return {source_id: digest.hexdigest() for source_id, digest in digests.items()}
+
+    def synced_fingerprints(self) -> Dict[int, str]:
+        with get_db_connection() as conn:
+            rows = conn.cursor().execute(
+                "SELECT source_id, fingerprint FROM reembed_progress WHERE job_id = ?", (self.id,)
+            ).fetchall()
+        return {row['source_id']: row['fingerprint'] for row in rows}
+
+    def pending(self) -> Tuple[Dict[int, str], List[int], List[int]]:
+        """
+        Returns:
+            (fingerprints of all sources in the source version, sources to sync,
+            synced sources that no longer exist in the source version).
+        """
+        current = self.source_fingerprints()
+        synced = self.synced_fingerprints()
+        changed = [source_id for source_id, fingerprint in current.items() if synced.get(source_id) != fingerprint]
+        removed = [source_id for source_id in synced if source_id not in current]
+        return current, changed, removed
+
+    def coverage(self) -> Dict[str, object]:
+        current, changed, removed = self.pending()
+        total = len(current)
+        return {
+            "job_id": self.id,
+            "source_version": self.source_version,
+            "target_version": self.target_version,
+            "embedding_model": self.embedding_model,
+            "sources_total": total,
+            "sources_synced": total - len(changed),
+            "sources_removed": len(removed),
+            "coverage": round((total - len(changed)) / total, 4) if total else 1.0,
+        }
+
+    def sync_sources(self, source_ids: List[int]) -> int:
+        """
+        Syncs the given sources now, e.g. right after ingestion wrote them. Failures are
+        logged and left to the job, which syncs every source whose fingerprint is stale.
+
+        Returns:
+            The number of sources synced.
+        """
+        fingerprints = self.source_fingerprints(source_ids)
+        synced = 0
+        for source_id in source_ids:
+            try:
+                self.sync_source(source_id, fingerprints.get(source_id))
+                synced += 1
+            except Exception as e:
+                logger.error(f"Re-embed job {self.id}: could not sync source {source_id} to '{self.target_version}': {e}")
+        return synced
+
+    def sync_source(self, source_id: int, fingerprint: Optional[str]):
+        """
+        Makes a source's chunks in the target version match the source version: vectors
+        missing from the target are embedded with the job's model, the others get their
+        metadata refreshed, and the chunk rows are copied. A None fingerprint means the
+        source is gone from the source version and is removed from the target.
+        """
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            query = "SELECT vector_id, is_duplicate FROM knowledge_chunks WHERE source_id = ? AND kb_version IS ?"
+            source_rows = cursor.execute(query, (source_id, self.source_db)).fetchall() if fingerprint else []
+            target_rows = cursor.execute(query, (source_id, self.target_db)).fetchall()
+
+        own = list(dict.fromkeys(row['vector_id'] for row in source_rows if row['vector_id'] and not row['is_duplicate']))
+        present = {row['vector_id'] for row in target_rows if row['vector_id'] and not row['is_duplicate']}
+        chunks = load_chunks(own, self.source_db) if own else {}
+        new_ids = [vector_id for vector_id in own if vector_id not in present and vector_id in chunks]
+        kept_ids = [vector_id for vector_id in own if vector_id in present and vector_id in chunks]
+
+        if new_ids:
+            vectors = self.embeddings.embed_documents([chunks[vector_id][0] for vector_id in new_ids])
+            documents = [Document(page_content=chunks[vector_id][0], metadata=chunks[vector_id][1]) for vector_id in new_ids]
+            vector_store_service.add_embedded_documents(documents, vectors, version=self.target_version, ids=new_ids)
+        vector_store_service.update_metadatas(kept_ids, [chunks[vector_id][1] for vector_id in kept_ids], version=self.target_version)
+
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM knowledge_chunks WHERE source_id = ? AND kb_version IS ?", (source_id, self.target_db))
+            cursor.execute(
+                "INSERT INTO knowledge_chunks (source_id, chunk_text, text_codec, metadata_json, vector_id, chunk_number, kb_version, chunk_hash, is_duplicate) "
+                "SELECT source_id, chunk_text, text_codec, metadata_json, vector_id, chunk_number, ?, chunk_hash, is_duplicate "
+                "FROM knowledge_chunks WHERE source_id = ? AND kb_version IS ? ORDER BY id",
+                (self.target_db, source_id, self.source_db)
+            )
+            if fingerprint:
+                cursor.execute(
+                    "INSERT OR REPLACE INTO reembed_progress (job_id, source_id, fingerprint) VALUES (?, ?, ?)",
+                    (self.id, source_id, fingerprint)
+                )
+            else:
+                cursor.execute("DELETE FROM reembed_progress WHERE job_id = ? AND source_id = ?", (self.id, source_id))
+            conn.commit()
+
+        own_set = set(own)
+        stale = [vector_id for vector_id in present if vector_id not in own_set]
+        if stale:
+            still_linked = get_linked_vector_ids(stale, source_id)
+            vector_store_service.delete_documents([v for v in stale if v not in still_linked], version=self.target_version)
+
+    def run(self, batch_sources: int, pause_seconds: float, cut_over: bool = True) -> bool:
+        """
+        Syncs sources in batches of `batch_sources`, sleeping `pause_seconds` between
+        batches, until every source of the source version is synced, then promotes the
+        target version unless `cut_over` is False.
+
+        Returns:
+            True if the target version reached full coverage.
+        """
+        failed: Set[int] = set()
+        while True:
+            if kb_versions.read_active_version()["version"] != self.source_version:
+                logger.error(f"Re-embed job {self.id}: '{self.source_version}' is no longer active. Cancelling the job.")
+                update_reembed_job(self.id, status='cancelled')
+                return False
+
+            current, changed, removed = self.pending()
+            total = len(current)
+            done = total - len(changed)
+            update_reembed_job(self.id, sources_total=total, sources_synced=done)
+            for source_id in removed:
+                self.sync_source(source_id, None)
+            changed = [source_id for source_id in changed if source_id not in failed]
+            if not changed:
+                break
+
+            for start in range(0, len(changed), batch_sources):
+                for source_id in changed[start:start + batch_sources]:
+                    try:
+                        self.sync_source(source_id, current[source_id])
+                        done += 1
+                    except Exception as e:
+                        logger.error(f"Re-embed job {self.id}: failed to sync source {source_id}: {e}")
+                        failed.add(source_id)
+                update_reembed_job(self.id, sources_synced=done)
+                logger.info(f"Re-embed job {self.id}: {done}/{total} sources synced ({done / total:.1%}).")
+                time.sleep(pause_seconds)
+
+        if failed:
+            logger.error(f"Re-embed job {self.id}: {len(failed)} sources could not be synced; not cutting over. Resume the job to retry.")
+            return False
+        logger.info(f"Re-embed job {self.id}: '{self.target_version}' covers all {len(current)} sources.")
+        if cut_over:
+            self.cut_over()
+        else:
+            logger.info(f"Re-embed job {self.id}: run it again without --no-cutover to promote '{self.target_version}'.")
+        return True
+
+    def cut_over(self):
+        """Promotes the fully synced target version and closes the job."""
+        if settings.VECTOR_BACKEND == "flat":
+            from scripts.build_flat_index import build_flat_index
+            build_flat_index(version=self.target_version)
+        # Near-duplicate signatures are computed from text and carry over unchanged.
+        copy_near_duplicate_entries(self.source_version, self.target_version)
+        # Running API workers pick this up through their file watch or POST /api/admin/kb/reload.
+        kb_versions.write_active_version(
+            self.target_version, embedding_model=self.embedding_model, reembedded_from=self.source_version
+        )
+        # Sources written to the old version between the last check and the switch.
+        _, changed, removed = self.pending()
+        if changed or removed:
+            self.sync_sources(changed + removed)
+        update_reembed_job(self.id, status='completed')
+        logger.info(f"Re-embed job {self.id} completed: queries now use '{self.target_version}' ({self.embedding_model}).")
+
+def start_job(embedding_model: str) -> dict:
+    """Starts a re-embed job copying the active version to a new version for `embedding_model`, or returns the running one."""
+    source_version = vector_store_service.active_version
+    for job in get_running_reembed_jobs():
+        if job['source_version'] == source_version and job['embedding_model'] == embedding_model:
+            logger.info(f"Resuming running re-embed job {job['id']} for {embedding_model}.")
+            return job
+    if vector_store_service.embedding_model_for(source_version) == embedding_model:
+        raise ValueError(f"The active version '{source_version}' is already embedded with {embedding_model}.")
+    target_version = kb_versions.new_version_name(embedding_model)
+    vector_store_service.create_version(target_version, embedding_model)
+    job_id = create_reembed_job(source_version, target_version, embedding_model)
+    return next(job for job in get_running_reembed_jobs() if job['id'] == job_id)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Re-embed the active knowledge base with another embedding model in the background, "
+                    "then switch queries to it once every source is covered."
+    )
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument("--model", help="Embedding model to re-embed with. Starts a job, or resumes the running one for this model.")
+    action.add_argument("--resume", action="store_true", help="Continue the running re-embed jobs.")
+    action.add_argument("--status", action="store_true", help="Print the coverage of the running re-embed jobs.")
+    action.add_argument("--cancel", action="store_true", help="Cancel the running re-embed jobs. Their target versions are left to --gc.")
+    parser.add_argument("--batch-sources", type=int, default=settings.REEMBED_BATCH_SOURCES, help="Sources re-embedded per batch.")
+    parser.add_argument("--pause", type=float, default=settings.REEMBED_PAUSE_SECONDS, help="Seconds to sleep between batches.")
+    parser.add_argument("--embed-workers", type=int, default=settings.EMBEDDING_WORKERS, help="Encode processes for the new model.")
+    parser.add_argument("--no-cutover", action="store_true", help="Stop at full coverage instead of promoting the new version.")
+    args = parser.parse_args()
+
+    setup_database()
+    if args.model:
+        jobs = [start_job(args.model)]
+    else:
+        jobs = get_running_reembed_jobs()
+        if not jobs:
+            logger.info("No running re-embed jobs.")
+            return
+
+    if args.status:
+        print(json.dumps([ReembedJob(job).coverage() for job in jobs], indent=2))
+        return
+    if args.cancel:
+        for job in jobs:
+            update_reembed_job(job['id'], status='cancelled')
+            logger.info(f"Cancelled re-embed job {job['id']} ('{job['target_version']}').")
+        return
+
+    for job in jobs:
+        with vector_store_service.bulk_embedding(args.embed_workers, job['embedding_model']) as embeddings:
+            ReembedJob(job, embeddings).run(args.batch_sources, args.pause, cut_over=not args.no_cutover)
+
+if __name__ == "__main__":
+    main()
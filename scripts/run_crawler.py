@@ -1,71 +1,78 @@
+import argparse
+import asyncio
 import logging
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service as ChromeService
-from webdriver_manager.chrome import ChromeDriverManager
+from concurrent.futures import ThreadPoolExecutor
 
 from insucompass.config import settings
-from insucompass.services.database import setup_database, initialize_crawl_jobs
+from insucompass.services.database import setup_database, initialize_crawl_jobs, reset_crawl_frontier
+from scripts.data_processing.async_crawler import crawl_jobs
 from scripts.data_processing.crawler import crawl_with_requests, crawl_with_selenium
+from scripts.data_processing.selenium_pool import SeleniumPool
 
 # Configure logging
 logging.basicConfig(level=settings.LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def setup_selenium_driver():
-    """Initializes a headless Chrome WebDriver."""
-    logger.info("Setting up Selenium WebDriver...")
-    try:
-        options = webdriver.ChromeOptions()
-        options.add_argument("--headless")
-        options.add_argument("--no-sandbox")
-        options.add_argument("--disable-dev-shm-usage")
-        options.add_argument("--disable-gpu")
-        options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36")
-        # This will handle SSL certificate issues often seen with government sites
-        options.add_argument('--ignore-certificate-errors')
-        
-        driver = webdriver.Chrome(service=ChromeService(ChromeDriverManager().install()), options=options)
-        logger.info("WebDriver setup complete.")
-        return driver
-    except Exception as e:
-        logger.error(f"Failed to setup Selenium driver: {e}")
-        return None
+def run_job(job: dict, pool: SeleniumPool):
+    """Runs one crawl job with the requests or Selenium crawler."""
+    logger.info(f"--- Processing job: {job['name']} ---")
+    if job['method'] == 'selenium_crawl':
+        crawl_with_selenium(pool, job)
+    elif job['method'] == 'requests_crawl':
+        crawl_with_requests(job)
+    else:
+        logger.warning(f"Method '{job['method']}' not implemented for job {job['name']}. Skipping.")
+
+async def run_jobs_async(jobs: list, pool: SeleniumPool):
+    """
+    Crawls all requests_crawl jobs in parallel on the async engine while each
+    remaining (Selenium) job runs in its own thread, all sharing the driver pool.
+    """
+    async_jobs = [job for job in jobs if job['method'] == 'requests_crawl']
+    other_jobs = [job for job in jobs if job['method'] != 'requests_crawl']
+
+    logger.info(f"--- Crawling {len(async_jobs)} jobs concurrently: {', '.join(job['name'] for job in async_jobs)} ---")
+    loop = asyncio.get_running_loop()
+    # Selenium jobs block their thread for the whole crawl, so they get their own executor
+    # instead of holding the default one the async crawler's to_thread calls run on.
+    with ThreadPoolExecutor(max_workers=max(1, len(other_jobs)), thread_name_prefix="selenium-job") as executor:
+        stats, *_ = await asyncio.gather(
+            crawl_jobs(async_jobs), *(loop.run_in_executor(executor, run_job, job, pool) for job in other_jobs)
+        )
+    logger.info(f"Async crawl finished: {stats}")
 
 def main():
     """Main function to run the data crawling jobs."""
+    parser = argparse.ArgumentParser(description="Crawl the configured data sources.")
+    parser.add_argument(
+        "--restart", action="store_true",
+        help="Discard unfinished crawls instead of resuming them; every job starts over from its start URL."
+    )
+    args = parser.parse_args()
+
     logger.info("--- Starting InsuCompass AI Data Acquisition ---")
     
     # Setup DB and initialize starting URLs
     setup_database()
     initialize_crawl_jobs()
 
-    driver = None
-    try:
-        # Initialize Selenium driver only if needed
-        if any(job.get('method') == 'selenium_crawl' and job.get('status') == 'active' for job in settings.CRAWLING_JOBS):
-            driver = setup_selenium_driver()
-
+    # Drivers are only started once a page needs a browser.
+    with SeleniumPool() as pool:
+        active_jobs = []
         for job in settings.CRAWLING_JOBS:
             if job.get('status') != 'active':
                 logger.info(f"--- Skipping inactive job: {job['name']} ---")
                 continue
-            
-            logger.info(f"--- Processing job: {job['name']} ---")
-            if job['method'] == 'selenium_crawl':
-                if driver:
-                    crawl_with_selenium(driver, job)
-                else:
-                    logger.error(f"Selenium method required for {job['name']} but driver failed to initialize. Skipping.")
-            elif job['method'] == 'requests_crawl':
-                crawl_with_requests(job)
-            else:
-                logger.warning(f"Method '{job['method']}' not implemented for job {job['name']}. Skipping.")
-    
-    finally:
-        if driver:
-            driver.quit()
-            logger.info("Selenium WebDriver closed.")
-    
+            active_jobs.append(job)
+            if args.restart:
+                reset_crawl_frontier(job['name'])
+
+        if settings.CRAWLER_ENGINE == "async":
+            asyncio.run(run_jobs_async(active_jobs, pool))
+        else:
+            for job in active_jobs:
+                run_job(job, pool)
+
     logger.info("--- Data Acquisition Process Finished ---")
 
 if __name__ == "__main__":
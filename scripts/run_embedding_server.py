@@ -0,0 +1,31 @@
+import argparse
+import asyncio
+import logging
+
+from insucompass.config import settings
+from insucompass.services.embedding_server import EmbeddingServer
+
+# Configure logging
+logging.basicConfig(level=settings.LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def main():
+    """
+    Runs the node-local embedding server. Start it before the API workers and
+    set EMBEDDING_SERVER_SOCKET to the same path so they share one model copy.
+    """
+    parser = argparse.ArgumentParser(description="Run the shared embedding server.")
+    parser.add_argument("--socket", default=settings.EMBEDDING_SERVER_SOCKET or "/tmp/insucompass_embeddings.sock")
+    parser.add_argument("--model", default=settings.EMBEDDING_MODEL_NAME)
+    parser.add_argument("--window-ms", type=float, default=settings.EMBEDDING_BATCH_WINDOW_MS, help="How long to collect concurrent requests into one batch.")
+    parser.add_argument("--max-batch", type=int, default=settings.EMBEDDING_MAX_BATCH, help="Encode as soon as this many texts are queued.")
+    args = parser.parse_args()
+
+    server = EmbeddingServer(args.socket, args.model, args.window_ms, args.max_batch)
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        logger.info(f"Embedding server stopped after {server.batches} batches / {server.texts_encoded} texts.")
+
+if __name__ == "__main__":
+    main()
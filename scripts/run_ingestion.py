@@ -1,74 +1,306 @@
+import argparse
 import logging
 import json
-from insucompass.services.database import get_db_connection
-from insucompass.services.vector_store import vector_store_service
-from scripts.data_processing.document_loader import load_document
-from scripts.data_processing.chunker import chunk_text
+import os
+from collections import defaultdict
+from typing import List, Optional, Union
+from langchain_core.documents import Document
+from insucompass.services.database import (
+    get_db_connection, get_linked_vector_ids, get_source_chunks, setup_database,
+    start_ingestion_run, get_resumable_run, get_unfinished_journal_entries, set_journal_stage,
+    finish_ingestion_run, get_vector_ids_with_rows, get_running_reembed_jobs, release_duplicates_of
+)
+from insucompass.services.vector_store import content_addressed_ids, vector_store_service
+from insucompass.services import kb_versions
+from insucompass.services.chunk_store import INSERT_CHUNK_QUERY, chunk_row, row_metadata, set_source_chunk_count
+from insucompass.services.embedding_cache import CachedEmbeddings
+from scripts.data_processing.crawler_utils import get_content_hash
+from scripts.data_processing.ingestion_pipeline import IngestionPipeline, load_and_chunk_source
+from scripts.data_processing.near_duplicates import NearDuplicateIndex
+from scripts.reembed import ReembedJob
 from insucompass.config import settings
 
 # Configure logging
 logging.basicConfig(level=settings.LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def process_source_for_ingestion(source: dict):
+def mark_source_status(source: dict, status: str, run_id: Optional[int] = None, staging: bool = False):
     """
-    Loads, chunks, and embeds a single data source.
+    Records a source's ingestion status and, within a run, closes its journal entry.
+    A staging build (one not written to the served version) only records it in the
+    journal; data_sources takes it when the version is promoted.
     """
-    source_id = source['id']
-    local_path = source['local_path']
-    
-    logger.info(f"Starting ingestion for source_id: {source_id}, path: {local_path}")
-    
-    # 1. Load document content
-    text_content = load_document(local_path)
-    if not text_content:
-        logger.error(f"Could not load content from {local_path}. Skipping ingestion for this source.")
-        # Update status in DB to 'ingestion_failed'
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        if not staging:
+            cursor.execute("UPDATE data_sources SET status = ? WHERE id = ?", (status, source['id']))
+        if run_id is not None:
+            set_journal_stage(
+                run_id, source['id'], 'duplicate' if status == 'duplicate' else 'failed', cursor=cursor, outcome={'status': status}
+            )
+        conn.commit()
+
+def diff_source_chunks(source: dict, documents: List[Document], kb_version: str) -> List[Optional[str]]:
+    """
+    Matches freshly chunked documents against the chunks already stored for the source.
+
+    Returns:
+        For each document, the vector ID of a stored chunk with identical text, or None
+        if the chunk is new or changed and has to be embedded.
+    """
+    available = defaultdict(list)
+    for row in get_source_chunks(source['id'], kb_versions.db_version_for(kb_version)):
+        if row['is_duplicate']:
+            continue
+        chunk_hash = row['chunk_hash'] or get_content_hash(row['chunk_text'].encode('utf-8'))
+        available[chunk_hash].append(row['vector_id'])
+    return [
+        available[doc.metadata['chunk_hash']].pop() if available.get(doc.metadata['chunk_hash']) else None
+        for doc in documents
+    ]
+
+def delete_stale_vectors(source_id: int, stale: List[dict], kb_version: str, near_duplicates: Optional[NearDuplicateIndex] = None):
+    """
+    Deletes the vectors of a source's stale chunk rows from the vector store and the
+    near-duplicate index. The rows themselves are left to the caller's transaction.
+    """
+    stale_vectors = [row['vector_id'] for row in stale if row['vector_id'] and not row['is_duplicate']]
+    # Vectors that other sources' duplicate chunks point to stay in the vector store.
+    still_linked = get_linked_vector_ids(stale_vectors, source_id) if stale_vectors else set()
+    removed = [v for v in stale_vectors if v not in still_linked]
+    vector_store_service.delete_documents(removed, version=kb_version)
+    if near_duplicates is not None:
+        near_duplicates.forget_chunks(removed)
+
+def plan_source_chunks(
+    source: dict,
+    documents: List[Document],
+    kb_version: str,
+    near_duplicates: Optional[NearDuplicateIndex] = None,
+    run_id: Optional[int] = None,
+    staging: bool = False
+) -> Union[List[Optional[str]], str]:
+    """
+    Decides, before embedding, which chunks of a source can be served by an existing vector.
+    A source judged a duplicate loses the chunks it had in the version, and sources
+    that were duplicates of it are released to be checked again. For a staging build,
+    the source a duplicate repeats is recorded in the run's journal only.
+
+    Returns:
+        'duplicate' if the whole document nearly duplicates an already ingested source.
+        Otherwise, per chunk, the vector ID to reuse (the source's own unchanged chunk or
+        a near-duplicate chunk of another source), or None if it has to be embedded.
+    """
+    reused = diff_source_chunks(source, documents, kb_version)
+    if near_duplicates is None:
+        return reused
+
+    keys = [vector_id or content_id for vector_id, content_id in zip(reused, content_addressed_ids(documents))]
+    duplicate_of, links = near_duplicates.check_source(
+        source['id'], keys, [doc.page_content for doc in documents], [vector_id is None for vector_id in reused]
+    )
+    if duplicate_of is not None:
+        logger.info(f"Source_id {source['id']} nearly duplicates source_id {duplicate_of}. Skipping it.")
+        existing = get_source_chunks(source['id'], kb_versions.db_version_for(kb_version))
+        delete_stale_vectors(source['id'], existing, kb_version, near_duplicates)
+        near_duplicates.forget_document(source['id'])
         with get_db_connection() as conn:
-            conn.cursor().execute("UPDATE data_sources SET status = ? WHERE id = ?", ('ingestion_failed', source_id))
+            cursor = conn.cursor()
+            cursor.executemany("DELETE FROM knowledge_chunks WHERE id = ?", [(row['id'],) for row in existing])
+            if staging:
+                set_journal_stage(run_id, source['id'], 'pending', cursor=cursor, outcome={'duplicate_of': duplicate_of})
+            else:
+                cursor.execute(
+                    "UPDATE data_sources SET duplicate_of = ?, ingested_hash = NULL, total_chunks = 0 WHERE id = ?",
+                    (duplicate_of, source['id'])
+                )
+                release_duplicates_of(source['id'], cursor=cursor)
             conn.commit()
+        return 'duplicate'
+    return [vector_id or link for vector_id, link in zip(reused, links)]
+
+def write_source_chunks(
+    source: dict,
+    documents: List[Document],
+    embeddings: List[Optional[List[float]]],
+    reused_ids: List[Optional[str]],
+    kb_version: str,
+    near_duplicates: Optional[NearDuplicateIndex] = None,
+    run_id: Optional[int] = None,
+    staging: bool = False
+):
+    """
+    Writes one source's chunks to the vector store and SQLite, then marks it ingested.
+    A staging build records the source's chunk count and ingested hash in the run's
+    journal instead of data_sources, which describe the served version.
+
+    Within an ingestion run, the vector IDs about to be written are journaled first
+    and the journal entry is closed in the same transaction as the SQLite rows, so a
+    crash in between leaves a record of exactly which vectors may be orphaned.
+
+    New and changed chunks are added with their embeddings, reused chunks only get
+    their metadata refreshed, near-duplicates of other sources' chunks are stored as
+    rows linked to that chunk's vector, and stored chunks that no longer exist are deleted.
+    """
+    source_id = source['id']
+    db_version = kb_versions.db_version_for(kb_version)
+    existing = get_source_chunks(source_id, db_version)
+    own_vector_ids = {row['vector_id'] for row in existing if not row['is_duplicate']}
+
+    new_positions = [i for i, vector_id in enumerate(reused_ids) if vector_id is None]
+    # IDs are derived from the whole document list so repeated chunk texts keep distinct, stable IDs.
+    content_ids = content_addressed_ids(documents)
+    if run_id is not None:
+        set_journal_stage(run_id, source_id, 'writing', pending_vector_ids=[content_ids[i] for i in new_positions])
+    new_ids = vector_store_service.add_embedded_documents(
+        [documents[i] for i in new_positions],
+        [embeddings[i] for i in new_positions],
+        version=kb_version,
+        ids=[content_ids[i] for i in new_positions]
+    ) if new_positions else []
+    if len(new_ids) != len(new_positions):
+        logger.error(f"Mismatch between number of documents ({len(new_positions)}) and returned vector IDs ({len(new_ids)}). Aborting DB update for this source.")
         return
 
-    # 2. Chunk the text with metadata
-    documents = chunk_text(text_content, source_metadata=source)
+    vector_ids = list(reused_ids)
+    for i, vector_id in zip(new_positions, new_ids):
+        vector_ids[i] = vector_id
+
+    reused = [(doc, vector_id) for doc, vector_id in zip(documents, reused_ids) if vector_id in own_vector_ids]
+    linked_positions = [i for i, vector_id in enumerate(reused_ids) if vector_id is not None and vector_id not in own_vector_ids]
+    vector_store_service.update_metadatas(
+        [vector_id for _, vector_id in reused], [doc.metadata for doc, _ in reused], version=kb_version
+    )
+
+    linked_set = set(linked_positions)
+    kept = {vector_ids[i] for i in range(len(documents)) if i not in linked_set}
+    stale = [row for row in existing if row['is_duplicate'] or row['vector_id'] not in kept]
+    delete_stale_vectors(source_id, stale, kb_version, near_duplicates)
+
+    # Store chunk info and vector IDs in SQLite
+    logger.info(
+        f"Storing {len(new_positions)} new, {len(reused)} reused and {len(linked_positions)} near-duplicate chunk records "
+        f"in the database, removing {len(stale)} stale ones..."
+    )
+    # Source-level fields (URL, name, path, chunk count) are stored once on the data_sources row.
+    chunk_data_to_insert = [
+        chunk_row(source_id, documents[i], vector_ids[i], db_version, is_duplicate=i in linked_set)
+        for i in sorted(new_positions + linked_positions)
+    ]
+    update_query = "UPDATE knowledge_chunks SET metadata_json = ?, chunk_number = ?, chunk_hash = ? WHERE vector_id = ? AND source_id = ? AND kb_version IS ?"
+    chunk_data_to_update = [
+        (json.dumps(row_metadata(doc.metadata)), doc.metadata.get('chunk_number'), doc.metadata.get('chunk_hash'), vector_id, source_id, db_version)
+        for doc, vector_id in reused
+    ]
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany("DELETE FROM knowledge_chunks WHERE id = ?", [(row['id'],) for row in stale])
+        cursor.executemany(update_query, chunk_data_to_update)
+        cursor.executemany(INSERT_CHUNK_QUERY, chunk_data_to_insert)
+        if not staging:
+            set_source_chunk_count(source_id, len(documents), cursor=cursor)
+            # Update the source status to 'ingested' and remember which content was ingested
+            cursor.execute(
+                "UPDATE data_sources SET status = ?, ingested_hash = ?, duplicate_of = NULL WHERE id = ?",
+                ('ingested', source.get('content_hash'), source_id)
+            )
+            # Sources that nearly duplicated the old content are checked against the new one.
+            release_duplicates_of(source_id, cursor=cursor)
+        if run_id is not None:
+            set_journal_stage(run_id, source_id, 'done', cursor=cursor, outcome={
+                'status': 'ingested', 'ingested_hash': source.get('content_hash'), 'total_chunks': len(documents)
+            })
+        conn.commit()
+    logger.info(f"Successfully ingested source_id: {source_id}")
+
+def process_source_for_ingestion(source: dict, kb_version: Optional[str] = None):
+    """
+    Loads, chunks, and embeds a single data source in the current process.
+
+    Args:
+        source: The data_sources row as a dict.
+        kb_version: The knowledge base version to write to. Defaults to the active version.
+    """
+    kb_version = kb_version or vector_store_service.active_version
+    logger.info(f"Starting ingestion for source_id: {source['id']}, path: {source['local_path']}")
+
+    documents, failure, _ = load_and_chunk_source(source)
+    if failure:
+        mark_source_status(source, failure)
+        return
     if not documents:
-        logger.warning(f"No chunks were created for source_id: {source_id}. Skipping embedding.")
+        logger.warning(f"No chunks were created for source_id: {source['id']}. Skipping embedding.")
         return
 
-    # 3. Add documents to the vector store
+    reused_ids = diff_source_chunks(source, documents, kb_version)
+    texts = [doc.page_content for doc, vector_id in zip(documents, reused_ids) if vector_id is None]
     try:
-        vector_ids = vector_store_service.add_documents(documents)
+        encoder = vector_store_service.document_encoder(vector_store_service.embedding_model_for(kb_version))
+        new_embeddings = iter(encoder.embed_documents(texts) if texts else [])
     except Exception as e:
-        logger.error(f"Failed to embed documents for source_id {source_id}: {e}")
+        logger.error(f"Failed to embed documents for source_id {source['id']}: {e}")
+        mark_source_status(source, 'embedding_failed')
+        return
+    embeddings = [next(new_embeddings) if vector_id is None else None for vector_id in reused_ids]
+    write_source_chunks(source, documents, embeddings, reused_ids, kb_version)
+
+def skip_unchanged_sources(sources: List[dict]) -> List[dict]:
+    """
+    Marks sources whose content hash equals the last ingested hash as ingested again
+    and returns only the sources that actually changed.
+    """
+    unchanged = [s for s in sources if s.get('content_hash') and s['content_hash'] == s.get('ingested_hash')]
+    if unchanged:
         with get_db_connection() as conn:
-            conn.cursor().execute("UPDATE data_sources SET status = ? WHERE id = ?", ('embedding_failed', source_id))
+            conn.cursor().executemany(
+                "UPDATE data_sources SET status = 'ingested' WHERE id = ?", [(s['id'],) for s in unchanged]
+            )
             conn.commit()
-        return
+        logger.info(f"Skipped {len(unchanged)} sources whose content is unchanged since the last ingestion.")
+    unchanged_ids = {s['id'] for s in unchanged}
+    return [s for s in sources if s['id'] not in unchanged_ids]
 
-    if len(vector_ids) != len(documents):
-        logger.error(f"Mismatch between number of documents ({len(documents)}) and returned vector IDs ({len(vector_ids)}). Aborting DB update for this source.")
-        return
 
-    # 4. Store chunk info and vector IDs in SQLite
-    logger.info(f"Storing {len(documents)} chunk records in the database...")
-    insert_query = "INSERT INTO knowledge_chunks (source_id, chunk_text, metadata_json, vector_id) VALUES (?, ?, ?, ?)"
-    chunk_data_to_insert = [
-        (
-            source_id,
-            doc.page_content,
-            json.dumps(doc.metadata),
-            vec_id
-        ) for doc, vec_id in zip(documents, vector_ids)
+def recover_interrupted_writes(entries: List[dict], kb_version: str) -> int:
+    """
+    Deletes vectors that an interrupted run wrote to the vector store without the
+    matching knowledge_chunks rows being committed.
+
+    Returns:
+        The number of orphaned vectors removed.
+    """
+    pending = [
+        vector_id
+        for entry in entries if entry['stage'] == 'writing' and entry['pending_vector_ids']
+        for vector_id in json.loads(entry['pending_vector_ids'])
     ]
-    
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.executemany(insert_query, chunk_data_to_insert)
-        # Update the source status to 'ingested'
-        cursor.execute("UPDATE data_sources SET status = ? WHERE id = ?", ('ingested', source_id))
-        conn.commit()
-    logger.info(f"Successfully ingested source_id: {source_id}")
+    if not pending:
+        return 0
+    with_rows = get_vector_ids_with_rows(pending, kb_versions.db_version_for(kb_version))
+    orphans = [vector_id for vector_id in pending if vector_id not in with_rows]
+    vector_store_service.delete_documents(orphans, version=kb_version)
+    logger.info(f"Removed {len(orphans)} orphaned vectors left by the interrupted run.")
+    return len(orphans)
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the InsuCompass AI data ingestion pipeline.")
+    parser.add_argument(
+        "--rebuild", action="store_true",
+        help="Re-ingest every downloaded source into a new, versioned staging collection "
+             "while the API keeps serving the active version."
+    )
+    parser.add_argument("--promote", action="store_true", help="With --rebuild, make the new version active once it is complete.")
+    parser.add_argument("--gc", action="store_true", help="Delete old knowledge base versions, keeping KB_VERSIONS_TO_KEEP.")
+    parser.add_argument("--resume", action="store_true", help="Resume the last interrupted ingestion run where it stopped.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Processes used to load and chunk documents.")
+    parser.add_argument("--batch-size", type=int, default=256, help="Minimum number of chunks per embedding batch.")
+    parser.add_argument("--queue-size", type=int, default=64, help="Maximum sources buffered between pipeline stages.")
+    parser.add_argument(
+        "--embed-workers", type=int, default=settings.EMBEDDING_WORKERS,
+        help="Processes used to encode embeddings. 0 or 1 encodes in the ingestion process."
+    )
+    return parser.parse_args()
 
 def main():
     """
@@ -76,31 +308,112 @@ def main():
     It finds all downloaded documents that haven't been ingested yet
     and processes them.
     """
+    args = parse_args()
     logger.info("--- Starting InsuCompass AI Data Ingestion Pipeline ---")
-    
-    # Find sources that have been downloaded but not yet ingested
-    # Statuses 'processed' and 'updated' are from the crawler step.
-    query = "SELECT * FROM data_sources WHERE status IN ('processed', 'updated') AND local_path IS NOT NULL"
-    
-    with get_db_connection() as conn:
-        sources_to_ingest = conn.cursor().execute(query).fetchall()
+    setup_database()
+
+    if args.resume:
+        run = get_resumable_run()
+        if run is None:
+            logger.info("No interrupted ingestion run to resume.")
+            return
+        run_id, target_version = run['id'], run['kb_version']
+        args.rebuild = run['mode'] == 'rebuild'
+        entries = get_unfinished_journal_entries(run_id)
+        logger.info(f"Resuming ingestion run {run_id} (version '{target_version}'): {len(entries)} of {run['sources_total']} sources left.")
+        recover_interrupted_writes(entries, target_version)
+        source_ids = [entry['source_id'] for entry in entries]
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            sources_to_ingest = []
+            for start in range(0, len(source_ids), 500):
+                batch = source_ids[start:start + 500]
+                cursor.execute(f"SELECT * FROM data_sources WHERE id IN ({','.join('?' * len(batch))})", batch)
+                sources_to_ingest.extend(dict(row) for row in cursor.fetchall())
+    else:
+        if args.rebuild:
+            # Build into a fresh version; queries keep using the active one until promotion.
+            target_version = kb_versions.new_version_name(settings.EMBEDDING_MODEL_NAME)
+            vector_store_service.create_version(target_version, settings.EMBEDDING_MODEL_NAME)
+            logger.info(f"Rebuilding the knowledge base into staging version '{target_version}' with {settings.EMBEDDING_MODEL_NAME}.")
+            query = "SELECT * FROM data_sources WHERE status IN ('processed', 'updated', 'ingested', 'duplicate') AND local_path IS NOT NULL"
+        else:
+            target_version = vector_store_service.active_version
+            # Find sources that have been downloaded but not yet ingested
+            # Statuses 'processed' and 'updated' are from the crawler step.
+            query = "SELECT * FROM data_sources WHERE status IN ('processed', 'updated') AND local_path IS NOT NULL"
+
+        with get_db_connection() as conn:
+            sources_to_ingest = [dict(row) for row in conn.cursor().execute(query).fetchall()]
+        if not args.rebuild:
+            sources_to_ingest = skip_unchanged_sources(sources_to_ingest)
+        run_id = start_ingestion_run(
+            target_version, 'rebuild' if args.rebuild else 'incremental', [source['id'] for source in sources_to_ingest]
+        ) if sources_to_ingest else None
 
     if not sources_to_ingest:
         logger.info("No new or updated sources to ingest. Pipeline finished.")
-        return
+        if run_id is not None:
+            finish_ingestion_run(run_id, 'completed')
+    else:
+        logger.info(f"Found {len(sources_to_ingest)} sources to ingest.")
+
+    if sources_to_ingest:
+        near_duplicates = NearDuplicateIndex(target_version, settings.NEAR_DUPLICATE_THRESHOLD) if settings.NEAR_DUPLICATE_THRESHOLD > 0 else None
+        # Re-embed jobs copying the target version to another model get each written source as well.
+        dual_writes = [ReembedJob(job) for job in get_running_reembed_jobs() if job['source_version'] == target_version]
+
+        def write_fn(source, documents, embeddings, reused_ids):
+            write_source_chunks(source, documents, embeddings, reused_ids, target_version, near_duplicates, run_id, staging=args.rebuild)
+            for job in dual_writes:
+                job.sync_sources([source['id']])
+
+        embedding_model = vector_store_service.embedding_model_for(target_version)
+        with vector_store_service.bulk_embedding(args.embed_workers, embedding_model) as embeddings:
+            pipeline = IngestionPipeline(
+                embed_fn=embeddings.embed_documents,
+                write_fn=write_fn,
+                fail_fn=lambda source, status: mark_source_status(source, status, run_id, staging=args.rebuild),
+                diff_fn=lambda source, documents: plan_source_chunks(source, documents, target_version, near_duplicates, run_id, staging=args.rebuild),
+                workers=args.workers,
+                # Give every encode worker a full batch of its own per embed call.
+                batch_size=args.batch_size * max(1, args.embed_workers),
+                queue_size=args.queue_size,
+                pdf_pages_per_task=settings.PDF_PAGES_PER_TASK,
+            )
+            try:
+                report = pipeline.run(sources_to_ingest)
+            except BaseException:
+                finish_ingestion_run(run_id, 'failed')
+                logger.error(f"Ingestion run {run_id} stopped. Continue it with --resume.")
+                raise
+        finish_ingestion_run(run_id, 'completed')
+        cache = embeddings
+        if isinstance(cache, CachedEmbeddings) and cache.hits + cache.misses:
+            logger.info(f"Embedding cache: {cache.hits} hits, {cache.misses} chunks encoded ({cache.hits / (cache.hits + cache.misses):.0%} hit rate).")
+        if near_duplicates is not None:
+            embed = next(stage for stage in report if stage["stage"] == "embed")
+            seconds_per_chunk = embed["busy_s"] / embed["chunks"] if embed["chunks"] else 0.0
+            logger.info(f"Near-duplicate report: {json.dumps(near_duplicates.report(seconds_per_chunk))}")
+
+    if args.rebuild:
+        if settings.VECTOR_BACKEND == "flat":
+            from scripts.build_flat_index import build_flat_index
+            build_flat_index(version=target_version)
+        if args.promote:
+            # Running API workers pick this up through their file watch or POST /api/admin/kb/reload.
+            try:
+                kb_versions.promote_version(target_version)
+            except ValueError as e:
+                logger.error(f"Not promoting staging version '{target_version}': {e}")
+        else:
+            logger.info(f"Staging version '{target_version}' is ready. Promote it with POST /api/admin/kb/activate.")
 
-    logger.info(f"Found {len(sources_to_ingest)} sources to ingest.")
-    
-    for source_row in sources_to_ingest:
-        try:
-            process_source_for_ingestion(dict(source_row))
-        except Exception as e:
-            logger.error(f"A critical error occurred while processing source_id {source_row['id']}: {e}", exc_info=True)
-            with get_db_connection() as conn:
-                conn.cursor().execute("UPDATE data_sources SET status = ? WHERE id = ?", ('ingestion_failed', source_row['id']))
-                conn.commit()
+    if args.gc:
+        deleted = kb_versions.garbage_collect(vector_store_service.client)
+        logger.info(f"Garbage-collected knowledge base versions: {deleted or 'none'}")
 
     logger.info("--- Data Ingestion Pipeline Finished ---")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
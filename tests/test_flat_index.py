@@ -0,0 +1,53 @@
+import numpy as np
+
+from insucompass.services.flat_index import FlatVectorIndex
+
+def _metadata(n):
+    return [{"source_id": 1, "chunk_number": i} for i in range(n)]
+
+def test_add_replaces_an_id_of_the_mapped_base(tmp_path):
+    index = FlatVectorIndex.build(tmp_path / "index", ["x", "y"], np.eye(2, dtype=np.float32), ["old x", "y"], _metadata(2))
+    index.add(["x"], [[1.0, 1.0]], ["new x"], _metadata(1))
+
+    hits = index.search([[1.0, 0.0]], k=5)[0]
+    ids = [document.id for document, _ in hits]
+    assert sorted(ids) == ["x", "y"]
+    x_document, x_score = hits[ids.index("x")]
+    assert x_document.page_content == "new x"
+    assert np.isclose(x_score, np.sqrt(0.5))
+    index.close()
+
+def test_add_replaces_an_id_of_the_delta(tmp_path):
+    index = FlatVectorIndex.build(tmp_path / "index", ["y"], np.array([[0.0, 1.0]], dtype=np.float32), ["y"], _metadata(1))
+    index.add(["x", "x"], [[1.0, 0.0], [0.0, 1.0]], ["first", "second"], _metadata(2))
+    index.add(["x"], [[1.0, 1.0]], ["third"], _metadata(1))
+
+    hits = index.search([[1.0, 0.0]], k=5)[0]
+    assert [document.id for document, _ in hits].count("x") == 1
+    assert next(document for document, _ in hits if document.id == "x").page_content == "third"
+    index.close()
+
+def test_index_built_from_an_empty_collection_takes_its_dimension_from_the_first_add(tmp_path):
+    index = FlatVectorIndex.build(tmp_path / "index", [], np.zeros((0, 0), dtype=np.float32), [], [])
+    assert index.search([[1.0, 0.0, 0.0, 0.0]], k=3) == [[]]
+
+    index.add(["a", "b"], [[1.0, 0.0, 0.0, 0.0], [0.0, 1.0, 0.0, 0.0]], ["a", "b"], _metadata(2))
+
+    hits = index.search([[1.0, 0.0, 0.0, 0.0]], k=1)[0]
+    assert [document.id for document, _ in hits] == ["a"]
+    assert np.isclose(hits[0][1], 1.0)
+    index.close()
+
+def test_add_finds_base_ids_of_an_index_built_without_the_id_files(tmp_path):
+    index = FlatVectorIndex.build(tmp_path / "index", ["x", "y"], np.eye(2, dtype=np.float32), ["old x", "y"], _metadata(2))
+    index.close()
+    (tmp_path / "index" / "ids.npy").unlink()
+    (tmp_path / "index" / "id_rows.npy").unlink()
+
+    index = FlatVectorIndex(tmp_path / "index")
+    index.add(["y"], [[1.0, 0.0]], ["new y"], _metadata(1))
+
+    hits = index.search([[1.0, 0.0]], k=5)[0]
+    assert [document.page_content for document, _ in hits].count("new y") == 1
+    assert "y" not in [document.page_content for document, _ in hits]
+    index.close()